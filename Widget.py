@@ -21,7 +21,7 @@ class Ui_Form(object):
 "    font-size: 14px;\n"
 "}\n"
 "\n"
-"QTableWidget {\n"
+"QTableView, QTreeView {\n"
 "    background-color: #3c3f41;\n"
 "    color: #ffffff;\n"
 "    gridline-color: #555555;\n"
@@ -64,7 +64,7 @@ class Ui_Form(object):
         self.widget.setGeometry(QtCore.QRect(10, 20, 1131, 101))
         self.widget.setObjectName("widget")
         self.txt_path = QtWidgets.QLineEdit(parent=self.widget)
-        self.txt_path.setGeometry(QtCore.QRect(10, 10, 1111, 32))
+        self.txt_path.setGeometry(QtCore.QRect(10, 10, 951, 32))
         self.txt_path.setReadOnly(True)
         self.txt_path.setObjectName("txt_path")
         self.btn_browse = QtWidgets.QPushButton(parent=self.widget)
@@ -79,6 +79,21 @@ class Ui_Form(object):
         font.setBold(True)
         self.btn_start.setFont(font)
         self.btn_start.setObjectName("btn_start")
+        self.txt_filter = QtWidgets.QLineEdit(parent=self.widget)
+        self.txt_filter.setGeometry(QtCore.QRect(880, 60, 241, 32))
+        self.txt_filter.setObjectName("txt_filter")
+        self.btn_add = QtWidgets.QPushButton(parent=self.widget)
+        self.btn_add.setGeometry(QtCore.QRect(530, 60, 151, 34))
+        self.btn_add.setObjectName("btn_add")
+        self.chk_trash = QtWidgets.QCheckBox(parent=self.widget)
+        self.chk_trash.setGeometry(QtCore.QRect(300, 66, 221, 22))
+        self.chk_trash.setObjectName("chk_trash")
+        self.chk_watch = QtWidgets.QCheckBox(parent=self.widget)
+        self.chk_watch.setGeometry(QtCore.QRect(700, 66, 171, 22))
+        self.chk_watch.setObjectName("chk_watch")
+        self.btn_rules = QtWidgets.QPushButton(parent=self.widget)
+        self.btn_rules.setGeometry(QtCore.QRect(970, 10, 151, 34))
+        self.btn_rules.setObjectName("btn_rules")
         self.progressBar = QtWidgets.QProgressBar(parent=Form)
         self.progressBar.setGeometry(QtCore.QRect(20, 140, 1111, 23))
         self.progressBar.setProperty("value", 0)
@@ -110,6 +125,17 @@ class Ui_Form(object):
         self.btn_hash.setIcon(icon1)
         self.btn_hash.setCheckable(True)
         self.btn_hash.setObjectName("btn_hash")
+        self.btn_link = QtWidgets.QPushButton(parent=self.widget_2)
+        self.btn_link.setGeometry(QtCore.QRect(280, 40, 171, 34))
+        self.btn_link.setObjectName("btn_link")
+        self.cmb_link_mode = QtWidgets.QComboBox(parent=self.widget_2)
+        self.cmb_link_mode.setGeometry(QtCore.QRect(460, 40, 111, 34))
+        self.cmb_link_mode.setObjectName("cmb_link_mode")
+        self.cmb_link_mode.addItem("")
+        self.cmb_link_mode.addItem("")
+        self.btn_report = QtWidgets.QPushButton(parent=self.widget_2)
+        self.btn_report.setGeometry(QtCore.QRect(600, 40, 151, 34))
+        self.btn_report.setObjectName("btn_report")
         self.rbtn_listwidget = QtWidgets.QRadioButton(parent=self.widget_2)
         self.rbtn_listwidget.setGeometry(QtCore.QRect(820, 40, 131, 22))
         self.rbtn_listwidget.setChecked(True)
@@ -122,31 +148,20 @@ class Ui_Form(object):
         self.stackedWidget.setObjectName("stackedWidget")
         self.page = QtWidgets.QWidget()
         self.page.setObjectName("page")
-        self.tbl_results = QtWidgets.QTableWidget(parent=self.page)
+        self.tbl_results = QtWidgets.QTableView(parent=self.page)
         self.tbl_results.setGeometry(QtCore.QRect(0, 0, 1111, 541))
         self.tbl_results.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
         self.tbl_results.setAlternatingRowColors(False)
         self.tbl_results.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.MultiSelection)
         self.tbl_results.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
         self.tbl_results.setObjectName("tbl_results")
-        self.tbl_results.setColumnCount(4)
-        self.tbl_results.setRowCount(0)
-        item = QtWidgets.QTableWidgetItem()
-        self.tbl_results.setHorizontalHeaderItem(0, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tbl_results.setHorizontalHeaderItem(1, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tbl_results.setHorizontalHeaderItem(2, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tbl_results.setHorizontalHeaderItem(3, item)
         self.stackedWidget.addWidget(self.page)
         self.page_2 = QtWidgets.QWidget()
         self.page_2.setObjectName("page_2")
-        self.treeWidget = QtWidgets.QTreeWidget(parent=self.page_2)
-        self.treeWidget.setGeometry(QtCore.QRect(0, 0, 1111, 541))
-        self.treeWidget.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
-        self.treeWidget.setObjectName("treeWidget")
-        self.treeWidget.headerItem().setText(0, "Dosya Adı")
+        self.treeView = QtWidgets.QTreeView(parent=self.page_2)
+        self.treeView.setGeometry(QtCore.QRect(0, 0, 1111, 541))
+        self.treeView.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.treeView.setObjectName("treeView")
         self.stackedWidget.addWidget(self.page_2)
 
         self.retranslateUi(Form)
@@ -158,22 +173,21 @@ class Ui_Form(object):
         self.txt_path.setPlaceholderText(_translate("Form", "Taranacak klasörü seçiniz"))
         self.btn_browse.setText(_translate("Form", "Klasör seç"))
         self.btn_start.setText(_translate("Form", "Taramayı başlat"))
+        self.txt_filter.setPlaceholderText(_translate("Form", "Sonuçlarda ara (dosya adı veya konum)"))
+        self.btn_add.setText(_translate("Form", "Klasör ekle"))
+        self.chk_trash.setText(_translate("Form", "Silinenleri çöpe taşı"))
+        self.chk_watch.setText(_translate("Form", "Değişiklikleri izle"))
+        self.btn_rules.setText(_translate("Form", "Tarama kuralları"))
         self.lbl_status.setText(_translate("Form", "Hazır bekliyor..."))
         self.lbl_stats.setText(_translate("Form", "0 dosya tarandı. 0 kopya bulundu."))
         self.btn_delete.setText(_translate("Form", "Seçilenleri sil!"))
         self.btn_hash.setText(_translate("Form", "Hash Göster"))
+        self.btn_link.setText(_translate("Form", "Bağlantıyla değiştir"))
+        self.cmb_link_mode.setItemText(0, _translate("Form", "Hardlink"))
+        self.cmb_link_mode.setItemText(1, _translate("Form", "Reflink"))
+        self.btn_report.setText(_translate("Form", "Tarama raporu"))
         self.rbtn_listwidget.setText(_translate("Form", "Düz Liste"))
         self.rbtn_treewidget.setText(_translate("Form", "Gruplandırılmış"))
-        item = self.tbl_results.horizontalHeaderItem(0)
-        item.setText(_translate("Form", "Dosya Adı"))
-        item = self.tbl_results.horizontalHeaderItem(1)
-        item.setText(_translate("Form", "Konum"))
-        item = self.tbl_results.horizontalHeaderItem(2)
-        item.setText(_translate("Form", "Boyut"))
-        item = self.tbl_results.horizontalHeaderItem(3)
-        item.setText(_translate("Form", "Hash"))
-        self.treeWidget.headerItem().setText(1, _translate("Form", "Konum"))
-        self.treeWidget.headerItem().setText(2, _translate("Form", "Boyut"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,296 @@
+"""Benchmark Module.
+
+Builds a synthetic folder tree and times the stages of the scan pipeline
+one by one, without the GUI:
+
+    python -m bench --files 20000 --duplicates 0.3 -o run.json
+
+The same seed always builds the same tree, so the JSON output of two
+versions of the code can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from database import DataBase
+from engine import BLOCK_SIZE, ScanEngine
+from hasher import (HashPool, file_hash, empty_hash, ALGORITHMS,
+                    DEFAULT_ALGORITHM, POOL_THREAD, POOL_PROCESS)
+from iosched import IOScheduler
+
+# Ways of drawing file sizes for the synthetic tree
+SIZES_FIXED = "fixed"
+SIZES_UNIFORM = "uniform"
+SIZES_LOGNORMAL = "lognormal"
+
+# Stages timed by the benchmark, in the order they are run
+STAGES = ("enumerate", "hash", "db_insert", "duplicates_query", "full_scan")
+
+
+def draw_size(rng, distribution, mean_size, max_size):
+    """Draw one file size in bytes."""
+    if distribution == SIZES_FIXED:
+        size = mean_size
+    elif distribution == SIZES_UNIFORM:
+        size = rng.randint(0, 2 * mean_size)
+    else:
+        # sigma 1.5 gives many small files and a few large ones
+        size = int(rng.lognormvariate(0, 1.5) * mean_size / 3.08)
+    return min(size, max_size)
+
+
+def generate_tree(root, files=10000, distribution=SIZES_LOGNORMAL,
+                  mean_size=64 * 1024, max_size=64 * 1024 * 1024,
+                  duplicate_ratio=0.25, hardlink_ratio=0.05, depth=4,
+                  fanout=4, seed=0):
+    """
+    Fill root with a reproducible tree of synthetic files.
+
+    Folders are nested depth levels deep with fanout subfolders each, and
+    files are spread over all of them. duplicate_ratio of the files are
+    copies and hardlink_ratio are hard links of an earlier file; the rest
+    have random content of a size drawn from distribution. Returns a dict
+    describing what was written.
+    """
+    rng = random.Random(seed)
+    folders = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(folder, f"d{number}")
+                 for folder in level for number in range(fanout)]
+        folders.extend(level)
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    originals = []
+    stats = {"files": 0, "bytes": 0, "unique": 0, "duplicates": 0,
+             "hardlinks": 0, "folders": len(folders)}
+    for number in range(files):
+        path = os.path.join(rng.choice(folders), f"f{number}.bin")
+        kind = rng.random()
+        if originals and kind < hardlink_ratio:
+            source, size = rng.choice(originals)
+            os.link(source, path)
+            stats["hardlinks"] += 1
+        elif originals and kind < hardlink_ratio + duplicate_ratio:
+            source, size = rng.choice(originals)
+            shutil.copyfile(source, path)
+            stats["duplicates"] += 1
+        else:
+            size = draw_size(rng, distribution, mean_size, max_size)
+            with open(path, "wb") as f:
+                f.write(rng.randbytes(size))
+            originals.append((path, size))
+            stats["unique"] += 1
+        stats["files"] += 1
+        stats["bytes"] += size
+
+    return stats
+
+
+def timed(func):
+    """Run func and return (seconds, result)."""
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def bench_enumerate(root, db_path):
+    """
+    Time the folder walk of the engine, return (seconds, FileInfos).
+
+    The walk is not checkpointed, a scan run does not exist here.
+    """
+    engine = ScanEngine(root, db_path=db_path)
+    engine.db = DataBase(db_path)
+    seconds, infos = timed(lambda: list(engine.walk_files(
+        set(), checkpoint=False)))
+    engine.db.close()
+    return seconds, infos
+
+
+def bench_hash(infos, workers, pool_kind, algorithm):
+    """
+    Time the full hashing of every file, return (seconds, digests).
+
+    The files are read through an iosched.IOScheduler as in a scan, and
+    empty files are not read. Right after the tree is written the files
+    are mostly in the page cache, so this measures the hashing code more
+    than the disk.
+    """
+    empty = empty_hash(algorithm)
+
+    def run():
+        with HashPool(workers, pool_kind) as pool:
+            jobs = ((info, (info.path, BLOCK_SIZE, algorithm)
+                     if info.size else None) for info in infos)
+            return [(info, digest if info.size else empty)
+                    for info, digest in IOScheduler(pool).imap(
+                        file_hash, jobs, lambda info: info)]
+    return timed(run)
+
+
+def bench_db_insert(db, rows):
+    """Time writing the result rows through insert_many."""
+    def run():
+        db.clear()
+        db.insert_many(rows)
+        db.flush()
+    return timed(run)[0]
+
+
+def bench_duplicates_query(db):
+    """Time DataBase.duplicates(), return (seconds, row count)."""
+    seconds, rows = timed(db.duplicates)
+    return seconds, len(rows)
+
+
+def bench_full_scan(root, db_path, workers, pool_kind, algorithm):
+    """
+    Time a complete engine run.
+
+    The hash cache is emptied first, so every file is hashed again.
+    """
+    db = DataBase(db_path)
+    ccon = db.database()
+    ccon.execute("DELETE FROM TBL_CACHE")
+    ccon.commit()
+    db.close()
+    engine = ScanEngine(root, workers=workers, pool_kind=pool_kind,
+                        algorithm=algorithm, db_path=db_path)
+    return timed(engine.run)[0]
+
+
+def run_once(root, db_path, args):
+    """Time every stage once and return {stage: seconds}."""
+    timings = {}
+    timings["enumerate"], infos = bench_enumerate(root, db_path)
+    timings["hash"], digests = bench_hash(infos, args.workers, args.pool,
+                                          args.algorithm)
+
+    rows = [(info.path, os.path.basename(info.path), info.size, digest,
+             None, args.algorithm, info.dev, info.ino, info.root, None,
+             info.mtime_ns)
+            for info, digest in digests]
+    db = DataBase(db_path)
+    timings["db_insert"] = bench_db_insert(db, rows)
+    timings["duplicates_query"], found = bench_duplicates_query(db)
+    db.close()
+
+    timings["full_scan"] = bench_full_scan(root, db_path, args.workers,
+                                           args.pool, args.algorithm)
+    return timings, len(infos), found
+
+
+def code_version():
+    """Return the git commit of the code, or None outside a checkout."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    """Read the command line options."""
+    parser = argparse.ArgumentParser(
+        prog="bench",
+        description="Time the scan stages on a synthetic folder tree.")
+    parser.add_argument("--files", type=int, default=10000,
+                        help="number of files in the tree")
+    parser.add_argument("--sizes", default=SIZES_LOGNORMAL,
+                        choices=[SIZES_FIXED, SIZES_UNIFORM,
+                                 SIZES_LOGNORMAL],
+                        help="file size distribution")
+    parser.add_argument("--mean-size", type=int, default=64 * 1024,
+                        help="typical file size in bytes")
+    parser.add_argument("--max-size", type=int, default=64 * 1024 * 1024,
+                        help="largest file size in bytes")
+    parser.add_argument("--duplicates", type=float, default=0.25,
+                        help="fraction of files that are copies")
+    parser.add_argument("--hardlinks", type=float, default=0.05,
+                        help="fraction of files that are hard links")
+    parser.add_argument("--depth", type=int, default=4,
+                        help="folder nesting depth")
+    parser.add_argument("--fanout", type=int, default=4,
+                        help="subfolders per folder")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed of the tree")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="times every stage is run")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of hashing workers")
+    parser.add_argument("--pool", choices=[POOL_THREAD, POOL_PROCESS],
+                        default=POOL_THREAD, help="kind of worker pool")
+    parser.add_argument("-a", "--algorithm", choices=sorted(ALGORITHMS),
+                        default=DEFAULT_ALGORITHM, help="digest backend")
+    parser.add_argument("--dir", default=None,
+                        help="folder to build the tree in (default: a "
+                             "temporary folder)")
+    parser.add_argument("--keep", action="store_true",
+                        help="do not delete the tree afterwards")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSON output file (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main(argv=None):
+    """Build the tree, run the stages and write the results as JSON."""
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="hashsweep-bench-", dir=args.dir)
+    root = os.path.join(work_dir, "tree")
+    db_path = os.path.join(work_dir, "bench.db")
+
+    try:
+        generate_seconds, tree = timed(lambda: generate_tree(
+            root, args.files, args.sizes, args.mean_size, args.max_size,
+            args.duplicates, args.hardlinks, args.depth, args.fanout,
+            args.seed))
+
+        runs = []
+        for _ in range(args.repeat):
+            timings, listed, found = run_once(root, db_path, args)
+            runs.append(timings)
+            sys.stderr.write(json.dumps(timings) + "\n")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": code_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("dir", "keep", "output")},
+        "tree": dict(tree, generate_seconds=generate_seconds,
+                     listed_files=listed, duplicate_rows=found),
+        "runs": runs,
+        "median": {stage: statistics.median(run[stage] for run in runs)
+                   for stage in STAGES},
+        "best": {stage: min(run[stage] for run in runs)
+                 for stage in STAGES},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
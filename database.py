@@ -1,41 +1,324 @@
 """Database Operations Module."""
+import json
+import os
 import sqlite3
+import threading
+
+# Reasons stored for files that were never hashed
+SKIP_UNIQUE_SIZE = "unique_size"
+SKIP_UNIQUE_SAMPLE = "unique_sample"
+SKIP_ACCESS_DENIED = "access_denied"
+SKIP_READ_ERROR = "read_error"
+SKIP_TOO_SMALL = "too_small"
+SKIP_TOO_LARGE = "too_large"
+SKIP_BAD_NAME = "bad_name"
+
+# Status stored for every scan run
+RUN_RUNNING = "running"
+RUN_COMPLETED = "completed"
+RUN_STOPPED = "stopped"
+
+# Ways of comparing the files of one scan root with another
+CROSS_IN_OTHER = "in_other"
+CROSS_MISSING = "missing"
+CROSS_WITHIN = "within"
+CROSS_MODES = (CROSS_IN_OTHER, CROSS_MISSING, CROSS_WITHIN)
+
+# Columns of the scan_runs table, stages is the JSON of the part counters
+RUN_COLUMNS = ("started", "seconds", "roots", "algorithm", "workers",
+               "pool", "files", "bytes", "duplicates", "errors",
+               "cache_hits", "cache_misses", "status", "stages")
+
+# Identity of the data of a row, hard links to one inode share it
+INODE_KEY = "COALESCE(dev || ':' || ino, path)"
+
+# Hashes that are shared by more than one inode, see DataBase.ensure_groups
+DUPLICATE_HASHES = " SELECT hash FROM dup_groups "
+
+# Summary rows of dup_groups built from TBL_RESULTS; a group wastes the
+# space of all its inodes but one. A group is covered when all its files
+# are inside duplicate folders
+GROUP_SUMMARY = f""" SELECT hash, MAX(size), COUNT(*),
+COUNT(DISTINCT {INODE_KEY}) AS inodes, SUM(size),
+MAX(size) * (COUNT(DISTINCT {INODE_KEY}) - 1), MIN(covered)
+FROM TBL_RESULTS WHERE hash IS NOT NULL """
+
+# The digest of a result row without the "#N" label that verify gives
+# files which only share a digest with their group
+RAW_DIGEST = """ CASE WHEN instr(r.hash, '#') > 0
+THEN substr(r.hash, 1, instr(r.hash, '#') - 1) ELSE r.hash END """
+
+# Folder digests that are shared by more than one folder
+DUPLICATE_DIGESTS = """ SELECT digest FROM TBL_DIRS
+WHERE digest IS NOT NULL GROUP BY digest HAVING COUNT(*) > 1 """
+
+# The files of the scan checkpoint. Folder prefixes are stored once in
+# scan_folders and put back in front of the file names here
+LISTED_FILES = """ SELECT f.prefix || l.name AS path, l.size, l.dev,
+l.ino, l.mtime_ns, l.nlink, f.root FROM scan_listed l
+JOIN scan_folders f ON f.id = l.folder """
+
+# Columns the result views may be sorted by
+FILE_SORT_COLUMNS = ("name", "hash", "path", "size")
+GROUP_SORT_COLUMNS = ("hash", "count", "total_size", "wasted")
+
+
+def stored_path(path):
+    """
+    Return a path as it can be stored in the database.
+
+    SQLite keeps text as UTF-8. os.scandir returns a file name that is
+    not valid UTF-8 with surrogate escapes, which can not be encoded;
+    such a path is stored with its bytes written as \\xNN escapes.
+    Other paths are returned as they are.
+    """
+    try:
+        path.encode("utf-8")
+    except UnicodeEncodeError:
+        return os.fsencode(path).decode("utf-8", "backslashreplace")
+    return path
 
 
 class DataBase:
-    """Sqlite database manager."""
+    """
+    Sqlite database manager.
+
+    Every thread gets its own long-lived connection, so the scanner thread
+    and the GUI thread can use the same DataBase object.
 
-    def __init__(self):
+    The duplicate groups are kept in the dup_groups summary table. It is
+    rebuilt on the next query after new rows were written, and updated
+    for the affected hashes when files are deleted or linked.
+    """
+
+    # Rows buffered by insert_many before they are committed together
+    COMMIT_SIZE = 10000
+
+    # Folder ids remembered while checkpointing a walk, see save_checkpoint
+    FOLDER_IDS = 4096
+
+    def __init__(self, path="./results.db"):
         """To create the database for the first time when the class starts."""
-        self.database()
+        self.path = path
+        self.local = threading.local()
+        self.groups_stale = True
+        self.create_tables()
 
     def database(self):
+        """
+        Return the connection of the calling thread.
+
+        The connection is opened on first use with WAL journaling, so
+        readers do not block the writer, and relaxed syncing.
+        """
+        ccon = getattr(self.local, "ccon", None)
+        if ccon is None:
+            ccon = sqlite3.connect(self.path, timeout=30)
+            ccon.execute("PRAGMA journal_mode=WAL")
+            ccon.execute("PRAGMA synchronous=NORMAL")
+            ccon.execute("PRAGMA temp_store=MEMORY")
+            ccon.execute("PRAGMA cache_size=-65536")
+            self.local.ccon = ccon
+            self.local.pending = []
+            self.local.folder_ids = {}
+        return ccon
+
+    def limit_memory(self, budget):
+        """
+        Keep the connection of this thread within budget bytes.
+
+        Half of the budget goes to the page cache, which also bounds the
+        memory of sorts and groupings; what does not fit is spilled to
+        temporary files instead of being kept in memory.
+        """
+        ccon = self.database()
+        ccon.execute("PRAGMA temp_store=FILE")
+        ccon.execute(f"PRAGMA cache_size=-{max(budget // 2048, 1024)}")
+
+    def close(self):
+        """Flush buffered rows and close the connection of this thread."""
+        ccon = getattr(self.local, "ccon", None)
+        if ccon is not None:
+            self.flush()
+            ccon.close()
+            self.local.ccon = None
+
+    def create_tables(self):
         """
         Initialize the database schema.
 
-        An index is also created for the hash column for performance.
+        Indexes are also created for the hash and path columns for
+        performance.
+        Files that were never hashed have a NULL hash and a skip reason.
         """
-        with sqlite3.connect("./results.db") as ccon:
-            command = ccon.cursor()
-            command.execute(""" CREATE TABLE IF NOT EXISTS TBL_RESULTS
-            (idno INTEGER PRIMARY KEY AUTOINCREMENT,
-            path TEXT, name TEXT, size INT, hash TEXT) """)
-            command.execute(""" CREATE INDEX IF NOT EXISTS indexhash
-            ON TBL_RESULTS (hash) """)
-            return ccon
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" CREATE TABLE IF NOT EXISTS TBL_RESULTS
+        (idno INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT, name TEXT, size INT, hash TEXT, reason TEXT,
+        algo TEXT, verified INT DEFAULT 0, dev INT, ino INT, root TEXT,
+        session INT, covered INT DEFAULT 0, mtime_ns INT) """)
+        self.add_missing_columns(command, "TBL_RESULTS",
+                                 {"reason": "TEXT", "algo": "TEXT",
+                                  "verified": "INT DEFAULT 0",
+                                  "dev": "INT", "ino": "INT",
+                                  "root": "TEXT", "session": "INT",
+                                  "covered": "INT DEFAULT 0",
+                                  "mtime_ns": "INT"})
+        # Covers the GROUP BY hash of dup_groups without reading the rows
+        command.execute("DROP INDEX IF EXISTS indexhash")
+        command.execute("DROP INDEX IF EXISTS indexhashsize")
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexhashcover
+        ON TBL_RESULTS (hash, size, dev, ino, covered) """)
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexpath
+        ON TBL_RESULTS (path) """)
+        # Keyset pages of the file list sorted by hash
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexhashpath
+        ON TBL_RESULTS (hash, path) """)
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexroot
+        ON TBL_RESULTS (root, hash) """)
+        # Finds the files of a size for the updates of the watch mode
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexsize
+        ON TBL_RESULTS (size) """)
+        # Finds the result of an inode for its further hard links
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexinode
+        ON TBL_RESULTS (dev, ino) """)
+        command.execute(""" CREATE TABLE IF NOT EXISTS TBL_CACHE
+        (path TEXT PRIMARY KEY, dev INT, ino INT, size INT,
+        mtime_ns INT, sample_size INT, sample TEXT, hash TEXT,
+        algo TEXT) """)
+        self.add_missing_columns(command, "TBL_CACHE", {"algo": "TEXT"})
+        command.execute(""" CREATE TABLE IF NOT EXISTS scan_runs
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, seconds REAL,
+        roots TEXT, algorithm TEXT, workers INT, pool TEXT, files INT,
+        bytes INT, duplicates INT, errors INT, cache_hits INT,
+        cache_misses INT, status TEXT, stages TEXT) """)
+        command.execute(""" CREATE TABLE IF NOT EXISTS dup_groups
+        (hash TEXT PRIMARY KEY, size INT, count INT, inodes INT,
+        total_size INT, wasted INT, covered INT DEFAULT 0) """)
+        self.add_missing_columns(command, "dup_groups",
+                                 {"covered": "INT DEFAULT 0"})
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexwasted
+        ON dup_groups (wasted DESC, hash) """)
+        command.execute(""" CREATE TABLE IF NOT EXISTS TBL_DIRS
+        (path TEXT PRIMARY KEY, parent TEXT, root TEXT, name TEXT,
+        digest TEXT, files INT, size INT, dup INT DEFAULT 0,
+        top INT DEFAULT 0) """)
+        command.execute(""" CREATE INDEX IF NOT EXISTS indexdigest
+        ON TBL_DIRS (digest) """)
+        # Checkpoint of an unfinished scan: the folders still to list per
+        # root and the files listed so far, by folder id and name
+        command.execute(""" CREATE TABLE IF NOT EXISTS scan_frontier
+        (root TEXT PRIMARY KEY, run INT, folders TEXT) """)
+        command.execute("PRAGMA table_info(scan_listed)")
+        if "path" in {row[1] for row in command.fetchall()}:
+            # Older checkpoints stored the full path of every file
+            command.execute("DROP TABLE scan_listed")
+            command.execute("DELETE FROM scan_frontier")
+        command.execute(""" CREATE TABLE IF NOT EXISTS scan_folders
+        (id INTEGER PRIMARY KEY, prefix TEXT UNIQUE, root TEXT) """)
+        command.execute(""" CREATE TABLE IF NOT EXISTS scan_listed
+        (folder INT, name TEXT, size INT, dev INT, ino INT, mtime_ns INT,
+        nlink INT, PRIMARY KEY (folder, name)) WITHOUT ROWID """)
+        ccon.commit()
+
+    def add_missing_columns(self, command, table, columns):
+        """Add columns that older results.db files do not have yet."""
+        command.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in command.fetchall()}
+        for column, column_type in columns.items():
+            if column not in existing:
+                command.execute(f"ALTER TABLE {table} "
+                                f"ADD COLUMN {column} {column_type}")
 
-    def insertFile(self, path, name, size, hash):
+    def insertFile(self, path, name, size, hash, reason=None,
+                   algo="sha256", dev=None, ino=None, root=None,
+                   session=None, mtime_ns=None):
         """
         Add a new file record to the database.
 
-        The record consists of file's full path, name, size and SHA-256 hash.
+        The record consists of file's full path, name, size, hash, the
+        name of the hash algorithm, the device and inode numbers, the scan
+        root the file was found under, the id of the scan session and the
+        modification time in nanoseconds.
+        If the file was not hashed, hash is None and reason tells why.
         """
         ccon = self.database()
         command = ccon.cursor()
         command.execute(""" INSERT INTO TBL_RESULTS
-        (path, name, size, hash)
-        VALUES (?, ?, ?, ?)""", (path, name, size, hash))
+        (path, name, size, hash, reason, algo, dev, ino, root, session,
+        mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (path, name, size, hash, reason, algo, dev, ino,
+                         root, session, mtime_ns))
         ccon.commit()
+        self.groups_stale = True
+
+    def insert_many(self, rows):
+        """
+        Buffer many file records and commit them in large transactions.
+
+        Each row is (path, name, size, hash, reason, algo, dev, ino, root,
+        session, mtime_ns). Rows are written once
+        COMMIT_SIZE of them are buffered or when flush() is called.
+        """
+        self.database()
+        self.local.pending.extend(rows)
+        if len(self.local.pending) >= self.COMMIT_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the rows buffered by insert_many in one transaction."""
+        ccon = self.database()
+        pending = self.local.pending
+        if not pending:
+            return
+
+        with ccon:
+            ccon.executemany(""" INSERT INTO TBL_RESULTS
+            (path, name, size, hash, reason, algo, dev, ino, root, session,
+            mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", pending)
+        self.local.pending = []
+        self.groups_stale = True
+
+    def ensure_groups(self):
+        """
+        Rebuild the dup_groups table if rows were written since.
+
+        Buffered rows are flushed first. The rebuild is one GROUP BY over
+        the covering hash index.
+        """
+        self.flush()
+        if not self.groups_stale:
+            return
+
+        ccon = self.database()
+        with ccon:
+            ccon.execute("DELETE FROM dup_groups")
+            ccon.execute(f""" INSERT INTO dup_groups {GROUP_SUMMARY}
+            GROUP BY hash HAVING inodes > 1 """)
+        self.groups_stale = False
+
+    def refresh_groups(self, command, hashes):
+        """
+        Update the dup_groups rows of the given hashes.
+
+        Runs on command inside the caller's transaction, after the rows
+        of TBL_RESULTS were changed.
+        """
+        for file_hash in hashes:
+            command.execute("DELETE FROM dup_groups WHERE hash = ?",
+                            (file_hash,))
+            command.execute(f""" INSERT INTO dup_groups {GROUP_SUMMARY}
+            AND hash = ? GROUP BY hash HAVING inodes > 1 """, (file_hash,))
+
+    def path_hashes(self, command, paths):
+        """Return the set of hashes of paths, using the given cursor."""
+        hashes = set()
+        for path in paths:
+            command.execute(""" SELECT hash FROM TBL_RESULTS
+            WHERE path = ? AND hash IS NOT NULL """, (path,))
+            hashes.update(row[0] for row in command.fetchall())
+        return hashes
 
     def duplicates(self):
         """
@@ -43,24 +326,864 @@ class DataBase:
 
         Files with more than 1 group and a common hash were found.
         """
+        return self.duplicate_files().fetchall()
+
+    def duplicate_files(self):
+        """
+        Return a cursor over (name, hash, path, size) of duplicate files.
+
+        The rows are ordered by hash. They are sorted apart from the
+        table (the unary + keeps the index out of the ORDER BY), so the
+        rows may be relabeled by update_verified while the cursor is read.
+        """
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT name, hash, path, size
+        FROM TBL_RESULTS WHERE hash IN ({DUPLICATE_HASHES})
+        ORDER BY +hash """)
+        return command
+
+    def duplicate_inodes(self):
+        """
+        Return a cursor over (hash, path, size, idno) of duplicate inodes.
+
+        Of the hard links to an inode only the row that was stored first
+        is returned, the path the scan hashed. The rows are ordered by
+        hash, then in the order they were stored.
+        """
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT hash, path, size, MIN(idno) AS first
+        FROM TBL_RESULTS WHERE hash IN ({DUPLICATE_HASHES})
+        GROUP BY hash, {INODE_KEY} ORDER BY hash, first """)
+        return command
+
+    def duplicate_totals(self):
+        """Return (files, bytes) of all duplicate files."""
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT COALESCE(SUM(count), 0),
+        COALESCE(SUM(total_size), 0) FROM dup_groups """)
+        return command.fetchone()
+
+    def text_filter(self, text):
+        """Build the SQL condition that matches text in a name or path."""
+        if not text:
+            return "1", ()
+        pattern = f"%{text}%"
+        return "(name LIKE ? OR path LIKE ?)", (pattern, pattern)
+
+    def duplicates_page(self, limit, after=None, sort_column="hash",
+                        descending=False, text=""):
+        """
+        Return one page of duplicate files as (name, hash, path, size).
+
+        Sorting and filtering by name or path is done by SQLite. Files of
+        equal sort value are ordered by path. For the next page pass the
+        last row of this one as after; the page starts right behind it,
+        so deep pages do not read the pages before them.
+        """
+        if sort_column not in FILE_SORT_COLUMNS:
+            sort_column = "hash"
+        direction = "DESC" if descending else "ASC"
+        condition, params = self.text_filter(text)
+        if after is not None:
+            past = "<" if descending else ">"
+            last = after[FILE_SORT_COLUMNS.index(sort_column)]
+            if sort_column == "path":
+                condition += f" AND path {past} ?"
+                params += (last,)
+            else:
+                condition += f" AND ({sort_column}, path) {past} (?, ?)"
+                params += (last, after[2])
+
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        # The unary + keeps SQLite from reading the page by the hash list,
+        # so it seeks to after in the index of the sort column instead
+        command.execute(f""" SELECT name, hash, path, size
+        FROM TBL_RESULTS WHERE +hash IN ({DUPLICATE_HASHES})
+        AND {condition}
+        ORDER BY {sort_column} {direction}, path {direction}
+        LIMIT ? """, params + (limit,))
+        return command.fetchall()
+
+    def duplicate_count(self, text=""):
+        """Return the number of duplicate files that match text."""
+        condition, params = self.text_filter(text)
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT COUNT(*) FROM TBL_RESULTS
+        WHERE hash IN ({DUPLICATE_HASHES}) AND {condition} """, params)
+        return command.fetchone()[0]
+
+    def duplicate_group_count(self, text="", collapse=False):
+        """Return the number of duplicate groups that have a match."""
+        condition, params = self.text_filter(text)
+        groups = DUPLICATE_HASHES
+        if collapse:
+            groups += " WHERE covered = 0 "
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        if text:
+            command.execute(f""" SELECT COUNT(DISTINCT hash) FROM TBL_RESULTS
+            WHERE hash IN ({groups}) AND {condition} """, params)
+        else:
+            command.execute(f"SELECT COUNT(*) FROM ({groups})")
+        return command.fetchone()[0]
+
+    def duplicate_groups(self, limit=100, after=None, sort_column="wasted",
+                         descending=True, text="", collapse=False):
+        """
+        Return duplicate groups, the most wasted space first.
+
+        Each row is (hash, size, count, wasted, total_size), where count
+        includes hard links and wasted is the space freed by keeping one
+        inode. For the next page pass the last row of this one as after;
+        the page starts right behind it, so deep pages do not read the
+        pages before them, and sorted by wasted they come from its index.
+        The groups can also be sorted by another of GROUP_SORT_COLUMNS,
+        ascending when descending is False. With text, only the groups
+        that have a matching file are returned. With collapse, groups
+        whose files all lie in duplicate folders are left out, they are
+        shown as folder groups.
+        """
+        if sort_column not in GROUP_SORT_COLUMNS:
+            sort_column = "wasted"
+        direction = "DESC" if descending else "ASC"
+        condition, params = self.text_filter(text)
+        if text:
+            condition = (f"hash IN (SELECT hash FROM TBL_RESULTS "
+                         f"WHERE {condition})")
+        if collapse:
+            condition += " AND covered = 0"
+        if after is not None:
+            past = "<" if descending else ">"
+            last = after[("hash", "size", "count", "wasted",
+                          "total_size").index(sort_column)]
+            if sort_column == "hash":
+                condition += f" AND hash {past} ?"
+                params += (last,)
+            else:
+                condition += (f" AND ({sort_column} {past} ? OR "
+                              f"({sort_column} = ? AND hash > ?))")
+                params += (last, last, after[0])
+
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT hash, size, count, wasted, total_size
+        FROM dup_groups WHERE {condition}
+        ORDER BY {sort_column} {direction}, hash LIMIT ? """,
+                        params + (limit,))
+        return command.fetchall()
+
+    def wasted_total(self):
+        """Return the bytes that removing all duplicates would free."""
+        self.ensure_groups()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute("SELECT COALESCE(SUM(wasted), 0) FROM dup_groups")
+        return command.fetchone()[0]
+
+    def file_digests(self):
+        """
+        Return a cursor over (path, root, hash, size) of all files.
+
+        The rows are ordered by path, so the files below a folder come
+        one after another.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT path, root, hash, size FROM TBL_RESULTS
+        WHERE root IS NOT NULL ORDER BY path """)
+        return command
+
+    def replace_dirs(self, rows):
+        """
+        Store the folder digests of a scan, see treehash.
+
+        Each row is (path, parent, root, name, digest, files, size); rows
+        may be a lazy iterator. Duplicate folders are marked afterwards.
+        Returns the number of folders stored.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        with ccon:
+            command.execute("DELETE FROM TBL_DIRS")
+            command.executemany(""" INSERT INTO TBL_DIRS
+            (path, parent, root, name, digest, files, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?) """, rows)
+            count = command.rowcount
+            self.mark_duplicate_dirs(command)
+        return count
+
+    def mark_duplicate_dirs(self, command):
+        """
+        Mark the duplicate folders and the files inside them.
+
+        A folder is top when it is a duplicate but its parent is not;
+        the folders below it are duplicates too. Files below a top folder
+        are covered, the folder groups already show them.
+        """
+        command.execute(f""" UPDATE TBL_DIRS
+        SET dup = digest IN ({DUPLICATE_DIGESTS}) """)
+        command.execute(""" UPDATE TBL_DIRS SET top = dup AND NOT EXISTS
+        (SELECT 1 FROM TBL_DIRS p WHERE p.path = TBL_DIRS.parent
+        AND p.dup) """)
+        command.execute(""" UPDATE TBL_RESULTS SET covered = 0
+        WHERE covered = 1 """)
+        command.execute("SELECT path FROM TBL_DIRS WHERE top = 1")
+        for folder, in command.fetchall():
+            command.execute(""" UPDATE TBL_RESULTS SET covered = 1
+            WHERE path > ? AND path < ? """,
+                            (folder + os.sep, folder + chr(ord(os.sep) + 1)))
+        self.groups_stale = True
+
+    def forget_dirs(self, command, paths):
+        """
+        Drop the folders that held the given files from TBL_DIRS.
+
+        Their digests no longer match what is on disk. When one of them
+        was a duplicate, the duplicate folders are marked again.
+        """
+        folders = set()
+        for path in paths:
+            folder = os.path.dirname(path)
+            while folder not in folders and os.path.dirname(folder) != folder:
+                folders.add(folder)
+                folder = os.path.dirname(folder)
+
+        changed = False
+        for folder in folders:
+            command.execute("SELECT dup FROM TBL_DIRS WHERE path = ?",
+                            (folder,))
+            row = command.fetchone()
+            if row is None:
+                continue
+            changed = changed or bool(row[0])
+            command.execute("DELETE FROM TBL_DIRS WHERE path = ?", (folder,))
+        if changed:
+            self.mark_duplicate_dirs(command)
+
+    def dir_text_filter(self, text):
+        """Build the SQL condition for folder groups with a matching path."""
+        if not text:
+            return "1", ()
+        return ("digest IN (SELECT digest FROM TBL_DIRS WHERE path LIKE ?)",
+                (f"%{text}%",))
+
+    def duplicate_dir_groups_page(self, offset, limit, sort_column="hash",
+                                  descending=False, text=""):
+        """
+        Return one page of duplicate folder groups.
+
+        Each row is (digest, count, total_size, name) where count is the
+        number of folders. Only the outermost duplicate folders make a
+        group; the folders inside them are not listed again.
+        """
+        if sort_column not in GROUP_SORT_COLUMNS:
+            sort_column = "hash"
+        direction = "DESC" if descending else "ASC"
+        condition, params = self.dir_text_filter(text)
+
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT digest AS hash, COUNT(*) AS count,
+        SUM(size) AS total_size, MIN(name),
+        MAX(size) * (COUNT(*) - 1) AS wasted FROM TBL_DIRS
+        WHERE digest IN (SELECT digest FROM TBL_DIRS WHERE top = 1)
+        AND {condition}
+        GROUP BY digest ORDER BY {sort_column} {direction}, digest
+        LIMIT ? OFFSET ? """, params + (limit, offset))
+        return [row[:4] for row in command.fetchall()]
+
+    def duplicate_dir_group_count(self, text=""):
+        """Return the number of duplicate folder groups that have a match."""
+        condition, params = self.dir_text_filter(text)
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT COUNT(DISTINCT digest) FROM TBL_DIRS
+        WHERE top = 1 AND {condition} """, params)
+        return command.fetchone()[0]
+
+    def dir_group_dirs(self, digest):
+        """Return the folders with the given digest as (name, path, size)."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT name, path, size FROM TBL_DIRS
+        WHERE digest = ? ORDER BY path """, (digest,))
+        return command.fetchall()
+
+    def files_under(self, folder):
+        """Return the paths of all files below a folder."""
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT path FROM TBL_RESULTS
+        WHERE path > ? AND path < ? ORDER BY path """,
+                        (folder + os.sep, folder + chr(ord(os.sep) + 1)))
+        return [row[0] for row in command.fetchall()]
+
+    def group_files(self, hash):
+        """Return the files with the given hash as (name, path, size)."""
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT name, path, size FROM TBL_RESULTS
+        WHERE hash = ? ORDER BY path """, (hash,))
+        return command.fetchall()
+
+    def group_members(self, hash):
+        """
+        Return the files with the given hash as (path, size, dev, ino).
+
+        They are in the order they were stored.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT path, size, dev, ino FROM TBL_RESULTS
+        WHERE hash = ? ORDER BY idno """, (hash,))
+        return command.fetchall()
+
+    def hashes_of(self, paths):
+        """Return the set of hashes of the given files."""
+        self.flush()
+        ccon = self.database()
+        return self.path_hashes(ccon.cursor(), paths)
+
+    def file_states(self, paths):
+        """
+        Return path -> (size, mtime_ns) of the given files as scanned.
+
+        mtime_ns is None for rows stored before it was recorded.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        states = {}
+        paths = list(paths)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            command.execute(f""" SELECT path, size, mtime_ns
+            FROM TBL_RESULTS WHERE path IN ({", ".join("?" * len(chunk))})
+            """, chunk)
+            states.update((path, (size, mtime_ns))
+                          for path, size, mtime_ns in command.fetchall())
+        return states
+
+    def group_counts(self, hashes):
+        """
+        Return a dict of hash -> number of files for the given hashes.
+
+        Hard links to the same inode are counted once.
+        """
+        counts = dict.fromkeys(hashes, 0)
+        ccon = self.database()
+        command = ccon.cursor()
+        for file_hash in counts:
+            command.execute(f""" SELECT COUNT(DISTINCT {INODE_KEY})
+            FROM TBL_RESULTS WHERE hash = ? """, (file_hash,))
+            counts[file_hash] = command.fetchone()[0]
+        return counts
+
+    def inode_result(self, dev, ino):
+        """Return (hash, reason) of the first row of an inode."""
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT hash, reason FROM TBL_RESULTS
+        WHERE dev = ? AND ino = ? ORDER BY idno LIMIT 1 """, (dev, ino))
+        return command.fetchone()
+
+    def hardlink_group_count(self):
+        """Return the number of inodes that have more than one path."""
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT COUNT(*) FROM
+        (SELECT 1 FROM TBL_RESULTS WHERE ino IS NOT NULL
+        GROUP BY dev, ino HAVING COUNT(*) > 1) """)
+        return command.fetchone()[0]
+
+    def update_inodes(self, rows):
+        """
+        Store new device and inode numbers after files were linked.
+
+        Each row is (dev, ino, path).
+        """
+        self.flush()
         ccon = self.database()
         command = ccon.cursor()
-        command.execute(""" SELECT name, hash, path, size
-        FROM TBL_RESULTS WHERE hash IN
-        (SELECT hash FROM TBL_RESULTS GROUP BY hash HAVING COUNT(*) > 1)
-        ORDER BY hash """)
+        with ccon:
+            command.executemany(""" UPDATE TBL_RESULTS SET dev = ?, ino = ?
+            WHERE path = ? """, rows)
+            self.refresh_groups(command, self.path_hashes(
+                command, [row[2] for row in rows]))
+
+    def update_verified(self, rows):
+        """
+        Store the result of the byte-for-byte check.
+
+        Each row is (hash, path). Files whose content differs from the rest
+        of their group get a new hash label so they leave the group.
+        """
+        self.flush()
+        ccon = self.database()
+        with ccon:
+            ccon.executemany(""" UPDATE TBL_RESULTS
+            SET hash = ?, verified = 1 WHERE path = ? """, rows)
+        self.groups_stale = True
+
+    def skipped(self):
+        """
+        Return the files that were never hashed.
+
+        Each row is (name, path, size, reason).
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT name, path, size, reason
+        FROM TBL_RESULTS WHERE hash IS NULL ORDER BY reason, path """)
         return command.fetchall()
 
+    def cached_files(self, root):
+        """
+        Return the hash cache entries of the files under root.
+
+        Returns a dict of path -> (dev, ino, size, mtime_ns, sample_size,
+        sample, hash, algo).
+        """
+        prefix = os.path.join(root, "")
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT path, dev, ino, size, mtime_ns,
+        sample_size, sample, hash, algo FROM TBL_CACHE
+        WHERE substr(path, 1, ?) = ? """, (len(prefix), prefix))
+        return {row[0]: row[1:] for row in command.fetchall()}
+
+    def update_cache(self, rows):
+        """
+        Store hash cache entries, replacing older entries of the same path.
+
+        Each row is (path, dev, ino, size, mtime_ns, sample_size, sample,
+        hash, algo).
+        """
+        ccon = self.database()
+        command = ccon.cursor()
+        command.executemany(""" INSERT OR REPLACE INTO TBL_CACHE
+        (path, dev, ino, size, mtime_ns, sample_size, sample, hash, algo)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        ccon.commit()
+
+    def prune_cache(self, paths):
+        """Remove the hash cache entries of files that no longer exist."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.executemany("DELETE FROM TBL_CACHE WHERE path = ?",
+                            ((path,) for path in paths))
+        ccon.commit()
+
+    def begin_run(self, started, roots, algorithm):
+        """
+        Store a scan run that is starting and return its id.
+
+        The id is also the session id of the result rows of the scan.
+        """
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" INSERT INTO scan_runs (started, seconds, roots,
+        algorithm, files, bytes, duplicates, errors, cache_hits,
+        cache_misses, status, stages)
+        VALUES (?, 0, ?, ?, 0, 0, 0, 0, 0, 0, ?, '{}') """,
+                        (started, roots, algorithm, RUN_RUNNING))
+        ccon.commit()
+        return command.lastrowid
+
+    def finish_run(self, run_id, run):
+        """
+        Store the results of a finished scan run.
+
+        run is a dict with the RUN_COLUMNS keys; stages is a dict of
+        profiling part counters and is stored as JSON.
+        """
+        ccon = self.database()
+        command = ccon.cursor()
+        values = [run[column] for column in RUN_COLUMNS]
+        values[-1] = json.dumps(run["stages"])
+        assignments = ", ".join(f"{column} = ?" for column in RUN_COLUMNS)
+        command.execute(f"UPDATE scan_runs SET {assignments} WHERE id = ?",
+                        values + [run_id])
+        ccon.commit()
+
+    def add_run_stage(self, run_id, part, seconds, files=0):
+        """Add the counters of a part measured after the scan, e.g. gui."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute("SELECT stages FROM scan_runs WHERE id = ?",
+                        (run_id,))
+        row = command.fetchone()
+        if row is None:
+            return
+        stages = json.loads(row[0])
+        stages[part] = {"seconds": seconds, "files": files, "bytes": 0,
+                        "errors": 0}
+        command.execute("UPDATE scan_runs SET stages = ? WHERE id = ?",
+                        (json.dumps(stages), run_id))
+        ccon.commit()
+
+    def runs(self, limit=10):
+        """Return the latest scan runs as dicts, newest first."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT id, {", ".join(RUN_COLUMNS)}
+        FROM scan_runs ORDER BY id DESC LIMIT ? """, (limit,))
+        runs = []
+        for row in command.fetchall():
+            run = dict(zip(("id",) + RUN_COLUMNS, row))
+            run["stages"] = json.loads(run["stages"])
+            runs.append(run)
+        return runs
+
+    def reopen_run(self, run_id):
+        """Mark a stopped scan run as running again when it is resumed."""
+        ccon = self.database()
+        ccon.execute("UPDATE scan_runs SET status = ? WHERE id = ?",
+                     (RUN_RUNNING, run_id))
+        ccon.commit()
+
+    def save_checkpoint(self, run_id, rows, root=None, folders=None):
+        """
+        Store the progress of a scan walk in one transaction.
+
+        rows are walker.FileInfo tuples of files listed since the last
+        checkpoint, folders are the folders of root still to list.
+        Without a root only the files are stored. The folder of every
+        file is stored once in scan_folders; the ids of the last
+        FOLDER_IDS folders are remembered, the walk lists a folder at a
+        time.
+        """
+        ccon = self.database()
+        command = ccon.cursor()
+        folder_ids = self.local.folder_ids
+        with ccon:
+            listed = []
+            for info in rows:
+                prefix, name = os.path.split(info.path)
+                prefix = os.path.join(prefix, "")
+                folder_id = folder_ids.get(prefix)
+                if folder_id is None:
+                    if len(folder_ids) >= self.FOLDER_IDS:
+                        folder_ids.clear()
+                    command.execute(""" INSERT OR IGNORE INTO scan_folders
+                    (prefix, root) VALUES (?, ?) """, (prefix, info.root))
+                    command.execute(""" SELECT id FROM scan_folders
+                    WHERE prefix = ? """, (prefix,))
+                    folder_id = folder_ids[prefix] = command.fetchone()[0]
+                listed.append((folder_id, name, info.size, info.dev,
+                               info.ino, info.mtime_ns, info.nlink))
+            command.executemany(""" INSERT OR IGNORE INTO scan_listed
+            (folder, name, size, dev, ino, mtime_ns, nlink)
+            VALUES (?, ?, ?, ?, ?, ?, ?) """, listed)
+            if root is not None:
+                command.execute(""" INSERT OR REPLACE INTO scan_frontier
+                (root, run, folders) VALUES (?, ?, ?) """,
+                                (root, run_id, json.dumps(folders)))
+
+    def resumable_run(self, roots, algorithm):
+        """
+        Return the id of the unfinished scan that can be resumed.
+
+        That is the latest run, if it did not complete, scanned the same
+        roots with the same algorithm and left a checkpoint.
+        """
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT id FROM scan_runs
+        WHERE id = (SELECT MAX(id) FROM scan_runs) AND status != ?
+        AND roots = ? AND algorithm = ?
+        AND id IN (SELECT run FROM scan_frontier) """,
+                        (RUN_COMPLETED, roots, algorithm))
+        row = command.fetchone()
+        return row and row[0]
+
+    def frontiers(self, run_id):
+        """Return the checkpointed root -> folders still to list."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT root, folders FROM scan_frontier
+        WHERE run = ? """, (run_id,))
+        return {root: json.loads(folders)
+                for root, folders in command.fetchall()}
+
+    def listed_files(self):
+        """Return a cursor over the checkpointed files, in FileInfo order."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(LISTED_FILES)
+        return command
+
+    def listed_count(self):
+        """Return the number of checkpointed files."""
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute("SELECT COUNT(*) FROM scan_listed")
+        return command.fetchone()[0]
+
+    def listed_by_size(self):
+        """
+        Return a cursor over the checkpointed files, ordered by size.
+
+        Each row is a walker.FileInfo followed by the hash cache entry of
+        the file as in cached_files, or by NULLs. Files of one size are
+        ordered by inode, so hard links come together. SQLite sorts the
+        files itself, in temporary files when they do not fit its cache;
+        the sort is done before the first row is returned.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT l.*, c.dev, c.ino, c.size, c.mtime_ns,
+        c.sample_size, c.sample, c.hash, c.algo FROM ({LISTED_FILES}) l
+        LEFT JOIN TBL_CACHE c ON c.path = l.path
+        ORDER BY l.size, l.dev, l.ino, l.path """)
+        return command
+
+    def listed_by_sample(self, sample_size, algorithm):
+        """
+        Return a cursor over the checkpointed inodes that have no result.
+
+        Rows are as in listed_by_size, for the first path of every inode,
+        and end with the cached sample of the file if its cache entry
+        still holds for the file, sample_size and algorithm, or NULL.
+        They are ordered by size and that sample, so the inodes that
+        share both come together.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT l.*, c.dev, c.ino, c.size, c.mtime_ns,
+        c.sample_size, c.sample, c.hash, c.algo, CASE WHEN c.dev = l.dev
+        AND c.ino = l.ino AND c.size = l.size AND c.mtime_ns = l.mtime_ns
+        AND c.sample_size = ? AND c.algo = ? THEN c.sample END AS valid_sample
+        FROM (SELECT MIN(path) AS path, size, dev, ino, mtime_ns, nlink, root
+        FROM ({LISTED_FILES}) GROUP BY dev, ino) l
+        LEFT JOIN TBL_CACHE c ON c.path = l.path
+        WHERE NOT EXISTS (SELECT 1 FROM TBL_RESULTS r WHERE r.path = l.path)
+        ORDER BY l.size, valid_sample, l.dev, l.ino """,
+                        (sample_size, algorithm))
+        return command
+
+    def add_listed_links(self, session):
+        """
+        Store the checkpointed hard links that have no result row yet.
+
+        Each gets the result of the path of its inode that was stored,
+        see ScanEngine.scan_spilled.
+        """
+        self.flush()
+        ccon = self.database()
+        with ccon:
+            ccon.execute(""" INSERT INTO TBL_RESULTS
+            (path, name, size, hash, reason, algo, dev, ino, root, session,
+            mtime_ns)
+            SELECT f.prefix || l.name, l.name, l.size, r.hash, r.reason,
+            r.algo, l.dev, l.ino, f.root, ?, l.mtime_ns
+            FROM scan_listed l JOIN scan_folders f ON f.id = l.folder
+            JOIN TBL_RESULTS r ON r.dev = l.dev AND r.ino = l.ino
+            WHERE l.nlink > 1 AND NOT EXISTS (SELECT 1 FROM TBL_RESULTS x
+            WHERE x.path = f.prefix || l.name)
+            GROUP BY l.folder, l.name """, (session,))
+        self.groups_stale = True
+
+    def prune_unlisted(self, roots):
+        """
+        Remove the hash cache entries under roots that are not listed.
+
+        Used instead of prune_cache after a walk that was only stored in
+        the checkpoint.
+        """
+        ccon = self.database()
+        with ccon:
+            for root in roots:
+                prefix = os.path.join(root, "")
+                ccon.execute(f""" DELETE FROM TBL_CACHE
+                WHERE substr(path, 1, ?) = ?
+                AND path NOT IN (SELECT path FROM ({LISTED_FILES})) """,
+                             (len(prefix), prefix))
+
+    def clear_checkpoint(self):
+        """Forget the checkpoint of an unfinished scan."""
+        ccon = self.database()
+        with ccon:
+            ccon.execute("DELETE FROM scan_frontier")
+            ccon.execute("DELETE FROM scan_listed")
+            ccon.execute("DELETE FROM scan_folders")
+        self.local.folder_ids.clear()
+
     def clear(self):
-        """Clear all browsing history in the database."""
+        """
+        Clear all browsing history in the database.
+
+        The hash cache and the scan checkpoint are kept so that a rescan
+        can reuse them.
+        """
         ccon = self.database()
+        self.local.pending = []
         command = ccon.cursor()
         command.execute(" DELETE FROM TBL_RESULTS")
+        command.execute("DELETE FROM dup_groups")
+        command.execute("DELETE FROM TBL_DIRS")
         ccon.commit()
+        self.groups_stale = False
+
+    def manifest_files(self, algorithm):
+        """
+        Return a cursor over (path, size, mtime_ns, hash) of all files.
+
+        The rows are ordered by path. Files that were not hashed by the
+        scan get the digest of the hash cache, when it has one made with
+        algorithm for the unchanged file; otherwise the hash is None.
+        The hash is the digest itself, without the label of a verified
+        scan: files that only share a digest are told apart by whoever
+        merges the manifests.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT r.path, r.size, r.mtime_ns,
+        COALESCE({RAW_DIGEST}, c.hash) FROM TBL_RESULTS r
+        LEFT JOIN TBL_CACHE c ON c.path = r.path AND c.dev = r.dev
+        AND c.ino = r.ino AND c.size = r.size AND c.mtime_ns = r.mtime_ns
+        AND c.algo = ?
+        WHERE r.root IS NOT NULL ORDER BY r.path """, (algorithm,))
+        return command
+
+    def roots(self):
+        """Return the scan roots in the database with their file counts."""
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT root, COUNT(*) FROM TBL_RESULTS
+        WHERE root IS NOT NULL GROUP BY root ORDER BY root """)
+        return command.fetchall()
+
+    def cross_root_files(self, mode, root, other_root=None):
+        """
+        Compare the files of a scan root with another root.
+
+        Returns (name, hash, path, size) rows of files under root:
+        CROSS_IN_OTHER gives the files that already exist under
+        other_root, CROSS_MISSING the files that have no copy there and
+        CROSS_WITHIN the files with another copy under root itself.
+        Without other_root, all roots but root are compared against. Hard
+        links to the same inode are not copies.
+        """
+        if mode == CROSS_WITHIN:
+            other_root = root
+        other = "b.root = ?" if other_root else "b.root != ?"
+        copy_exists = f""" EXISTS (SELECT 1 FROM TBL_RESULTS b
+        WHERE b.hash = a.hash AND {other}
+        AND COALESCE(b.dev || ':' || b.ino, b.path)
+        != COALESCE(a.dev || ':' || a.ino, a.path)) """
+        if mode == CROSS_MISSING:
+            # Files with a unique size or sample have no copy anywhere
+            condition = f""" ((a.hash IS NOT NULL AND NOT {copy_exists})
+            OR a.reason IN (?, ?)) """
+            params = (root, other_root or root, SKIP_UNIQUE_SIZE,
+                      SKIP_UNIQUE_SAMPLE)
+        else:
+            condition = f"a.hash IS NOT NULL AND {copy_exists}"
+            params = (root, other_root or root)
+
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(f""" SELECT a.name, a.hash, a.path, a.size
+        FROM TBL_RESULTS a WHERE a.root = ? AND {condition}
+        ORDER BY a.hash, a.path """, params)
+        return command.fetchall()
 
     def delete_file(self, path):
         """Delete specified file from the database."""
+        self.delete_files([path])
+
+    def delete_files(self, paths):
+        """
+        Delete the given files from the database in one transaction.
+
+        The duplicate groups of the files are updated in the same
+        transaction.
+        """
+        self.update_files([], paths)
+
+    def update_files(self, rows, deleted=()):
+        """
+        Replace the rows of changed files and delete the removed files.
+
+        Each row is a TBL_RESULTS row as in insert_many; an older row of
+        the same path is replaced. Everything is done in one transaction
+        together with the duplicate groups of the old and new hashes, so
+        the summary table is not rebuilt for a few changed files.
+        """
+        self.flush()
+        paths = [row[0] for row in rows] + list(deleted)
         ccon = self.database()
         command = ccon.cursor()
-        command.execute("DELETE FROM TBL_RESULTS WHERE path = ?", (path,))
-        ccon.commit()
+        with ccon:
+            hashes = self.path_hashes(command, paths)
+            command.executemany("DELETE FROM TBL_RESULTS WHERE path = ?",
+                                ((path,) for path in paths))
+            command.executemany(""" INSERT INTO TBL_RESULTS
+            (path, name, size, hash, reason, algo, dev, ino, root, session,
+            mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            hashes.update(row[3] for row in rows if row[3])
+            self.forget_dirs(command, paths)
+            self.refresh_groups(command, hashes)
+
+    def size_peers(self, sizes):
+        """
+        Return the files with one of the given sizes.
+
+        Returns a dict of size -> list of (path, root, hash, reason).
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        sizes = list(sizes)
+        peers = {}
+        for start in range(0, len(sizes), 500):
+            chunk = sizes[start:start + 500]
+            marks = ", ".join("?" * len(chunk))
+            command.execute(f""" SELECT size, path, root, hash, reason
+            FROM TBL_RESULTS WHERE size IN ({marks}) """, chunk)
+            for size, *row in command.fetchall():
+                peers.setdefault(size, []).append(tuple(row))
+        return peers
+
+    def hash_labels(self, hash):
+        """
+        Return the labels in use for a digest.
+
+        These are the digest itself and the hash#n labels given to files
+        that only share the digest, see update_verified.
+        """
+        self.flush()
+        ccon = self.database()
+        command = ccon.cursor()
+        command.execute(""" SELECT DISTINCT hash FROM TBL_RESULTS
+        WHERE hash = ? OR (hash > ? AND hash < ?) ORDER BY hash """,
+                        (hash, hash + "#", hash + "$"))
+        return [row[0] for row in command.fetchall()]
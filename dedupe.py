@@ -0,0 +1,190 @@
+"""Space Reclaiming File Operations Module."""
+import errno
+import os
+from hasher import files_equal
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LINK_HARD = "hardlink"
+LINK_REFLINK = "reflink"
+
+# ioctl request that clones the extents of one file into another (Linux)
+FICLONE = 0x40049409
+
+# Files removed before their database rows are deleted in one transaction
+DELETE_BATCH_SIZE = 1000
+
+# Folder under every scanned folder that deleted files can be moved to;
+# the walk and the watchers always skip it, see rules.ScanRules.skips, so
+# moved files are not found again
+TRASH_DIR_NAME = ".hashsweep-trash"
+
+
+def clone_file(source_path, target_path):
+    """
+    Create target_path as a reflink copy of source_path.
+
+    The new file shares the data blocks of the source until one of them
+    is written to. Needs a filesystem with reflink support (Btrfs, XFS).
+    """
+    if fcntl is None:
+        raise OSError("Reflink bu sistemde desteklenmiyor")
+    try:
+        with open(source_path, 'rb') as source, \
+                open(target_path, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        os.chmod(target_path, os.stat(source_path).st_mode & 0o7777)
+    except OSError:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        raise
+
+
+def check_unchanged(path, state):
+    """
+    Raise OSError if a file changed since it was scanned.
+
+    state is its (size, mtime_ns) from the scan; a mtime_ns of None is
+    not compared.
+    """
+    st = os.stat(path)
+    size, mtime_ns = state
+    if st.st_size != size or mtime_ns not in (None, st.st_mtime_ns):
+        raise OSError(errno.ESTALE, "Dosya taramadan sonra değişmiş", path)
+
+
+def replace_with_link(keep_path, target_path, mode=LINK_HARD):
+    """
+    Replace target_path with a hard link or reflink to keep_path.
+
+    The link is made under a temporary name next to the target and then
+    renamed over it, so the target path never goes missing.
+    """
+    temp_path = os.path.join(os.path.dirname(target_path),
+                             f".{os.path.basename(target_path)}.hslink")
+    if mode == LINK_REFLINK:
+        clone_file(keep_path, temp_path)
+    else:
+        os.link(keep_path, temp_path)
+
+    try:
+        os.replace(temp_path, target_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+
+def move_to_trash(path, trash_dir):
+    """
+    Move a file into trash_dir, keeping its full path below it.
+
+    This is a rename, so it is only allowed on the same filesystem; it
+    fails with EXDEV otherwise instead of copying the data.
+    """
+    target_path = os.path.join(trash_dir,
+                               os.path.abspath(path).lstrip(os.sep))
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    if os.path.exists(target_path):
+        raise OSError(errno.EEXIST, "Çöpte aynı isimde dosya var",
+                      target_path)
+    try:
+        os.rename(path, target_path)
+    except OSError as error:
+        if error.errno == errno.EXDEV:
+            raise OSError(errno.EXDEV, "Çöp klasörü başka bir dosya "
+                                       "sisteminde", path) from error
+        raise
+
+
+def trash_dir_for(path, roots):
+    """Return the trash folder of the scan root path is under, or None."""
+    for root in sorted(roots, key=len, reverse=True):
+        if path.startswith(root.rstrip(os.sep) + os.sep):
+            return os.path.join(root, TRASH_DIR_NAME)
+    return None
+
+
+def delete_files(paths, db, trash_roots=None, on_progress=None,
+                 is_running=lambda: True):
+    """
+    Delete files from disk and their rows from the database in batches.
+
+    With trash_roots, the scanned folders, every file is moved to the
+    trash folder of the folder it is under instead of unlinked. Files
+    that are already gone count as deleted. The database rows of every
+    batch are removed in one transaction. One failure does not stop the
+    rest. Returns (deleted, failures) where deleted is a list of paths
+    and failures a list of (path, error text).
+    """
+    deleted = []
+    failures = []
+    for start in range(0, len(paths), DELETE_BATCH_SIZE):
+        if not is_running():
+            break
+
+        batch = []
+        for path in paths[start:start + DELETE_BATCH_SIZE]:
+            try:
+                if trash_roots:
+                    trash_dir = trash_dir_for(path, trash_roots)
+                    if trash_dir is None:
+                        raise OSError(errno.ENOENT, "Dosya taranan "
+                                      "klasörlerin dışında", path)
+                    move_to_trash(path, trash_dir)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                failures.append((path, str(error)))
+                continue
+            batch.append(path)
+
+        db.delete_files(batch)
+        deleted.extend(batch)
+        if on_progress:
+            on_progress(min(start + DELETE_BATCH_SIZE, len(paths)))
+
+    return deleted, failures
+
+
+def link_groups(groups, states, mode=LINK_HARD, on_progress=None,
+                is_running=lambda: True):
+    """
+    Replace the duplicates in each group with links to one kept file.
+
+    groups is a list of (keep_path, [target_paths]). The digests are from
+    the scan, so right before a target is replaced, the kept file and
+    the target are checked against their (size, mtime_ns) in states and
+    compared byte for byte; a file that was changed since is left alone
+    and reported. One failure does not stop the batch. Returns (linked,
+    failures) where linked is a list of (dev, ino, path) for the
+    replaced files and failures a list of (path, error text).
+    """
+    linked = []
+    failures = []
+    done = 0
+    for keep_path, target_paths in groups:
+        for target_path in target_paths:
+            if not is_running():
+                return linked, failures
+            try:
+                check_unchanged(keep_path, states[keep_path])
+                check_unchanged(target_path, states[target_path])
+                if not files_equal(keep_path, target_path):
+                    raise OSError(errno.ESTALE, "Dosyaların içeriği farklı",
+                                  target_path)
+                replace_with_link(keep_path, target_path, mode)
+                st = os.stat(target_path)
+                linked.append((st.st_dev, st.st_ino, target_path))
+            except OSError as error:
+                failures.append((target_path, str(error)))
+
+            done += 1
+            if on_progress:
+                on_progress(done)
+
+    return linked, failures
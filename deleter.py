@@ -0,0 +1,36 @@
+"""Background File Deletion Module."""
+from PyQt6.QtCore import QThread, pyqtSignal
+from dedupe import delete_files
+
+
+class Deleter(QThread):
+    """
+    Deletes files on a thread so the interface does not freeze.
+
+    The work is done by dedupe.delete_files in batches; progress is the
+    number of files handled so far.
+    """
+
+    progress_signal = pyqtSignal(int)
+    finished_signal = pyqtSignal(list, list)
+
+    def __init__(self, paths, db, trash_roots=None):
+        """Store the files to delete and the folders to keep trash in."""
+        super().__init__()
+        self.paths = list(paths)
+        self.db = db
+        self.trash_roots = trash_roots
+        self.is_running = True
+
+    def run(self):
+        """Delete the files, then send the deleted paths and failures."""
+        deleted, failures = delete_files(self.paths, self.db,
+                                         self.trash_roots,
+                                         self.progress_signal.emit,
+                                         lambda: self.is_running)
+        self.db.close()
+        self.finished_signal.emit(deleted, failures)
+
+    def stop(self):
+        """Stop after the current batch."""
+        self.is_running = False
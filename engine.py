@@ -0,0 +1,1075 @@
+"""Scan Engine Module."""
+import contextlib
+import itertools
+import os
+import stat
+import time
+from database import (DataBase, SKIP_UNIQUE_SIZE, SKIP_UNIQUE_SAMPLE,
+                      SKIP_ACCESS_DENIED, SKIP_READ_ERROR, SKIP_TOO_SMALL,
+                      SKIP_TOO_LARGE, SKIP_BAD_NAME, RUN_COMPLETED,
+                      RUN_STOPPED, stored_path)
+from profiling import (ScanProfile, PART_WALK, PART_SAMPLE, PART_HASH,
+                       PART_DB, PART_VERIFY, PART_DIRS)
+from progress import (ProgressReporter, STAGE_WALK, STAGE_HASH,
+                      STAGE_VERIFY, STAGE_DONE)
+from hasher import (HashPool, file_hash, sample_hash, split_identical,
+                    empty_hash, HASH_ACCESS_DENIED, HASH_ERROR, POOL_THREAD,
+                    DEFAULT_ALGORITHM, CRYPTOGRAPHIC_ALGORITHMS)
+from iosched import IOScheduler
+from rules import ScanRules
+from treehash import directory_digests
+from walker import FileInfo, Frontier, unique_roots, walk_roots
+from watcher import POLL_INTERVAL, open_watcher
+
+# Bytes read from the head, middle and tail of a file by the prefilter
+DEFAULT_SAMPLE_SIZE = 4096
+
+# Number of result rows written to the database in one transaction
+BATCH_SIZE = 500
+
+# Bytes read at a time while hashing a whole file, None picks it by size
+BLOCK_SIZE = None
+
+# Seconds between two checkpoints of the folder walk
+CHECKPOINT_SECONDS = 5
+
+# Listed files kept in memory before they are stored without a checkpoint
+CHECKPOINT_FILES = 10000
+
+# Texts shown in the status line for the progress stages
+STAGE_TEXTS = {
+    STAGE_WALK: "Dosyalar listeleniyor",
+    STAGE_HASH: "Taranıyor",
+    STAGE_VERIFY: "Kopyalar bayt bayt doğrulanıyor",
+    STAGE_DONE: "Bitiriliyor",
+}
+
+
+def release_collisions(items, key, singletons):
+    """
+    Yield the items whose key is shared with at least one other item.
+
+    The first item of every key is held back until a second item with the
+    same key arrives, so matching items flow on while items are still
+    coming in. Items whose key was never repeated are appended to
+    singletons once items is exhausted. Items with a None key are passed
+    on right away.
+    """
+    held = {}
+    for item in items:
+        item_key = key(item)
+        if item_key is None:
+            yield item
+            continue
+
+        if item_key not in held:
+            held[item_key] = item
+            continue
+
+        first = held[item_key]
+        if first is not None:
+            held[item_key] = None
+            yield first
+        yield item
+
+    singletons.extend(item for item in held.values() if item is not None)
+
+
+def inode_key(path, dev, ino):
+    """Return what tells files apart; hard links to an inode share it."""
+    return path if dev is None or ino is None else (dev, ino)
+
+
+def progress_text(snapshot):
+    """Turn a progress snapshot into a one line status text."""
+    text = f"{STAGE_TEXTS[snapshot['stage']]}..."
+    if snapshot["stage"] in (STAGE_WALK, STAGE_HASH):
+        text += f" ({snapshot['listed_files']} dosya listelendi)"
+    if snapshot["files_done"]:
+        text += (f" {snapshot['current']} - {snapshot['files_done']}/"
+                 f"{snapshot['total_files']} dosya, "
+                 f"{snapshot['mb_per_s']:.1f} MB/s, "
+                 f"{snapshot['files_per_s']:.0f} dosya/s")
+        if snapshot["eta"] is not None:
+            text += f", kalan ~{snapshot['eta']:.0f} sn"
+    return text
+
+
+class ScanEngine:
+    """
+    Finds duplicate files under one or more folders.
+
+    The engine does not depend on Qt; the GUI runs it on a QThread through
+    scanner.Scanner and the command line runs it directly. Results are
+    written to the database, progress and found duplicates are passed to
+    the optional callbacks:
+
+    on_progress(snapshot) gets a ProgressReporter snapshot dict,
+    on_status(text) gets status messages,
+    on_duplicate(hash, size, path) is called once for every file that
+    joins a duplicate group, as soon as it is found,
+    on_update() is called in watch mode after changes were applied.
+
+    Where the time went is measured in a profiling.ScanProfile and stored
+    with the run in the scan_runs table. run_id is its row id and also
+    the session id stored with every result row, next to the root the
+    file was found under.
+
+    While the folders are walked, the folders still to list and the
+    files listed so far are checkpointed in the database. A scan that
+    was stopped or crashed can be resumed from there: the listed files
+    are replayed instead of walked again, and files that were already
+    hashed are taken from the hash cache.
+
+    With a memory_budget the scan does not keep its files in memory, see
+    scan_spilled; this is meant for trees with millions of files.
+    """
+
+    def __init__(self, folder_paths, sample_size=DEFAULT_SAMPLE_SIZE,
+                 workers=None, pool_kind=POOL_THREAD,
+                 algorithm=DEFAULT_ALGORITHM, verify=None, min_size=0,
+                 db_path="./results.db", on_progress=None, on_status=None,
+                 on_duplicate=None, profile_hook=None, on_update=None,
+                 resume=False, memory_budget=None, hash_all=False,
+                 rules=None):
+        """
+        Store the scan settings.
+
+        folder_paths is one folder or a list of folders. algorithm is a
+        key of hasher.ALGORITHMS. With verify, the files of every
+        duplicate group are also compared byte for byte; by default this
+        is done for the non-cryptographic algorithms only. rules, a
+        rules.ScanRules, choose the files the walk lists; files smaller
+        than min_size or the min_size of the rules, or larger than their
+        max_size, are stored as skipped and not read. Empty files are
+        never read either, they all get the digest of no data.
+        profile_hook, if given, is called without arguments and must
+        return a context manager; the scan runs inside it, so a profiler
+        can be attached to the thread that runs the scan (see
+        profiling.cprofile_hook). Folders inside another of the folders
+        are only scanned once. With resume, an unfinished scan of the
+        same folders is continued, see resumable. memory_budget, in
+        bytes, makes the scan spill its file list to the database and
+        bounds the memory SQLite uses for it. With hash_all, files with
+        a unique size or sample are hashed too, so every file has a
+        digest for a manifest (see manifest.py).
+        """
+        if isinstance(folder_paths, str):
+            folder_paths = [folder_paths]
+        self.folder_paths = unique_roots(folder_paths)
+        self.sample_size = sample_size
+        self.algorithm = algorithm
+        if verify is None:
+            verify = algorithm not in CRYPTOGRAPHIC_ALGORITHMS
+        self.verify = verify
+        self.rules = rules or ScanRules()
+        self.min_size = max(min_size, self.rules.min_size)
+        self.max_size = self.rules.max_size
+        self.workers = workers
+        self.pool_kind = pool_kind
+        self.db_path = db_path
+        self.on_progress = on_progress
+        self.on_status = on_status
+        self.on_duplicate = on_duplicate
+        self.on_update = on_update
+        self.profile_hook = profile_hook
+        self.resume = resume
+        self.memory_budget = memory_budget
+        self.hash_all = hash_all
+        self.frontiers = {}
+        # The database files change on every write, they are not watched
+        db_file = os.path.abspath(db_path)
+        self.db_files = {db_file + suffix
+                         for suffix in ("", "-wal", "-shm", "-journal")}
+        self.profile = ScanProfile()
+        self.run_id = None
+        self.db = None
+        self.bytes_saved = 0
+        self.cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.found_hashes = {}
+        self.links = {}
+        self.reporter = ProgressReporter(self.report_progress)
+        self.is_running = True
+
+    def run(self):
+        """Run the whole scan, inside the profile hook if one was given."""
+        hook = contextlib.nullcontext()
+        if self.profile_hook:
+            hook = self.profile_hook()
+        with hook:
+            self.scan()
+
+    def scan(self):
+        """
+        Find the duplicates and record the run.
+
+        See scan_streamed and scan_spilled. Digests of files that did not
+        change since the last scan are taken from the hash cache.
+        """
+        self.reporter = ProgressReporter(self.report_progress)
+        self.reporter.set_stage(STAGE_WALK)
+        self.profile = ScanProfile()
+        self.cache_hits = self.cache_misses = 0
+        self.found_hashes = {}
+        self.links = {}
+
+        db = self.db = DataBase(self.db_path)
+        with self.profile.measure(PART_DB):
+            if self.memory_budget:
+                db.limit_memory(self.memory_budget)
+            db.clear()
+            roots = os.pathsep.join(self.folder_paths)
+            self.run_id = self.resume and db.resumable_run(roots,
+                                                           self.algorithm)
+            self.resume = False
+            if self.run_id:
+                self.status("Yarım kalan tarama sürdürülüyor...")
+                db.reopen_run(self.run_id)
+                self.frontiers = db.frontiers(self.run_id)
+            else:
+                db.clear_checkpoint()
+                self.run_id = db.begin_run(self.profile.started, roots,
+                                           self.algorithm)
+                self.frontiers = {}
+            self.cache = {}
+            if not self.memory_budget:
+                for folder_path in self.folder_paths:
+                    self.cache.update(db.cached_files(folder_path))
+        unseen = set(self.cache)
+
+        self.bytes_saved = 0
+        with HashPool(self.workers, self.pool_kind) as pool:
+            scheduler = IOScheduler(pool)
+            if self.memory_budget:
+                self.scan_spilled(db, scheduler)
+            else:
+                self.scan_streamed(db, scheduler, unseen)
+
+        with self.profile.measure(PART_DB):
+            if self.memory_budget:
+                db.add_listed_links(self.run_id)
+            else:
+                self.add_hardlinks(db)
+
+            # Only prune after a complete walk, a stopped scan did not see
+            # all files and keeps its checkpoint
+            if self.is_running:
+                if self.memory_budget:
+                    db.prune_unlisted(self.folder_paths)
+                else:
+                    db.prune_cache(unseen)
+                db.clear_checkpoint()
+
+        if self.verify and self.is_running:
+            self.reporter.set_stage(STAGE_VERIFY)
+            with self.profile.measure(PART_VERIFY):
+                self.verify_duplicates(db)
+        elif self.memory_budget and self.on_duplicate:
+            self.report_duplicates(db)
+        if self.is_running:
+            with self.profile.measure(PART_DIRS):
+                self.hash_directories(db)
+        with self.profile.measure(PART_DB):
+            db.ensure_groups()
+        self.profile.finish()
+        db.finish_run(self.run_id, self.run_record(db))
+        db.close()
+        self.reporter.set_stage(STAGE_DONE)
+
+        if not self.is_running:
+            self.status("Tarama durduruldu, aynı klasörler yeniden "
+                        "taranınca kaldığı yerden devam edilebilir.")
+            return
+        if self.reporter.listed_files == 0:
+            self.status("Klasör boş!")
+            return
+
+        saved_mb = self.bytes_saved / (1024 * 1024)
+        self.status(f"Tarama Tamamlandı! (Ön filtre {saved_mb:.1f} MB tam "
+                    f"okumayı önledi, önbellek: {self.cache_hits} isabet, "
+                    f"{self.cache_misses} ıska)")
+
+    def scan_streamed(self, db, scheduler, unseen):
+        """
+        Find the duplicates in one pass over the walk.
+
+        The scan is a chain of generators: the folder walk feeds a size
+        filter, which feeds a sample filter, which feeds the full hashing.
+        A file is passed on as soon as another file matches it, so hashing
+        starts while the walk is still going. The first file of every
+        size and sample is held in memory until the walk is done.
+        """
+        size_singletons = []
+        sample_singletons = []
+        files = self.profile.timed_iter(
+            PART_WALK, self.collapse_hardlinks(self.walk_files(unseen)))
+        if self.hash_all:
+            candidates = ((info, None) for info in files)
+        else:
+            candidates = release_collisions(files, lambda info: info.size,
+                                            size_singletons)
+            candidates = self.profile.timed_iter(
+                PART_SAMPLE,
+                self.filter_by_sample(candidates, scheduler,
+                                      sample_singletons))
+        with self.profile.measure(PART_HASH):
+            self.hash_candidates(candidates, db, scheduler)
+
+        # A file with a unique size or sample can not have a duplicate
+        self.store(db.insert_many,
+                   [self.result_row(info, None, SKIP_UNIQUE_SIZE)
+                    for info in size_singletons])
+        self.store(db.insert_many,
+                   [self.result_row(info, None, SKIP_UNIQUE_SAMPLE)
+                    for info, sample in sample_singletons])
+        self.store(db.update_cache,
+                   [self.cache_row(info, sample, None)
+                    for info, sample in sample_singletons])
+        self.bytes_saved = sum(info.size for info, _ in sample_singletons)
+
+    def scan_spilled(self, db, scheduler):
+        """
+        Find the duplicates without keeping the files in memory.
+
+        The walk is only stored in the checkpoint tables, where every
+        folder prefix is stored once. Two passes over the listed files
+        follow, sorted by size in SQLite (in temporary files when they do
+        not fit its cache): the first stores the files with a unique size
+        and samples the others into the hash cache, the second hashes the
+        files whose size and sample are shared. Only the links of one
+        inode are held in memory at a time. Hashing starts after the walk, and
+        further hard links are stored with a query at the end.
+        """
+        errors = []
+        with self.profile.measure(PART_WALK):
+            for _ in self.listed_files(errors, replay=False):
+                self.reporter.add_listed()
+                self.profile.count(PART_WALK)
+        self.profile.count(PART_WALK, files=0, errors=len(errors))
+        if not self.is_running:
+            return
+        # A resumed walk lists the files of its checkpoint only once
+        with self.profile.measure(PART_DB):
+            listed = db.listed_count()
+        self.reporter.add_listed(listed - self.reporter.listed_files)
+
+        with self.profile.measure(PART_SAMPLE):
+            self.sample_spilled(db, scheduler)
+        if not self.is_running:
+            return
+        with self.profile.measure(PART_HASH):
+            self.hash_candidates(self.spilled_candidates(db), db,
+                                 scheduler)
+
+    def spilled_files(self, rows, key):
+        """
+        Yield (unique, first, info) for the checkpointed files in rows.
+
+        rows come from DataBase.listed_by_size or listed_by_sample, where
+        the files of one key(row) come together and the links of an inode
+        one after the other. unique tells whether all files of the key
+        are links of one inode, first whether info is the first path of
+        its inode. Only the links of one inode are held back, until the
+        next inode shows that the key is shared, so memory does not grow
+        with the number of files of a size. While a file is passed on,
+        self.cache holds its hash cache entry, so cached_entry works as
+        in a streamed scan.
+        """
+        def passed(files, unique):
+            for first, info in files:
+                yield unique, first, info
+                self.cache.pop(info.path, None)
+
+        self.cache = {}
+        run = inode = marker = object()
+        held = []
+        shared = False
+        for row in self.profile.timed_iter(PART_DB, rows):
+            info = FileInfo(*row[:7])
+            if row[7] is not None:
+                self.cache[info.path] = row[7:15]
+            if key(row) != run:
+                yield from passed(held, not shared)
+                run, inode, held, shared = key(row), marker, [], False
+            first = (info.dev, info.ino) != inode
+            inode = (info.dev, info.ino)
+            if first and held:
+                shared = True
+                yield from passed(held, False)
+                held = []
+            if shared:
+                yield from passed([(first, info)], False)
+            else:
+                held.append((first, info))
+        yield from passed(held, not shared)
+        self.cache = {}
+
+    def sample_spilled(self, db, scheduler):
+        """
+        First pass of scan_spilled.
+
+        Files outside the size limits and files whose size no other inode
+        has are stored as skipped. The files that need a new sample are sampled
+        and the samples are stored in the hash cache for the second pass.
+        """
+        rows = []
+
+        def unsampled():
+            for unique, first, info in self.spilled_files(
+                    db.listed_by_size(), lambda row: row[1]):
+                reason = self.size_skip(info.size)
+                if reason is None and unique and not self.hash_all:
+                    reason = SKIP_UNIQUE_SIZE
+                if reason:
+                    rows.append(self.result_row(info, None, reason))
+                    if len(rows) >= BATCH_SIZE:
+                        self.store(db.insert_many, rows)
+                        rows.clear()
+                elif (first and info.size > 3 * self.sample_size
+                      and not self.hash_all
+                      and not self.cached_sample(info)):
+                    yield info
+
+        cache_rows = []
+        for info, sample in self.sample_files(unsampled(), scheduler):
+            cache_rows.append(self.cache_row(info, sample, None))
+            if len(cache_rows) >= BATCH_SIZE:
+                self.store(db.update_cache, cache_rows)
+                cache_rows = []
+        self.store(db.insert_many, rows)
+        self.store(db.update_cache, cache_rows)
+
+    def spilled_candidates(self, db):
+        """
+        Second pass of scan_spilled: yield (FileInfo, sample) to hash.
+
+        These are the files whose size and sample another inode shares,
+        and shared-size files without a sample. The other files are
+        stored as having a unique sample.
+        """
+        rows = []
+        for unique, _, info in self.spilled_files(
+                db.listed_by_sample(self.sample_size, self.algorithm),
+                lambda row: (row[1], row[15])):
+            if info.size <= 3 * self.sample_size or self.hash_all:
+                yield info, None
+                continue
+            sample = self.cached_sample(info)
+            if sample is None or not unique:
+                yield info, sample
+                continue
+            rows.append(self.result_row(info, None, SKIP_UNIQUE_SAMPLE))
+            self.bytes_saved += info.size
+            if len(rows) >= BATCH_SIZE:
+                self.store(db.insert_many, rows)
+                rows = []
+        self.store(db.insert_many, rows)
+
+    def resumable(self):
+        """Tell whether an unfinished scan of the folders can be resumed."""
+        db = DataBase(self.db_path)
+        run_id = db.resumable_run(os.pathsep.join(self.folder_paths),
+                                  self.algorithm)
+        db.close()
+        return bool(run_id)
+
+    def watch(self, on_scanned=None, interval=POLL_INTERVAL):
+        """
+        Scan, then keep the results current until the scan is stopped.
+
+        The folders are watched with inotify, or walked again every
+        interval seconds where inotify is not available. The watcher is
+        started before the scan, so changes made while the scan runs are
+        applied after it. on_scanned is called once the scan is done.
+        """
+        with open_watcher(self.folder_paths, interval,
+                          self.rules) as watcher:
+            self.run()
+            if on_scanned:
+                on_scanned()
+            if not self.is_running:
+                return
+
+            self.status("Klasörler izleniyor...")
+            for changes in watcher.changes(lambda: self.is_running):
+                if not changes.rescan:
+                    self.update(changes)
+                    continue
+                self.status("Değişiklikler kaçırıldı, yeniden taranıyor...")
+                self.run()
+                if self.on_update:
+                    self.on_update()
+        self.db.close()
+
+    def update(self, changes):
+        """
+        Apply the watcher.Changes of a watch batch to the results.
+
+        Removed files and the files below removed folders are deleted.
+        Changed files are hashed again when another file has their size;
+        files of that size that were stored unhashed because their size
+        or sample was unique are hashed with them. Without another file
+        of the same size, a file is stored as unique without reading it.
+        Folder digests and duplicate groups are brought up to date
+        afterwards, without walking the folders again. Files whose name
+        can not be stored as it is are stored as skipped, see
+        database.stored_path.
+        """
+        started = time.time()
+        db = self.db
+        infos = []
+        bad_names = []
+        deleted = set()
+        for path in changes.deleted:
+            path = stored_path(path)
+            deleted.update(db.files_under(path) or [path])
+        for path in changes.changed:
+            info = self.file_info(path)
+            stored = stored_path(path)
+            if info is None:
+                deleted.add(stored)
+            elif stored != path:
+                bad_names.append(info._replace(path=stored))
+            else:
+                infos.append(info)
+        deleted.difference_update(info.path for info in infos + bad_names)
+        deleted.difference_update(self.db_files)
+        if not (infos or bad_names or deleted):
+            return
+
+        rows = [self.result_row(info, None, SKIP_BAD_NAME)
+                for info in bad_names]
+        sizes = {}
+        for info in infos:
+            reason = self.size_skip(info.size)
+            if reason:
+                rows.append(self.result_row(info, None, reason))
+            else:
+                sizes.setdefault(info.size, []).append(info)
+
+        batch = deleted | {info.path for info in infos}
+        peers = db.size_peers(sizes)
+        candidates = []
+        for size, group in sizes.items():
+            others = [peer for peer in peers.get(size, [])
+                      if peer[0] not in batch]
+            if not others and len(group) == 1 and not self.hash_all:
+                rows.append(self.result_row(group[0], None,
+                                            SKIP_UNIQUE_SIZE))
+                continue
+            candidates.extend(group)
+            for path, root, file_hash_value, reason in others:
+                if reason in (SKIP_UNIQUE_SIZE, SKIP_UNIQUE_SAMPLE):
+                    info = self.file_info(path)
+                    if info is not None:
+                        candidates.append(info)
+                        batch.add(path)
+
+        rows.extend(self.hash_files(candidates, db, batch))
+        hashes = {row[3] for row in rows if row[3]}
+        before = db.group_counts(hashes) if self.on_duplicate else {}
+        db.update_files(rows, deleted)
+        if rows or deleted:
+            self.hash_directories(db)
+            db.ensure_groups()
+
+        if self.on_duplicate:
+            counts = db.group_counts(hashes)
+            seen = set()
+            for file_hash_value in hashes:
+                if counts[file_hash_value] < 2:
+                    continue
+                # The earlier files of a group were reported when they
+                # joined it, unless the group just formed. Further hard
+                # links to a reported inode are not reported.
+                formed = before[file_hash_value] < 2
+                for path, size, dev, ino in db.group_members(
+                        file_hash_value):
+                    key = (file_hash_value, inode_key(path, dev, ino))
+                    if path in batch or key in seen:
+                        continue
+                    seen.add(key)
+                    if formed:
+                        self.on_duplicate(file_hash_value, size, path)
+            for row in rows:
+                key = (row[3], inode_key(row[0], row[6], row[7]))
+                if row[3] and counts[row[3]] > 1 and key not in seen:
+                    seen.add(key)
+                    self.on_duplicate(row[3], row[2], row[0])
+        if self.on_update:
+            self.on_update()
+        self.status(f"{len(infos)} dosya güncellendi, {len(deleted)} dosya "
+                    f"silindi ({time.time() - started:.1f} sn). Klasörler "
+                    f"izleniyor...")
+
+    def file_info(self, path):
+        """
+        Return a FileInfo for a file below one of the folders.
+
+        Returns None for files that are gone, are not regular files or
+        belong to the results database.
+        """
+        if path in self.db_files:
+            return None
+        root = next((root for root in self.folder_paths
+                     if path.startswith(os.path.join(root, ""))), None)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if root is None or not stat.S_ISREG(st.st_mode):
+            return None
+        return FileInfo(path, st.st_size, st.st_dev, st.st_ino,
+                        st.st_mtime_ns, st.st_nlink, root)
+
+    def hash_files(self, infos, db, batch):
+        """
+        Fully hash a few files and return their result rows.
+
+        Used for watch updates: the hash cache is used and updated as in
+        a scan, and with verify every file is compared byte for byte with
+        a file of each label its digest already has. batch holds the
+        paths whose rows are being replaced, they are not compared with.
+        """
+        rows = []
+        cache_rows = []
+        labels = {}
+        jobs = []
+        for info in infos:
+            entry = self.cached_entry(info)
+            if info.size == 0:
+                jobs.append(((info, empty_hash(self.algorithm)), None))
+            elif entry and entry[6]:
+                jobs.append(((info, entry[6]), None))
+            else:
+                jobs.append(((info, None), (info.path, BLOCK_SIZE,
+                                            self.algorithm)))
+
+        with HashPool(self.workers, self.pool_kind) as pool:
+            for (info, cached), file_hash_value in IOScheduler(pool).imap(
+                    file_hash, jobs, lambda key: key[0],
+                    lambda: self.is_running):
+                reason = None
+                if cached:
+                    file_hash_value = cached
+                elif file_hash_value == HASH_ACCESS_DENIED:
+                    file_hash_value, reason = None, SKIP_ACCESS_DENIED
+                elif file_hash_value == HASH_ERROR:
+                    file_hash_value, reason = None, SKIP_READ_ERROR
+                else:
+                    cache_rows.append(self.cache_row(info, None,
+                                                     file_hash_value))
+                    self.cache[info.path] = cache_rows[-1][1:]
+                if file_hash_value and self.verify:
+                    file_hash_value = self.verified_label(
+                        db, file_hash_value, info.path, labels, batch)
+                rows.append(self.result_row(info, file_hash_value, reason))
+
+        db.update_cache(cache_rows)
+        return rows
+
+    def verified_label(self, db, file_hash_value, path, labels, batch):
+        """
+        Return the hash label of a file after a byte for byte check.
+
+        labels maps a digest to (label, path) pairs of files checked
+        before; they are read from the database on first use, skipping
+        the paths in batch. The file gets the label of the first file it
+        is equal to, or a new label.
+        """
+        if file_hash_value not in labels:
+            labels[file_hash_value] = []
+            for label in db.hash_labels(file_hash_value):
+                for name, other, size in db.group_files(label):
+                    if other not in batch:
+                        labels[file_hash_value].append((label, other))
+                        break
+
+        known = labels[file_hash_value]
+        for label, other in known:
+            if split_identical([other, path]) == [[other, path]]:
+                return label
+        used = {label for label, other in known}
+        label, number = file_hash_value, 0
+        while label in used:
+            number += 1
+            label = f"{file_hash_value}#{number}"
+        known.append((label, path))
+        return label
+
+    def run_record(self, db):
+        """Build the scan_runs row of this run from the profile."""
+        stages = self.profile.stages()
+        return {
+            "started": self.profile.started,
+            "seconds": time.time() - self.profile.started,
+            "roots": os.pathsep.join(self.folder_paths),
+            "algorithm": self.algorithm,
+            "workers": self.workers,
+            "pool": self.pool_kind,
+            "files": self.reporter.listed_files,
+            "bytes": sum(part["bytes"] for part in stages.values()),
+            "duplicates": db.duplicate_count(),
+            "errors": sum(part["errors"] for part in stages.values()),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "status": RUN_COMPLETED if self.is_running else RUN_STOPPED,
+            "stages": stages,
+        }
+
+    def store(self, write, rows):
+        """Pass rows to a database write method, timed as database work."""
+        with self.profile.measure(PART_DB):
+            write(rows)
+        self.profile.count(PART_DB, len(rows))
+
+    def stop(self):
+        """Ask the running scan to stop as soon as possible."""
+        self.is_running = False
+
+    def status(self, text):
+        """Pass a status message to the on_status callback."""
+        if self.on_status:
+            self.on_status(text)
+
+    def report_progress(self, snapshot):
+        """Pass a progress snapshot to the on_progress callback."""
+        if self.on_progress:
+            self.on_progress(snapshot)
+
+    def found_duplicate(self, file_hash_value, info):
+        """
+        Report a file whose hash was seen before.
+
+        The first file of a hash is reported together with the second.
+        """
+        first = self.found_hashes.get(file_hash_value)
+        if first is None and file_hash_value not in self.found_hashes:
+            self.found_hashes[file_hash_value] = info
+            return
+
+        if first is not None:
+            self.found_hashes[file_hash_value] = None
+            self.on_duplicate(file_hash_value, first.size, first.path)
+        self.on_duplicate(file_hash_value, info.size, info.path)
+
+    def walk_files(self, unseen, checkpoint=True):
+        """
+        Yield a FileInfo for every file under the folders.
+
+        See walker.walk_roots, folders on different devices are listed at
+        the same time. Paths that are found are removed from unseen. Files
+        outside the size limits are written to the database as skipped.
+        Without checkpoint the walk is not checkpointed, see listed_files.
+        """
+        errors = []
+        for info in self.listed_files(errors, checkpoint=checkpoint):
+            unseen.discard(info.path)
+            self.reporter.add_listed()
+            self.profile.count(PART_WALK)
+            reason = self.size_skip(info.size)
+            if reason:
+                self.store(self.db.insert_many,
+                           [self.result_row(info, None, reason)])
+                continue
+            yield info
+        self.profile.count(PART_WALK, files=0, errors=len(errors))
+
+    def listed_files(self, errors, replay=True, checkpoint=True):
+        """
+        Yield the files of the walk and checkpoint it on the way.
+
+        When a scan is resumed, the files of its checkpoint come first
+        and the walk goes on from the checkpointed folders; files that
+        were listed before are not passed on twice. Without replay the
+        files of the checkpoint are not passed on at all. Every Frontier
+        of the walk is stored together with the files listed since the
+        last one, and at most CHECKPOINT_FILES files are kept in between.
+        The files of the results database are left out. A file whose name
+        can not be stored as it is, see database.stored_path, is stored
+        as skipped under its escaped path and not passed on. Without
+        checkpoint nothing is stored of the walk itself; the benchmark
+        times the walk that way.
+        """
+        seen = set()
+        if self.frontiers and replay:
+            for row in self.db.listed_files():
+                seen.add(row[0])
+                yield FileInfo(*row)
+
+        listed = []
+        for item in walk_roots(self.folder_paths, lambda: self.is_running,
+                               errors, self.frontiers,
+                               CHECKPOINT_SECONDS if checkpoint else None,
+                               self.rules):
+            if isinstance(item, Frontier):
+                with self.profile.measure(PART_DB):
+                    self.db.save_checkpoint(self.run_id, listed, item.root,
+                                            item.folders)
+                listed = []
+            elif item.path not in seen and item.path not in self.db_files:
+                path = stored_path(item.path)
+                if path != item.path:
+                    error = "dosya adı UTF-8 değil"
+                    self.status(f"HATA: ({path}): {error}")
+                    errors.append((path, error))
+                    self.store(self.db.insert_many, [self.result_row(
+                        item._replace(path=path), None, SKIP_BAD_NAME)])
+                    continue
+                if checkpoint:
+                    listed.append(item)
+                if len(listed) >= CHECKPOINT_FILES:
+                    with self.profile.measure(PART_DB):
+                        self.db.save_checkpoint(self.run_id, listed)
+                    listed = []
+                yield item
+
+    def collapse_hardlinks(self, files):
+        """
+        Pass on only the first path of every inode.
+
+        Further hard links to an inode that was already seen are kept in
+        links and added with the same result once the scan is done, so
+        every inode is hashed only once.
+        """
+        for info in files:
+            if info.nlink > 1:
+                key = (info.dev, info.ino)
+                if key in self.links:
+                    self.links[key].append(info)
+                    continue
+                self.links[key] = []
+            yield info
+
+    def add_hardlinks(self, db):
+        """
+        Store the extra hard links with the result of their inode.
+
+        The results are looked up before any link is stored, so the
+        lookups do not flush a transaction each.
+        """
+        rows = []
+        for (dev, ino), infos in self.links.items():
+            if not infos:
+                continue
+            row = db.inode_result(dev, ino)
+            if row is None:
+                continue
+            file_hash_value, reason = row
+            rows.extend(self.result_row(info, file_hash_value, reason)
+                        for info in infos)
+        db.insert_many(rows)
+
+    def size_skip(self, size):
+        """Return the skip reason of a size outside the size limits."""
+        if size < self.min_size:
+            return SKIP_TOO_SMALL
+        if self.max_size is not None and size > self.max_size:
+            return SKIP_TOO_LARGE
+        return None
+
+    def result_row(self, info, file_hash_value, reason=None):
+        """Build a TBL_RESULTS row for the database."""
+        return (info.path, os.path.basename(info.path), info.size,
+                file_hash_value, reason, file_hash_value and self.algorithm,
+                info.dev, info.ino, info.root, self.run_id, info.mtime_ns)
+
+    def cached_entry(self, info):
+        """
+        Return the cache entry of a file if the file did not change.
+
+        Entries made with another hash algorithm are not used.
+        """
+        entry = self.cache.get(info.path)
+        if (entry and entry[:4] == (info.dev, info.ino, info.size,
+                                    info.mtime_ns)
+                and entry[7] == self.algorithm):
+            return entry
+        return None
+
+    def cache_row(self, info, sample, file_hash_value):
+        """Build a hash cache row for the database."""
+        return (info.path, info.dev, info.ino, info.size, info.mtime_ns,
+                self.sample_size, sample, file_hash_value, self.algorithm)
+
+    def cached_sample(self, info):
+        """Return the cached sample of a file if the file did not change."""
+        entry = self.cached_entry(info)
+        if entry and entry[4] == self.sample_size:
+            return entry[5]
+        return None
+
+    def sample_files(self, files, scheduler):
+        """
+        Yield (FileInfo, sample) with the samples of files.
+
+        The samples are read through the iosched.IOScheduler, or taken
+        from the hash cache. Files that are too small to sample, or can
+        not be read, get the sample None.
+        """
+        def jobs():
+            for info in files:
+                sample = self.cached_sample(info)
+                if info.size <= 3 * self.sample_size:
+                    yield (info, None), None
+                elif sample:
+                    yield (info, sample), None
+                else:
+                    yield (info, None), (info.path, info.size,
+                                         self.sample_size, self.algorithm)
+
+        for (info, cached), sample in scheduler.imap(
+                sample_hash, jobs(), lambda key: key[0],
+                lambda: self.is_running):
+            if not cached and info.size > 3 * self.sample_size:
+                self.profile.count(PART_SAMPLE, size=3 * self.sample_size,
+                                   errors=sample is None)
+            yield info, cached or sample
+
+    def filter_by_sample(self, candidates, scheduler, singletons):
+        """
+        Drop same-size files whose head, middle and tail samples differ.
+
+        Yields (FileInfo, sample) for the files that still may have a
+        duplicate, see sample_files. Files that are too small to sample
+        or can not be read are passed on as they are. Dropped files are
+        appended to singletons as (FileInfo, sample).
+        """
+        # Files that were never sampled always pass the filter
+        yield from release_collisions(
+            self.sample_files(candidates, scheduler),
+            lambda pair: pair[1] and (pair[0].size, pair[1]), singletons)
+
+    def hash_candidates(self, candidates, db, scheduler):
+        """
+        Fully hash the candidates through the iosched.IOScheduler.
+
+        Unchanged files reuse the digest from the hash cache and empty
+        files get the digest of no data, neither is read. Every device is
+        read in the order of the files on it; results are written to the
+        database in batches as they arrive.
+        """
+        empty = empty_hash(self.algorithm)
+
+        def jobs():
+            for info, sample in candidates:
+                self.reporter.add_total(info.size)
+                entry = self.cached_entry(info)
+                if info.size == 0:
+                    yield (info, sample, empty), None
+                elif entry and entry[6]:
+                    self.cache_hits += 1
+                    yield (info, sample, entry[6]), None
+                else:
+                    self.cache_misses += 1
+                    yield (info, sample, None), (info.path, BLOCK_SIZE,
+                                                 self.algorithm)
+
+        rows = []
+        cache_rows = []
+        self.reporter.set_stage(STAGE_HASH)
+
+        for (info, sample, cached), file_hash_value in scheduler.imap(
+                file_hash, jobs(), lambda key: key[0],
+                lambda: self.is_running):
+            file_name = os.path.basename(info.path)
+
+            reason = None
+            if cached:
+                file_hash_value = cached
+            elif file_hash_value == HASH_ACCESS_DENIED:
+                file_hash_value, reason = None, SKIP_ACCESS_DENIED
+            elif file_hash_value == HASH_ERROR:
+                file_hash_value, reason = None, SKIP_READ_ERROR
+            else:
+                cache_rows.append(self.cache_row(info, sample,
+                                                 file_hash_value))
+            if not cached:
+                self.profile.count(PART_HASH, size=info.size,
+                                   errors=reason is not None)
+            rows.append(self.result_row(info, file_hash_value, reason))
+
+            if len(rows) >= BATCH_SIZE:
+                self.store(db.insert_many, rows)
+                self.store(db.update_cache, cache_rows)
+                rows = []
+                cache_rows = []
+
+            if (file_hash_value and self.on_duplicate and not self.verify
+                    and not self.memory_budget):
+                self.found_duplicate(file_hash_value, info)
+            self.reporter.add_done(info.size, file_name)
+
+        self.store(db.insert_many, rows)
+        self.store(db.update_cache, cache_rows)
+
+    def verify_duplicates(self, db):
+        """
+        Compare the files of every duplicate group byte for byte.
+
+        This makes a fast non-cryptographic hash safe to delete by: files
+        that only share a digest get their own hash label. The groups are
+        read from the database one at a time. Empty files are all equal,
+        they are not compared.
+        """
+        files, size = db.duplicate_totals()
+        self.reporter.add_total(size, files)
+
+        rows = []
+        for file_hash_value, group in itertools.groupby(
+                db.duplicate_files(), lambda row: row[1]):
+            group = list(group)
+            paths = [path for name, _, path, size in group]
+            size = group[0][3]
+            groups = [paths]
+            if size:
+                groups = split_identical(paths, lambda: self.is_running)
+            self.reporter.add_done(size * len(paths),
+                                   os.path.basename(paths[0]), len(paths))
+            self.profile.count(PART_VERIFY, len(paths), size * len(paths))
+            for number, same in enumerate(groups):
+                label = file_hash_value
+                if number > 0:
+                    label = f"{file_hash_value}#{number}"
+                rows.extend((label, path) for path in same)
+            if len(rows) >= BATCH_SIZE:
+                self.store(db.update_verified, rows)
+                rows = []
+
+        self.store(db.update_verified, rows)
+
+        # Duplicates are only reported once they are confirmed
+        if self.on_duplicate:
+            self.report_duplicates(db)
+
+    def report_duplicates(self, db):
+        """
+        Pass every duplicate file in the database to on_duplicate.
+
+        As in a streamed scan, only one path of every inode is passed,
+        further hard links to it are not duplicates of their own.
+        """
+        for file_hash_value, path, size, _ in db.duplicate_inodes():
+            self.on_duplicate(file_hash_value, size, path)
+
+    def hash_directories(self, db):
+        """
+        Give every folder a digest built from the digests of its files.
+
+        This runs once the file digests are final, in one pass over the
+        results sorted by path. Folders with equal digests hold the same
+        files under the same names and are shown as one folder group.
+        """
+        count = db.replace_dirs(directory_digests(db.file_digests()))
+        self.profile.count(PART_DIRS, count)
+
+    def calculate_sample_hash(self, file_path, file_size):
+        """Hash the head, middle and tail samples of a file."""
+        return sample_hash(file_path, file_size, self.sample_size,
+                           self.algorithm)
+
+    def calculate_hash(self, file_path, block_size=BLOCK_SIZE):
+        """Hash the whole file, see hasher.file_hash."""
+        return file_hash(file_path, block_size, self.algorithm)
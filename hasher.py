@@ -0,0 +1,257 @@
+"""Hashing Functions and Worker Pool Module."""
+import os
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import (Future, ThreadPoolExecutor,
+                                ProcessPoolExecutor)
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Values returned instead of a digest when a file can not be hashed
+HASH_ACCESS_DENIED = "ACCESS_DENIED"
+HASH_ERROR = "ERROR"
+
+POOL_THREAD = "thread"
+POOL_PROCESS = "process"
+
+# Digest backends by name; the xxHash ones need the xxhash package
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+if xxhash is not None:
+    ALGORITHMS["xxh64"] = xxhash.xxh64
+    ALGORITHMS["xxh128"] = xxhash.xxh3_128
+DEFAULT_ALGORITHM = "sha256"
+
+# Backends that are safe to delete by without a byte-for-byte check
+CRYPTOGRAPHIC_ALGORITHMS = ("sha256", "blake2b")
+
+# Read sizes by file size: (largest file size, block size)
+BLOCK_SIZES = (
+    (1024 * 1024, 64 * 1024),
+    (64 * 1024 * 1024, 256 * 1024),
+    (float("inf"), 1024 * 1024),
+)
+
+# Drop hashed pages from the page cache every DROP_INTERVAL bytes
+DROP_BEHIND = True
+DROP_INTERVAL = 16 * 1024 * 1024
+
+POSIX_FADV_SEQUENTIAL = getattr(os, "POSIX_FADV_SEQUENTIAL", 2)
+POSIX_FADV_DONTNEED = getattr(os, "POSIX_FADV_DONTNEED", 4)
+
+# Read buffers of the current thread, by block size
+thread_buffers = threading.local()
+
+
+def choose_block_size(file_size):
+    """Pick a read size that suits the file: small files, small reads."""
+    for limit, block_size in BLOCK_SIZES:
+        if file_size <= limit:
+            return block_size
+    return BLOCK_SIZES[-1][1]
+
+
+def read_buffer(block_size):
+    """
+    Return this thread's reusable read buffer of block_size bytes.
+
+    The buffer is kept between files, so hashing does not allocate a new
+    bytes object for every block.
+    """
+    buffers = getattr(thread_buffers, "buffers", None)
+    if buffers is None:
+        buffers = thread_buffers.buffers = {}
+    if block_size not in buffers:
+        buffers[block_size] = memoryview(bytearray(block_size))
+    return buffers[block_size]
+
+
+def advise(fd, offset, length, advice):
+    """Give the kernel a page cache hint, where the OS supports it."""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def hash_with_readinto(f, digest, block_size):
+    """Feed a file to digest through one reused buffer."""
+    buffer = read_buffer(block_size)
+    fd = f.fileno()
+    done = 0
+    dropped = 0
+    while True:
+        count = f.readinto(buffer)
+        if not count:
+            break
+        digest.update(buffer[:count])
+        done += count
+        if DROP_BEHIND and done - dropped >= DROP_INTERVAL:
+            advise(fd, dropped, done - dropped, POSIX_FADV_DONTNEED)
+            dropped = done
+    if DROP_BEHIND:
+        advise(fd, dropped, 0, POSIX_FADV_DONTNEED)
+
+
+def file_hash(file_path, block_size=None, algorithm=DEFAULT_ALGORITHM):
+    """
+    Block-by-block reading to read large files without bloating RAM.
+
+    block_size is picked from the file size when it is None.
+    algorithm is a key of ALGORITHMS.
+    Every file is read into a reused buffer. Files are not mapped: a
+    mapped file that another process truncates while it is hashed kills
+    the process with SIGBUS, while a read just ends early. The kernel is
+    told that the file is read sequentially and, with DROP_BEHIND, that
+    the pages read can be dropped, so a full scan does not push other
+    programs out of the page cache.
+    """
+    digest = ALGORITHMS[algorithm]()
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if block_size is None:
+                block_size = choose_block_size(file_size)
+            advise(f.fileno(), 0, 0, POSIX_FADV_SEQUENTIAL)
+            hash_with_readinto(f, digest, block_size)
+        return digest.hexdigest()
+    except PermissionError:
+        return HASH_ACCESS_DENIED
+    except Exception:
+        return HASH_ERROR
+
+
+def empty_hash(algorithm=DEFAULT_ALGORITHM):
+    """Return the digest of an empty file, which needs no read."""
+    return ALGORITHMS[algorithm]().hexdigest()
+
+
+def sample_hash(file_path, file_size, sample_size,
+                algorithm=DEFAULT_ALGORITHM):
+    """
+    Hash sample_size bytes from the head, middle and tail of a file.
+
+    Returns None if the file can not be read.
+    """
+    digest = ALGORITHMS[algorithm]()
+    offsets = (0, (file_size - sample_size) // 2, file_size - sample_size)
+    try:
+        with open(file_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(sample_size))
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def files_equal(first_path, second_path, block_size=65536):
+    """
+    Compare two files byte for byte.
+
+    Files that can not be read are never equal.
+    """
+    try:
+        with open(first_path, 'rb') as first, \
+                open(second_path, 'rb') as second:
+            while True:
+                first_data = first.read(block_size)
+                if first_data != second.read(block_size):
+                    return False
+                if not first_data:
+                    return True
+    except OSError:
+        return False
+
+
+def split_identical(paths, is_running=lambda: True):
+    """
+    Split files with the same digest into groups of identical content.
+
+    Every file is compared with the first file of each group found so far.
+    Returns a list of path lists.
+    """
+    groups = []
+    for path in paths:
+        if not is_running():
+            break
+
+        for group in groups:
+            if files_equal(group[0], path):
+                group.append(path)
+                break
+        else:
+            groups.append([path])
+
+    return groups
+
+
+class HashPool:
+    """
+    Runs hash functions on a pool of threads or processes.
+
+    hashlib releases the GIL while hashing large buffers, so threads are
+    usually enough; processes can be chosen for many small files.
+    Use it as a context manager so the workers are shut down at the end.
+    """
+
+    def __init__(self, workers=None, kind=POOL_THREAD):
+        """Store the pool settings, the pool is created on enter."""
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.kind = kind
+        self.executor = None
+
+    def __enter__(self):
+        """Start the worker pool."""
+        if self.kind == POOL_PROCESS:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the workers, dropping the jobs that did not start yet."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+
+    def imap(self, func, jobs, is_running=lambda: True):
+        """
+        Run func for each (key, args) job and yield (key, result).
+
+        Results are yielded in the same order as the jobs. Only a few jobs
+        per worker are queued at a time, so jobs may be a lazy iterator.
+        Jobs with args None need no work and yield (key, None) in turn.
+        Stops early when is_running() returns False.
+        """
+        window = self.workers * 4
+        pending = deque()
+        jobs = iter(jobs)
+
+        while True:
+            while len(pending) < window and is_running():
+                job = next(jobs, None)
+                if job is None:
+                    break
+                key, args = job
+                if args is None:
+                    future = Future()
+                    future.set_result(None)
+                else:
+                    future = self.executor.submit(func, *args)
+                pending.append((key, future))
+
+            if not pending or not is_running():
+                break
+
+            key, future = pending.popleft()
+            yield key, future.result()
+
+        for _, future in pending:
+            future.cancel()
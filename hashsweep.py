@@ -0,0 +1,238 @@
+"""Command Line Module.
+
+Runs a scan without the GUI and without importing Qt:
+
+    python -m hashsweep /data /backup --workers 8 --format csv
+
+All folders are scanned together. With --compare only the files of one
+folder are written, for example the files of /data that already have a
+copy under /backup:
+
+    python -m hashsweep /data /backup --compare /data /backup
+
+With --watch the folders are watched after the scan and files that
+join a duplicate group later are written too, until Ctrl+C.
+
+With --manifest the scanned files are also written to a manifest that
+can be merged with the manifests of other nodes, see manifest.py:
+
+    python -m hashsweep /data --hash-all --manifest node1.hsm
+
+--rules reads the include and exclude rules and size limits saved by
+the GUI, see rules.py; --include, --exclude and the size options add to
+them:
+
+    python -m hashsweep /data --rules scan_rules.json --exclude build
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+from database import DataBase, CROSS_MODES, CROSS_IN_OTHER
+from engine import ScanEngine, progress_text, DEFAULT_SAMPLE_SIZE
+from hasher import ALGORITHMS, DEFAULT_ALGORITHM, POOL_THREAD, POOL_PROCESS
+from manifest import export_manifest
+from profiling import cprofile_hook, format_run
+from rules import ScanRules, load_rules, parse_size, rules_from_settings
+
+
+class DuplicateWriter:
+    """Writes every file that joins a duplicate group as NDJSON or CSV."""
+
+    def __init__(self, stream, output_format):
+        """Prepare the output stream, CSV output starts with a header."""
+        self.stream = stream
+        self.output_format = output_format
+        self.csv_writer = None
+        if output_format == "csv":
+            self.csv_writer = csv.writer(stream)
+            self.csv_writer.writerow(["hash", "size", "path"])
+
+    def write(self, file_hash, size, path):
+        """Write one duplicate file and flush, so readers see it at once."""
+        if self.csv_writer:
+            self.csv_writer.writerow([file_hash, size, path])
+        else:
+            self.stream.write(json.dumps({"hash": file_hash, "size": size,
+                                          "path": path}) + "\n")
+        self.stream.flush()
+
+
+def parse_args(argv=None):
+    """Read the command line options."""
+    parser = argparse.ArgumentParser(
+        prog="hashsweep",
+        description="Find duplicate files and stream them as they are "
+                    "found.")
+    parser.add_argument("paths", nargs="+", help="folders to scan")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of hashing workers")
+    parser.add_argument("--pool", choices=[POOL_THREAD, POOL_PROCESS],
+                        default=POOL_THREAD, help="kind of worker pool")
+    parser.add_argument("-a", "--algorithm", choices=sorted(ALGORITHMS),
+                        default=DEFAULT_ALGORITHM, help="digest backend")
+    parser.add_argument("--verify", action=argparse.BooleanOptionalAction,
+                        default=None,
+                        help="compare duplicates byte for byte (default: "
+                             "only for non-cryptographic algorithms)")
+    parser.add_argument("--min-size", type=parse_size, default=None,
+                        help="skip files smaller than this size, like 4K "
+                             "(default: 0, or the one of --rules)")
+    parser.add_argument("--max-size", type=parse_size, default=None,
+                        help="skip files larger than this size, like 2G")
+    parser.add_argument("--rules", metavar="FILE", default=None,
+                        help="read include and exclude rules and size "
+                             "limits from a rules file saved by the GUI")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                        default=None,
+                        help="only scan files that match the glob, or the "
+                             "regular expression after re:; can be given "
+                             "more than once")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                        default=None,
+                        help="skip files and whole folders that match the "
+                             "glob or re: regular expression, like "
+                             "node_modules; can be given more than once")
+    parser.add_argument("--hidden", action="store_true",
+                        help="also scan hidden files and folders")
+    parser.add_argument("--sample-size", type=int,
+                        default=DEFAULT_SAMPLE_SIZE,
+                        help="bytes sampled from head, middle and tail")
+    parser.add_argument("-f", "--format", choices=["ndjson", "csv"],
+                        default="ndjson", help="output format")
+    parser.add_argument("-o", "--output", default="-",
+                        help="output file (default: stdout)")
+    parser.add_argument("--db", default="./results.db",
+                        help="results database")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="do not print progress to stderr")
+    parser.add_argument("--compare", nargs="+", metavar="ROOT",
+                        default=None,
+                        help="after the scan, only write the files of the "
+                             "first root compared with the second one "
+                             "(default: all other roots)")
+    parser.add_argument("--mode", choices=CROSS_MODES,
+                        default=CROSS_IN_OTHER,
+                        help="with --compare: files that have a copy in "
+                             "the other root, files that are missing "
+                             "there, or duplicates within the root")
+    parser.add_argument("--report", action="store_true",
+                        help="print where the time went to stderr")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="run the scan under cProfile and save the "
+                             "stats to FILE")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue a stopped or crashed scan of the "
+                             "same folders from its checkpoint")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep watching the folders after the scan "
+                             "and update the results as files change")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        default=None,
+                        help="keep the file list in the database instead "
+                             "of in memory and let SQLite use about MB "
+                             "megabytes; for trees with millions of files")
+    parser.add_argument("--hash-all", action="store_true",
+                        help="also hash files with a unique size, so "
+                             "every file has a digest in the manifest")
+    parser.add_argument("--manifest", metavar="FILE", default=None,
+                        help="write the scanned files to a manifest after "
+                             "the scan")
+    parser.add_argument("--node", default=None,
+                        help="node name stored in the manifest, the host "
+                             "name by default")
+    args = parser.parse_args(argv)
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two roots")
+    if args.compare and args.watch:
+        parser.error("--watch can not be used with --compare")
+    if args.manifest and args.watch:
+        parser.error("--manifest can not be used with --watch")
+    try:
+        args.scan_rules = scan_rules(args)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    return args
+
+
+def scan_rules(args):
+    """
+    Build the rules.ScanRules of a scan from the command line options.
+
+    The options add to the rules read from --rules: patterns are
+    appended, the size limits and --hidden replace the ones of the file.
+    Raises OSError or ValueError for a bad rules file or pattern.
+    """
+    rules = load_rules(args.rules) if args.rules else ScanRules()
+    settings = rules.settings()
+    settings["include"] += args.include or []
+    settings["exclude"] += args.exclude or []
+    if args.min_size is not None:
+        settings["min_size"] = args.min_size
+    if args.max_size is not None:
+        settings["max_size"] = args.max_size
+    if args.hidden:
+        settings["skip_hidden"] = False
+    return rules_from_settings(settings)
+
+
+def main(argv=None):
+    """Run a scan with the command line options."""
+    args = parse_args(argv)
+
+    if args.output == "-":
+        stream = sys.stdout
+    else:
+        stream = open(args.output, "w", newline="", encoding="utf-8")
+    writer = DuplicateWriter(stream, args.format)
+
+    def show_progress(snapshot):
+        sys.stderr.write("\r" + progress_text(snapshot)[:120].ljust(120))
+        sys.stderr.flush()
+
+    def show_status(text):
+        sys.stderr.write("\n" + text + "\n")
+
+    profile_hook = None
+    if args.profile:
+        profile_hook = functools.partial(cprofile_hook, args.profile)
+
+    engine = ScanEngine(args.paths, args.sample_size, args.workers,
+                        args.pool, args.algorithm, args.verify,
+                        db_path=args.db,
+                        on_progress=None if args.quiet else show_progress,
+                        on_status=None if args.quiet else show_status,
+                        on_duplicate=None if args.compare else writer.write,
+                        profile_hook=profile_hook, resume=args.resume,
+                        memory_budget=args.memory_budget
+                        and args.memory_budget * 1024 * 1024,
+                        hash_all=args.hash_all, rules=args.scan_rules)
+    try:
+        if args.watch:
+            engine.watch()
+        else:
+            engine.run()
+        if args.manifest and engine.is_running:
+            export_manifest(DataBase(args.db), args.manifest, args.node)
+        if args.compare:
+            roots = [os.path.abspath(root) for root in args.compare]
+            for name, file_hash, path, size in DataBase(
+                    args.db).cross_root_files(args.mode, *roots):
+                writer.write(file_hash, size, path)
+    except KeyboardInterrupt:
+        engine.stop()
+        return 130
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    if args.report:
+        for run in DataBase(args.db).runs(1):
+            sys.stderr.write(format_run(run) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""Device-Aware Read Scheduling Module."""
+import bisect
+import functools
+import itertools
+import os
+import struct
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Kinds of devices files are read from
+DEVICE_HDD = "hdd"
+DEVICE_SSD = "ssd"
+DEVICE_UNKNOWN = "unknown"
+
+# Reads in flight per device kind; None means one per pool worker. A
+# spinning disk reads fastest when it is not made to seek between files
+QUEUE_DEPTHS = {DEVICE_HDD: 1, DEVICE_SSD: None, DEVICE_UNKNOWN: None}
+
+# Jobs taken ahead of the reads, so the reads of a device can be sorted
+REORDER_WINDOW = 4096
+
+# ioctl request that maps the extents of a file to the disk (Linux)
+FS_IOC_FIEMAP = 0xC020660B
+
+# struct fiemap, followed by room for one struct fiemap_extent
+FIEMAP = struct.Struct("QQIIII")
+FIEMAP_EXTENT = struct.Struct("QQQQQIIII")
+
+
+@functools.lru_cache(maxsize=None)
+def disk_of(dev):
+    """
+    Return (disk, kind) for a device number, from sysfs (Linux).
+
+    Partitions are mapped to the disk they are on, so partitions of one
+    spinning disk share its queue. kind is DEVICE_HDD or DEVICE_SSD from
+    the rotational flag of the disk. Devices that are not block devices,
+    like network and memory file systems, are DEVICE_UNKNOWN.
+    """
+    try:
+        path = os.path.realpath(f"/sys/dev/block/{os.major(dev)}:"
+                                f"{os.minor(dev)}")
+    except (AttributeError, ValueError):
+        return dev, DEVICE_UNKNOWN
+    if os.path.exists(os.path.join(path, "partition")):
+        path = os.path.dirname(path)
+    try:
+        with open(os.path.join(path, "queue", "rotational")) as flag:
+            rotational = flag.read().strip() == "1"
+    except OSError:
+        return dev, DEVICE_UNKNOWN
+    return path, DEVICE_HDD if rotational else DEVICE_SSD
+
+
+def first_extent(path):
+    """
+    Return where the data of a file starts on its disk, in bytes.
+
+    Uses the FIEMAP ioctl. Returns None for files without extents, like
+    empty files; raises OSError where FIEMAP is not supported.
+    """
+    if fcntl is None:
+        raise OSError("FIEMAP desteklenmiyor")
+    request = bytearray(FIEMAP.size + FIEMAP_EXTENT.size)
+    FIEMAP.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    finally:
+        os.close(fd)
+    if not FIEMAP.unpack_from(request)[3]:
+        return None
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP.size)[1]
+
+
+class Device:
+    """A disk the scan reads from, with its read slots."""
+
+    def __init__(self, kind, depth):
+        """Allow depth reads at a time; extents are used on spinning disks."""
+        self.kind = kind
+        self.slots = threading.BoundedSemaphore(depth)
+        self.use_extents = kind == DEVICE_HDD
+
+    def position(self, info):
+        """
+        Return the sort key of a file on the disk.
+
+        That is the start of its data where FIEMAP works on a spinning
+        disk, otherwise the inode number; most file systems keep the
+        data of files with near inode numbers near each other. Order does
+        not matter on other devices, they use the inode number too.
+        """
+        if self.use_extents:
+            try:
+                return first_extent(info.path) or 0
+            except OSError:
+                self.use_extents = False
+        return info.ino
+
+
+class ReadQueue:
+    """
+    The reads waiting for one device, served in one sweep over the disk.
+
+    The next read is the one at or after the position of the last read;
+    after the last one the sweep starts over at the lowest position.
+    """
+
+    def __init__(self):
+        """Start with no reads at position 0."""
+        self.pending = []
+        self.position = 0
+
+    def add(self, position, order, key, args):
+        """Add a read; order makes equal positions keep their order."""
+        bisect.insort(self.pending, (position, order, key, args))
+
+    def pop(self):
+        """Return (key, args) of the next read of the sweep."""
+        index = bisect.bisect_left(self.pending, (self.position,))
+        if index == len(self.pending):
+            index = 0
+        self.position, _, key, args = self.pending.pop(index)
+        return key, args
+
+
+class IOScheduler:
+    """
+    Runs file reads on a HashPool in a good order for every device.
+
+    Reads are queued per disk and sorted by where the files are on it.
+    Every disk has its own number of read slots, a few on spinning
+    disks and one per worker elsewhere, so a scan over mixed storage
+    keeps every disk busy without making the slow ones seek. The slots
+    are shared by all imap calls of a scheduler, so the sample and the
+    hash stage of a scan do not read from a spinning disk at once.
+    """
+
+    def __init__(self, pool):
+        """Use the workers of a started HashPool."""
+        self.pool = pool
+        self.devices = {}
+
+    def device(self, dev):
+        """Return the Device of a device number."""
+        disk, kind = disk_of(dev)
+        device = self.devices.get(disk)
+        if device is None:
+            depth = QUEUE_DEPTHS[kind] or self.pool.workers
+            device = self.devices[disk] = Device(kind, depth)
+        return device
+
+    def imap(self, func, jobs, locate, is_running=lambda: True):
+        """
+        Run func for each (key, args) job and yield (key, result).
+
+        locate(key) returns the walker.FileInfo of the file a job reads.
+        Results are yielded as the reads finish, not in job order. Up to
+        REORDER_WINDOW jobs are taken ahead, so jobs may be a lazy
+        iterator. A job whose device has a free slot starts at once; only
+        jobs that have to wait are sorted, so the position of a file is
+        only looked up when the device is busy. Jobs with args None need
+        no work and yield (key, None) right away. Stops early when
+        is_running() returns False.
+        """
+        jobs = iter(jobs)
+        queues = {}
+        running = {}
+        waiting = 0
+        more = True
+        order = itertools.count()
+
+        def submit(device, key, args):
+            future = self.pool.executor.submit(func, *args)
+            future.add_done_callback(
+                lambda _, slots=device.slots: slots.release())
+            running[future] = key
+
+        def start(device, queue, timeout=None):
+            started = 0
+            while queue.pending and device.slots.acquire(
+                    timeout is not None, timeout):
+                timeout = None
+                submit(device, *queue.pop())
+                started += 1
+            return started
+
+        while is_running():
+            while more and waiting + len(running) < REORDER_WINDOW:
+                if any(future.done() for future in running):
+                    break
+                job = next(jobs, None)
+                if job is None:
+                    more = False
+                    break
+                key, args = job
+                if args is None:
+                    yield key, None
+                    continue
+                info = locate(key)
+                device = self.device(info.dev)
+                queue = queues.setdefault(device, ReadQueue())
+                if not queue.pending and device.slots.acquire(False):
+                    submit(device, key, args)
+                    continue
+                queue.add(device.position(info), next(order), key, args)
+                waiting += 1
+
+            for device, queue in queues.items():
+                waiting -= start(device, queue)
+
+            if not running:
+                if not waiting:
+                    break
+                # The slots are taken by the reads of another stage
+                for device, queue in queues.items():
+                    if queue.pending:
+                        waiting -= start(device, queue, 0.1)
+                        break
+                continue
+
+            done, _ = wait(running, timeout=0.1,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+
+        for future in running:
+            future.cancel()
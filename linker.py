@@ -0,0 +1,41 @@
+"""Background File Linking Module."""
+from PyQt6.QtCore import QThread, pyqtSignal
+from dedupe import LINK_HARD, link_groups
+
+
+class Linker(QThread):
+    """
+    Replaces duplicates with links on a thread so the interface does not
+    freeze.
+
+    The work is done by dedupe.link_groups, which checks every file
+    against its scan before it is replaced; progress is the number of
+    files handled so far. The new inode numbers are stored when done.
+    """
+
+    progress_signal = pyqtSignal(int)
+    finished_signal = pyqtSignal(list, list)
+
+    def __init__(self, groups, db, mode=LINK_HARD):
+        """Store the (keep_path, [target_paths]) groups and link mode."""
+        super().__init__()
+        self.groups = list(groups)
+        self.db = db
+        self.mode = mode
+        self.is_running = True
+
+    def run(self):
+        """Link the files, then send the linked rows and failures."""
+        paths = [path for keep_path, targets in self.groups
+                 for path in [keep_path] + targets]
+        linked, failures = link_groups(self.groups,
+                                       self.db.file_states(paths),
+                                       self.mode, self.progress_signal.emit,
+                                       lambda: self.is_running)
+        self.db.update_inodes(linked)
+        self.db.close()
+        self.finished_signal.emit(linked, failures)
+
+    def stop(self):
+        """Stop after the current file."""
+        self.is_running = False
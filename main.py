@@ -1,12 +1,25 @@
 """Main Application Module."""
+import functools
 import os
+import time
+from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QFileDialog,
-                             QMessageBox, QTableWidgetItem, QHeaderView,
-                             QTreeWidgetItem, QAbstractItemView)
+                             QMessageBox, QHeaderView)
 from Widget import Ui_Form
 from database import DataBase
+from dedupe import LINK_HARD, LINK_REFLINK, TRASH_DIR_NAME
+from deleter import Deleter
+from linker import Linker
+from models import (DuplicateTableModel, DuplicateTreeModel,
+                    human_readable_size)
+from profiling import PART_GUI, cprofile_hook, format_run
+from rules import DEFAULT_RULES_FILE, ScanRules, load_rules
+from rulesdialog import RulesDialog
 from scanner import Scanner
 
+# Set to a file name to save a cProfile of every scan to it
+PROFILE_ENV = "HASHSWEEP_PROFILE"
+
 
 class Form(QMainWindow):
     """Main Window Class."""
@@ -18,6 +31,26 @@ class Form(QMainWindow):
         self.ui.setupUi(self)
         self.setWindowTitle("HashSweep")
 
+        self.db = DataBase()
+        self.worker = None
+        self.scanning = False
+        self.deleter = None
+        self.linker = None
+        self.scanned_folders = []
+        self.deleted_hashes = {}
+        self.linked_hashes = set()
+        self.rules = self.saved_rules()
+
+        # Result models, rows are read from the database while scrolling
+        self.table_model = DuplicateTableModel(self.db, self)
+        self.tree_model = DuplicateTreeModel(self.db, self)
+        self.ui.tbl_results.setModel(self.table_model)
+        self.ui.treeView.setModel(self.tree_model)
+        self.ui.tbl_results.setSortingEnabled(True)
+        self.ui.treeView.setSortingEnabled(True)
+        self.ui.tbl_results.sortByColumn(1, Qt.SortOrder.AscendingOrder)
+        self.ui.treeView.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+
         # Some GUI settings
         header = self.ui.tbl_results.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
@@ -27,27 +60,30 @@ class Form(QMainWindow):
         header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(3, QHeaderView.ResizeMode.Fixed)
         header.resizeSection(3, 100)
-        self.ui.treeWidget.header().setSectionResizeMode(0, QHeaderView.
-                                                         ResizeMode.
-                                                         ResizeToContents)
-        self.ui.treeWidget.header().setSectionResizeMode(1, QHeaderView.
-                                                         ResizeMode.
-                                                         Stretch)
-        self.ui.treeWidget.header().setSectionResizeMode(2, QHeaderView.
-                                                         ResizeMode.
-                                                         Fixed)
-        self.ui.treeWidget.header().resizeSection(2, 100)
+        self.ui.treeView.header().setSectionResizeMode(0, QHeaderView.
+                                                       ResizeMode.
+                                                       ResizeToContents)
+        self.ui.treeView.header().setSectionResizeMode(1, QHeaderView.
+                                                       ResizeMode.
+                                                       Stretch)
+        self.ui.treeView.header().setSectionResizeMode(2, QHeaderView.
+                                                       ResizeMode.
+                                                       Fixed)
+        self.ui.treeView.header().resizeSection(2, 100)
 
         # Button click events
         self.ui.btn_browse.clicked.connect(self.select_folder)
-        self.ui.btn_start.clicked.connect(self.start_scan)
+        self.ui.btn_add.clicked.connect(self.add_folder)
+        self.ui.btn_start.clicked.connect(self.toggle_scan)
         self.ui.btn_delete.clicked.connect(self.delete_selected)
+        self.ui.btn_link.clicked.connect(self.link_selected)
+        self.ui.btn_report.clicked.connect(self.show_report)
         self.ui.btn_hash.toggled.connect(self.toggle_hash_view)
         self.ui.rbtn_listwidget.toggled.connect(self.change_view)
         self.ui.rbtn_treewidget.toggled.connect(self.change_view)
-
-        self.db = DataBase()
-        self.worker = None
+        self.ui.txt_filter.textChanged.connect(self.filter_results)
+        self.ui.chk_watch.toggled.connect(self.toggle_watch)
+        self.ui.btn_rules.clicked.connect(self.edit_rules)
 
     def select_folder(self):
         """Make user choose a folder."""
@@ -58,119 +94,200 @@ class Form(QMainWindow):
             self.ui.lbl_status.setText("Hazır.")
             self.ui.lbl_stats.setText("Henüz tarama yapılmadı.")
 
+    def add_folder(self):
+        """Make user choose one more folder to scan with the others."""
+        folder = QFileDialog.getExistingDirectory(self,
+                                                  """Eklenecek Klasörü Seç""")
+        if folder and folder not in self.folder_paths():
+            self.ui.txt_path.setText(os.pathsep.join(self.folder_paths()
+                                                     + [folder]))
+
+    def folder_paths(self):
+        """Return the folders in the path box, they are split by pathsep."""
+        return [path.strip() for path in
+                self.ui.txt_path.text().split(os.pathsep) if path.strip()]
+
+    def saved_rules(self):
+        """
+        Return the scan rules saved in the rules file.
+
+        Without a rules file, only hidden files and folders are skipped.
+        A rules file that can not be read is reported and not used.
+        """
+        if not os.path.exists(DEFAULT_RULES_FILE):
+            return ScanRules()
+        try:
+            return load_rules(DEFAULT_RULES_FILE)
+        except (OSError, ValueError) as error:
+            print(f"HATA: ({DEFAULT_RULES_FILE}): {error}")
+            return ScanRules()
+
+    def edit_rules(self):
+        """Let the user edit the scan rules; they apply to the next scan."""
+        dialog = RulesDialog(self.rules, DEFAULT_RULES_FILE, self)
+        if dialog.exec():
+            self.rules = dialog.rules
+            self.ui.lbl_status.setText(
+                f"Tarama kuralları {DEFAULT_RULES_FILE} dosyasına "
+                "kaydedildi, sonraki taramada kullanılacak.")
+
+    def toggle_scan(self):
+        """Start a scan, or stop the one that is running."""
+        if self.scanning:
+            self.cancel_scan()
+        else:
+            self.start_scan()
+
+    def cancel_scan(self):
+        """
+        Stop the running scan.
+
+        The scan keeps its checkpoint, the next start of the same folders
+        offers to resume it.
+        """
+        self.ui.btn_start.setEnabled(False)
+        self.ui.lbl_status.setText("Tarama durduruluyor...")
+        self.worker.stop()
+
     def start_scan(self):
-        """Start the scanning process."""
-        folder_path = self.ui.txt_path.text()
+        """
+        Start the scanning process.
 
-        if not folder_path or not os.path.isdir(folder_path):
+        All folders are scanned in one pass, so duplicates between them
+        are found too. With the watch box checked, the scanner keeps the
+        results current after the scan; a running watch is stopped first.
+        """
+        folder_paths = self.folder_paths()
+
+        if not folder_paths or not all(os.path.isdir(path)
+                                       for path in folder_paths):
             QMessageBox.warning(self, "Uyarı",
                                 """Lütfen geçerli bir klasör seçin!""")
             return
 
-        self.ui.btn_start.setEnabled(False)
+        self.stop_watching()
+        profile_hook = None
+        if os.environ.get(PROFILE_ENV):
+            profile_hook = functools.partial(cprofile_hook,
+                                             os.environ[PROFILE_ENV])
+        self.worker = Scanner(folder_paths, profile_hook=profile_hook,
+                              watch=self.ui.chk_watch.isChecked(),
+                              rules=self.rules)
+        if self.worker.engine.resumable():
+            reply = QMessageBox.question(self, "Yarım Kalan Tarama",
+                                         "Bu klasörlerin taraması yarıda "
+                                         "kaldı. Kaldığı yerden devam "
+                                         "edilsin mi?")
+            self.worker.engine.resume = (
+                reply == QMessageBox.StandardButton.Yes)
+
+        self.scanning = True
+        self.ui.btn_start.setText("Taramayı durdur")
         self.ui.btn_delete.setEnabled(False)
-        self.ui.tbl_results.setRowCount(0)
+        self.ui.btn_link.setEnabled(False)
         self.ui.progressBar.setValue(0)
-
-        self.worker = Scanner(folder_path)
+        self.scanned_folders = folder_paths
 
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.status_signal.connect(self.ui.lbl_status.setText)
         self.worker.finished_signal.connect(self.scan_finished)
+        self.worker.updated_signal.connect(self.load_results)
 
         self.worker.start()
 
+    def toggle_watch(self, checked):
+        """
+        Stop a running watch when the watch box is unchecked.
+
+        A scan that is still running is not stopped.
+        """
+        if (not checked and not self.scanning
+                and self.worker is not None and self.worker.isRunning()):
+            self.stop_watching()
+            self.ui.lbl_status.setText("İzleme durduruldu.")
+
+    def stop_watching(self):
+        """Stop the scanner thread if it is still watching the folders."""
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.stop()
+            self.worker.wait()
+
+    def closeEvent(self, event):
+        """Stop watching and linking before the window closes."""
+        self.stop_watching()
+        if self.linker is not None and self.linker.isRunning():
+            self.linker.stop()
+            self.linker.wait()
+        super().closeEvent(event)
+
     def update_progress(self, val):
         """Write the percentage from scanner to bar."""
         self.ui.progressBar.setValue(val)
 
     def scan_finished(self):
         """When scan is finished."""
+        self.scanning = False
+        self.ui.btn_start.setText("Taramayı başlat")
         self.ui.btn_start.setEnabled(True)
         self.ui.btn_delete.setEnabled(True)
+        self.ui.btn_link.setEnabled(True)
         self.ui.lbl_status.setText("Tarama Tamamlandı. Kopyalar aranıyor...")
 
-        duplicates = self.db.duplicates()
-        self.populate_table(duplicates)
-        self.populate_tree(duplicates)
+        # Filling the views is part of the scan time the user sees
+        started = time.perf_counter()
+        self.load_results()
+        run_id = self.worker.engine.run_id
+        if run_id is not None:
+            self.db.add_run_stage(run_id, PART_GUI,
+                                  time.perf_counter() - started,
+                                  self.table_model.rowCount())
+        if not self.worker.engine.is_running:
+            self.ui.lbl_status.setText("Tarama durduruldu, aynı klasörler "
+                                       "yeniden başlatılınca kaldığı "
+                                       "yerden devam edilebilir.")
 
         if self.ui.rbtn_listwidget.isChecked():
             self.ui.stackedWidget.setCurrentIndex(0)
         else:
             self.ui.stackedWidget.setCurrentIndex(1)
 
-    def populate_table(self, data):
-        """Fill the data from the database into the table."""
-        self.ui.tbl_results.clearContents()
-
-        COLUMNS = ["Dosya Adı", "Hash", "Konum", "Boyut"]
-        self.ui.tbl_results.setHorizontalHeaderLabels(COLUMNS)
-
-        if data:
-            self.ui.tbl_results.setRowCount(len(data))
-
-            rowno = 0
-
-            for row_data in data:
-                for columnno in range(len(COLUMNS)):
-                    item_txt = str(row_data[columnno])
-
-                    if columnno == 3:
-                        item_txt = self.human_readable_size(row_data[columnno])
-
-                    self.ui.tbl_results.setItem(rowno, columnno,
-                                                QTableWidgetItem(item_txt))
-                rowno += 1
-
-            count = len(data)
-            self.ui.lbl_stats.setText(f"{count} adet kopya dosya bulundu.")
+    def load_results(self):
+        """Reset both result views, they read their rows lazily."""
+        self.table_model.reload()
+        self.tree_model.reload()
+        self.show_stats()
+
+    def show_stats(self):
+        """Write the number of duplicate files under the views."""
+        count = self.db.duplicate_count()
+        link_count = self.db.hardlink_group_count()
+        links = ""
+        if link_count:
+            links = f" {link_count} hardlink grubu zaten yer paylaşıyor."
+        if count:
+            wasted = human_readable_size(self.db.wasted_total())
+            self.ui.lbl_stats.setText(f"{count} adet kopya dosya bulundu, "
+                                      f"{wasted} geri kazanılabilir."
+                                      f"{links}")
             self.ui.lbl_status.setText("Analiz Bitti.")
-
         else:
-            self.ui.tbl_results.setRowCount(0)
+            self.ui.lbl_stats.setText(f"0 kopya bulundu.{links}")
             self.ui.lbl_status.setText("Harika! Hiç kopya dosya bulunamadı.")
 
-    def populate_tree(self, data):
-        """Fill the data from the database into the table."""
-        self.ui.treeWidget.clear()
-
-        if not data:
+    def show_report(self):
+        """Show where the time of the last scans went."""
+        runs = self.db.runs(5)
+        if not runs:
+            QMessageBox.information(self, "Tarama Raporu",
+                                    "Henüz tarama yapılmadı.")
             return
+        QMessageBox.information(self, "Tarama Raporu",
+                                "\n\n".join(format_run(run) for run in runs))
 
-        hash_groups = {}
-        for item in data:
-            # item: (name, hash, path, size)
-            file_name = item[0]
-            file_hash = item[1]
-            file_path = item[2]
-            file_size = item[3]
-
-            if file_hash not in hash_groups:
-                hash_groups[file_hash] = []
-            hash_groups[file_hash].append((file_name, file_path, file_size))
-
-        for hash_code, files_in_group in hash_groups.items():
-            parent_item = QTreeWidgetItem(self.ui.treeWidget)
-
-            total_size_bytes = 0
-            for f in files_in_group:
-                file_size = f[2]
-                total_size_bytes = total_size_bytes + file_size
-
-            s = f"Hash: {hash_code} ({len(files_in_group)} Dosya)"
-            parent_item.setText(0, f"{s}")
-            parent_item.setText(1, "")
-            parent_size_str = self.human_readable_size(total_size_bytes)
-            parent_item.setText(2, parent_size_str)
-
-            for file_name, file_path, file_size in files_in_group:
-                child_item = QTreeWidgetItem(parent_item)
-                child_item.setText(0, file_name)
-                child_item.setText(1, file_path)
-                child_size_str = self.human_readable_size(file_size)
-                child_item.setText(2, child_size_str)
-
-            parent_item.setExpanded(False)
+    def filter_results(self, text):
+        """Filter both views by file name or path."""
+        self.table_model.set_filter(text)
+        self.tree_model.set_filter(text)
 
     def toggle_hash_view(self, checked):
         """Show/hide hash column."""
@@ -183,53 +300,150 @@ class Form(QMainWindow):
         if self.ui.rbtn_listwidget.isChecked():
             rows = self.ui.tbl_results.selectionModel().selectedRows()
             for index in rows:
-                paths.append(self.ui.tbl_results.item(index.row(), 2).text())
+                paths.append(self.table_model.path_at(index.row()))
         else:
-            items = self.ui.treeWidget.selectedItems()
-            for item in items:
-                if item.parent():
-                    paths.append(item.text(1))
-                else:
-                    for i in range(item.childCount()):
-                        paths.append(item.child(i).text(1))
+            rows = self.ui.treeView.selectionModel().selectedRows()
+            for index in rows:
+                paths.extend(self.tree_model.paths_at(index))
 
         return list(set(paths))
 
-    def perform_deletion(self, paths):
-        """Delete the given list of files from disk and DB."""
-        deleted_count = 0
-        try:
-            for file_path in paths:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                self.db.delete_file(file_path)
-                deleted_count += 1
-        except Exception as error:
-            QMessageBox.critical(self, "Hata", f"Silinemedi: {error}")
-
-        return deleted_count
+    def trash_roots(self):
+        """Return the scanned folders, each keeps its own trash folder."""
+        return [os.path.abspath(path) for path in
+                self.scanned_folders or self.folder_paths()]
 
     def delete_selected(self):
-        """Manage the process of deleting selected files."""
+        """
+        Manage the process of deleting selected files.
+
+        The files are deleted, or moved to the trash folder, by a Deleter
+        thread; the views are updated when it is done.
+        """
         paths_to_delete = self.get_selected_paths()
         if not paths_to_delete:
             return
 
+        trash_roots = None
         quest = "Dosyayı kalıcı olarak silmek istiyor musun?"
+        if self.ui.chk_trash.isChecked():
+            trash_roots = self.trash_roots()
+            if not trash_roots:
+                QMessageBox.warning(self, "Uyarı",
+                                    "Çöp klasörü için bir klasör seçin!")
+                return
+            quest = (f"Dosyayı taranan klasörlerdeki {TRASH_DIR_NAME} "
+                     "klasörüne taşımak istiyor musun?")
         reply = QMessageBox.question(self, "Silme Onayı",
                                      f"{len(paths_to_delete)} {quest}")
 
         if reply == QMessageBox.StandardButton.No:
             return
 
-        deleted_count = self.perform_deletion(paths_to_delete)
+        self.deleted_hashes = self.db.hashes_of(paths_to_delete)
+        self.ui.btn_start.setEnabled(False)
+        self.ui.btn_delete.setEnabled(False)
+        self.ui.btn_link.setEnabled(False)
+        self.ui.progressBar.setValue(0)
+        self.ui.lbl_status.setText("Dosyalar siliniyor...")
+
+        self.deleter = Deleter(paths_to_delete, self.db, trash_roots)
+        total = len(paths_to_delete)
+        self.deleter.progress_signal.connect(
+            lambda done: self.update_progress(int(done * 100 / total)))
+        self.deleter.finished_signal.connect(self.deletion_finished)
+        self.deleter.start()
+
+    def deletion_finished(self, deleted, failures):
+        """Remove the deleted files from the views and list the failures."""
+        self.ui.btn_start.setEnabled(True)
+        self.ui.btn_delete.setEnabled(True)
+        self.ui.btn_link.setEnabled(True)
+
+        if deleted:
+            self.table_model.remove_paths(deleted, self.deleted_hashes)
+            self.tree_model.remove_paths(deleted, self.deleted_hashes)
+            self.show_stats()
+        self.ui.lbl_status.setText(f"{len(deleted)} dosya silindi.")
+
+        if failures:
+            lines = "\n".join(f"{path}: {error}"
+                              for path, error in failures[:20])
+            QMessageBox.warning(self, "Hata",
+                                f"{len(failures)} dosya silinemedi:"
+                                f"\n{lines}")
+
+    def link_selected(self):
+        """
+        Replace the selected files with links to another copy.
+
+        In every group one file is kept: an unselected one if there is
+        one, otherwise the first selected one. No path is removed, the
+        space of the replaced copies is freed. The files are linked by a
+        Linker thread, which leaves files that changed since the scan
+        alone; the views are updated when it is done.
+        """
+        selected = set(self.get_selected_paths())
+        if not selected:
+            return
+
+        groups = []
+        hashes = self.db.hashes_of(selected)
+        for file_hash in hashes:
+            paths = [row[1] for row in self.db.group_files(file_hash)]
+            targets = [path for path in paths if path in selected]
+            kept = [path for path in paths if path not in selected]
+            keep_path = kept[0] if kept else targets.pop(0)
+            if targets:
+                groups.append((keep_path, targets))
+
+        count = sum(len(targets) for keep_path, targets in groups)
+        if not count:
+            return
+
+        mode = LINK_HARD
+        if self.ui.cmb_link_mode.currentIndex() == 1:
+            mode = LINK_REFLINK
+        quest = (f"dosya {self.ui.cmb_link_mode.currentText()} ile "
+                 "değiştirilsin mi?")
+        reply = QMessageBox.question(self, "Bağlantı Onayı",
+                                     f"{count} {quest}")
+        if reply == QMessageBox.StandardButton.No:
+            return
+
+        self.linked_hashes = hashes
+        self.ui.btn_start.setEnabled(False)
+        self.ui.btn_delete.setEnabled(False)
+        self.ui.btn_link.setEnabled(False)
+        self.ui.progressBar.setValue(0)
+        self.ui.lbl_status.setText("Dosyalar bağlantıyla değiştiriliyor...")
+
+        self.linker = Linker(groups, self.db, mode)
+        self.linker.progress_signal.connect(
+            lambda done: self.update_progress(int(done * 100 / count)))
+        self.linker.finished_signal.connect(self.linking_finished)
+        self.linker.start()
 
-        if deleted_count > 0:
-            self.ui.lbl_status.setText(f"{deleted_count} dosya silindi.")
-            new_data = self.db.duplicates()
-            self.populate_table(new_data)
-            self.populate_tree(new_data)
-            self.ui.btn_delete.setEnabled(True)
+    def linking_finished(self, linked, failures):
+        """Remove the linked files from the views and list the failures."""
+        self.ui.btn_start.setEnabled(True)
+        self.ui.btn_delete.setEnabled(True)
+        self.ui.btn_link.setEnabled(True)
+
+        if linked:
+            linked_paths = [path for dev, ino, path in linked]
+            self.table_model.remove_paths(linked_paths, self.linked_hashes)
+            self.tree_model.remove_paths(linked_paths, self.linked_hashes)
+            self.show_stats()
+        self.ui.lbl_status.setText(f"{len(linked)} dosya bağlantıyla "
+                                   "değiştirildi.")
+
+        if failures:
+            lines = "\n".join(f"{path}: {error}"
+                              for path, error in failures[:20])
+            QMessageBox.warning(self, "Hata",
+                                f"{len(failures)} dosya değiştirilemedi:"
+                                f"\n{lines}")
 
     def change_view(self):
         """UI change according to radio buttons."""
@@ -241,17 +455,6 @@ class Form(QMainWindow):
 
         self.ui.btn_hash.setEnabled(is_table_view)
 
-    def human_readable_size(self, size_in_bytes):
-        """Convert the size in bytes to human readable format."""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size_in_bytes < 1024.0:
-                roundednum = round(size_in_bytes, 2)
-                return str(roundednum) + " " + unit
-            size_in_bytes /= 1024.0
-
-        roundednum = round(size_in_bytes, 2)
-        return str(roundednum) + " TB"
-
 
 if __name__ == "__main__":
     app = QApplication([])
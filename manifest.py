@@ -0,0 +1,492 @@
+"""Hash Manifest Module.
+
+A manifest lists the files of a scan with their size, modification time
+and digest, so the scans of several machines can be compared without
+reading any file again. Every node scans its own storage and exports a
+manifest; the manifests are merged anywhere:
+
+    python -m hashsweep /data --hash-all --manifest node1.hsm
+    python -m manifest merge node1.hsm node2.hsm node3.hsm
+
+The changes between two manifests of a node can be listed, or stored as
+a small delta manifest and applied to the older manifest later:
+
+    python -m manifest diff monday.hsm tuesday.hsm --delta changes.hsm
+    python -m manifest apply monday.hsm changes.hsm -o tuesday.hsm
+
+A manifest is a gzip compressed text file. The first line is a JSON
+header; every other line is one file, tab separated, sorted by path.
+All steps read the manifests as streams, merging sorts the entries in
+bounded memory with temporary files, so manifests of tens of millions
+of files can be merged on a small machine.
+"""
+import argparse
+import csv
+import gzip
+import heapq
+import itertools
+import json
+import re
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from collections import namedtuple
+from database import DataBase
+
+MANIFEST_FORMAT = "hashsweep-manifest"
+MANIFEST_VERSION = 1
+
+# Kinds of manifests: all files of a scan, or the changes to another one
+KIND_FULL = "full"
+KIND_DELTA = "delta"
+
+# Changes between two manifests, and how delta manifests store them
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_CHANGED = "changed"
+CHANGE_CODES = {CHANGE_ADDED: "+", CHANGE_REMOVED: "-", CHANGE_CHANGED: "~"}
+
+# Entries sorted in memory at a time while merging
+SORT_CHUNK = 200000
+
+# Characters of a path that can not be written as they are
+ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+UNESCAPES = {value[1]: key for key, value in ESCAPES.items()}
+ESCAPED = re.compile(r"\\(.)")
+
+# One file of a manifest; digest is None for files that were not hashed
+Entry = namedtuple("Entry", "path size mtime_ns digest")
+
+
+def escape(path):
+    """Escape the characters of a path that end a field or a line."""
+    if any(char in path for char in ESCAPES):
+        path = "".join(ESCAPES.get(char, char) for char in path)
+    return path
+
+
+def unescape(field):
+    """Undo escape."""
+    if "\\" not in field:
+        return field
+    return ESCAPED.sub(lambda match: UNESCAPES[match.group(1)], field)
+
+
+def format_entry(entry):
+    """Return the line of an Entry, without the line end."""
+    mtime_ns = "" if entry.mtime_ns is None else entry.mtime_ns
+    return (f"{escape(entry.path)}\t{entry.size}\t{mtime_ns}\t"
+            f"{entry.digest or ''}")
+
+
+def parse_entry(fields):
+    """Return the Entry of the fields of a line."""
+    path, size, mtime_ns, digest = fields
+    return Entry(unescape(path), int(size),
+                 int(mtime_ns) if mtime_ns else None, digest or None)
+
+
+def new_header(kind, node, roots, algorithm, **extra):
+    """Return the header of a new manifest with a new id."""
+    header = {"format": MANIFEST_FORMAT, "version": MANIFEST_VERSION,
+              "kind": kind, "id": uuid.uuid4().hex, "node": node,
+              "roots": roots, "algorithm": algorithm,
+              "created": time.time()}
+    header.update(extra)
+    return header
+
+
+def open_text(path, mode):
+    """Open a gzip compressed manifest as text."""
+    return gzip.open(path, mode, compresslevel=6, encoding="utf-8",
+                     errors="surrogateescape", newline="\n")
+
+
+class ManifestReader:
+    """
+    Reads a manifest lazily.
+
+    The header is read when the reader is made; iterating yields the
+    entries, or (change, Entry) pairs for a delta manifest. Raises
+    ValueError for files that are not manifests or are of a newer
+    version, and when the entries are not sorted by path.
+    """
+
+    def __init__(self, path):
+        """Open the manifest and read its header."""
+        self.path = path
+        self.stream = open_text(path, "rt")
+        try:
+            header = json.loads(self.stream.readline())
+        except (OSError, ValueError) as error:
+            self.close()
+            raise ValueError(f"{path}: manifest değil ({error})") from error
+        if not isinstance(header, dict) or \
+                header.get("format") != MANIFEST_FORMAT:
+            self.close()
+            raise ValueError(f"{path}: manifest değil")
+        if header.get("version", 0) > MANIFEST_VERSION:
+            self.close()
+            raise ValueError(f"{path}: manifest sürümü {header['version']} "
+                             f"desteklenmiyor")
+        self.header = header
+        self.delta = header.get("kind") == KIND_DELTA
+
+    def __enter__(self):
+        """Use the reader as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the file."""
+        self.close()
+
+    def close(self):
+        """Close the file."""
+        self.stream.close()
+
+    def __iter__(self):
+        """Yield the entries, in path order."""
+        changes = {code: change for change, code in CHANGE_CODES.items()}
+        last = None
+        for number, line in enumerate(self.stream, 2):
+            fields = line.rstrip("\n").split("\t")
+            try:
+                change = changes[fields.pop(0)] if self.delta else None
+                entry = parse_entry(fields)
+            except (KeyError, ValueError) as error:
+                raise ValueError(f"{self.path}:{number}: bozuk satır "
+                                 f"({error})") from error
+            if last is not None and entry.path <= last:
+                raise ValueError(f"{self.path}:{number}: dosyalar yola göre "
+                                 f"sıralı değil")
+            last = entry.path
+            yield (change, entry) if self.delta else entry
+
+
+class ManifestWriter:
+    """Writes a manifest; entries must be written sorted by path."""
+
+    def __init__(self, path, header):
+        """Create the file and write the header."""
+        self.stream = open_text(path, "wt")
+        self.stream.write(json.dumps(header) + "\n")
+        self.delta = header["kind"] == KIND_DELTA
+        self.count = 0
+
+    def __enter__(self):
+        """Use the writer as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the file."""
+        self.close()
+
+    def close(self):
+        """Finish the gzip stream and close the file."""
+        self.stream.close()
+
+    def write(self, entry, change=None):
+        """Write an Entry; a delta manifest also needs its change."""
+        if self.delta:
+            self.stream.write(CHANGE_CODES[change] + "\t")
+        self.stream.write(format_entry(entry) + "\n")
+        self.count += 1
+
+
+def export_manifest(db, path, node=None):
+    """
+    Write the files of a results database to a manifest.
+
+    The algorithm is the one of the last scan run, node defaults to the
+    host name. Returns the number of files written.
+    """
+    runs = db.runs(1)
+    algorithm = runs[0]["algorithm"] if runs else None
+    header = new_header(KIND_FULL, node or socket.gethostname(),
+                        [root for root, count in db.roots()], algorithm)
+    with ManifestWriter(path, header) as writer:
+        for row in db.manifest_files(algorithm):
+            writer.write(Entry(*row))
+    return writer.count
+
+
+def write_run(items):
+    """Write sorted merge items to a temporary file, return the file."""
+    run = tempfile.TemporaryFile("w+", encoding="utf-8",
+                                 errors="surrogateescape", newline="\n")
+    for digest, size, index, path in items:
+        run.write(f"{digest}\t{size}\t{index}\t{escape(path)}\n")
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    """Yield the merge items of a file made by write_run."""
+    for line in run:
+        digest, size, index, path = line.rstrip("\n").split("\t")
+        yield digest, int(size), int(index), unescape(path)
+
+
+def sorted_items(items, chunk=SORT_CHUNK):
+    """
+    Yield (digest, size, index, path) items in sorted order.
+
+    Up to chunk items are sorted in memory at a time. When there are
+    more, every sorted chunk is written to a temporary file and the
+    files are merged with heapq.merge, so memory stays bounded.
+    """
+    items = iter(items)
+    runs = []
+    try:
+        while True:
+            block = sorted(itertools.islice(items, chunk))
+            if not runs and len(block) < chunk:
+                yield from block
+                return
+            if not block:
+                break
+            runs.append(write_run(block))
+        yield from heapq.merge(*(read_run(run) for run in runs))
+    finally:
+        for run in runs:
+            run.close()
+
+
+def merge_manifests(readers, across=True, missing=None):
+    """
+    Yield the duplicates of several full manifests.
+
+    Yields (digest, size, index, path) for every file whose digest and
+    size another file shares; index is the position of its manifest in
+    readers. Groups come one after another. With across, only groups
+    with files of at least two manifests are yielded, the duplicates
+    within one node are already known from its scan. The manifests must
+    use the same algorithm. Files without a digest can not be compared;
+    if missing is a list, their count per manifest is appended to it.
+    Raises ValueError for delta manifests or mixed algorithms.
+    """
+    algorithms = {reader.header["algorithm"] for reader in readers}
+    if len(algorithms) > 1:
+        raise ValueError(f"Manifestler farklı algoritmalar kullanıyor: "
+                         f"{', '.join(sorted(map(str, algorithms)))}")
+    for reader in readers:
+        if reader.delta:
+            raise ValueError(f"{reader.path}: değişiklik manifesti "
+                             f"birleştirilemez, önce apply kullanın")
+
+    def items():
+        for index, reader in enumerate(readers):
+            unhashed = 0
+            for entry in reader:
+                if entry.digest:
+                    yield entry.digest, entry.size, index, entry.path
+                else:
+                    unhashed += 1
+            if missing is not None:
+                missing.append(unhashed)
+
+    for key, group in itertools.groupby(sorted_items(items()),
+                                        lambda item: item[:2]):
+        group = list(group)
+        if len(group) < 2:
+            continue
+        if across and len({item[2] for item in group}) < 2:
+            continue
+        yield from group
+
+
+def diff_entries(old, new):
+    """
+    Yield (change, Entry) for the differences of two manifests.
+
+    old and new yield entries sorted by path. Added and changed files
+    come with their new entry, removed files with their old one.
+    """
+    old, new = iter(old), iter(new)
+    before, after = next(old, None), next(new, None)
+    while before is not None or after is not None:
+        if after is None or (before is not None
+                             and before.path < after.path):
+            yield CHANGE_REMOVED, before
+            before = next(old, None)
+        elif before is None or after.path < before.path:
+            yield CHANGE_ADDED, after
+            after = next(new, None)
+        else:
+            if before != after:
+                yield CHANGE_CHANGED, after
+            before, after = next(old, None), next(new, None)
+
+
+def apply_delta(base, changes):
+    """
+    Yield the entries of base with the (change, Entry) pairs applied.
+
+    Both are sorted by path, see diff_entries.
+    """
+    base, changes = iter(base), iter(changes)
+    entry, pair = next(base, None), next(changes, None)
+    while entry is not None or pair is not None:
+        if pair is None or (entry is not None
+                            and entry.path < pair[1].path):
+            yield entry
+            entry = next(base, None)
+            continue
+        change, changed = pair
+        if entry is not None and entry.path == changed.path:
+            entry = next(base, None)
+        if change != CHANGE_REMOVED:
+            yield changed
+        pair = next(changes, None)
+
+
+class RowWriter:
+    """Writes result rows as NDJSON or CSV."""
+
+    def __init__(self, stream, output_format, columns):
+        """Prepare the output stream, CSV output starts with a header."""
+        self.stream = stream
+        self.columns = columns
+        self.csv_writer = None
+        if output_format == "csv":
+            self.csv_writer = csv.writer(stream)
+            self.csv_writer.writerow(columns)
+
+    def write(self, *values):
+        """Write one row."""
+        if self.csv_writer:
+            self.csv_writer.writerow(values)
+        else:
+            self.stream.write(json.dumps(dict(zip(self.columns, values)))
+                              + "\n")
+
+
+def parse_args(argv=None):
+    """Read the command line options."""
+    parser = argparse.ArgumentParser(
+        prog="manifest",
+        description="Export, merge and compare hash manifests.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser(
+        "export", help="write the files of a results database to a "
+                       "manifest")
+    export.add_argument("--db", default="./results.db",
+                        help="results database of a finished scan")
+    export.add_argument("-o", "--output", required=True,
+                        help="manifest file to write")
+    export.add_argument("--node", default=None,
+                        help="name of this node, the host name by default")
+
+    merge = commands.add_parser(
+        "merge", help="find duplicates across manifests without reading "
+                      "any file")
+    merge.add_argument("manifests", nargs="+", help="full manifests")
+    merge.add_argument("--all", action="store_true",
+                       help="also list duplicates within one manifest")
+
+    diff = commands.add_parser(
+        "diff", help="list the changes between two manifests")
+    diff.add_argument("old", help="older manifest")
+    diff.add_argument("new", help="newer manifest")
+    diff.add_argument("--delta", metavar="FILE", default=None,
+                      help="write the changes to a delta manifest instead")
+
+    apply = commands.add_parser(
+        "apply", help="apply a delta manifest to the manifest it was made "
+                      "from")
+    apply.add_argument("base", help="manifest the delta was made from")
+    apply.add_argument("delta", help="delta manifest")
+    apply.add_argument("-o", "--output", required=True,
+                       help="manifest file to write")
+
+    for command in (merge, diff):
+        command.add_argument("-f", "--format", choices=["ndjson", "csv"],
+                             default="ndjson", help="output format")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run a manifest command."""
+    args = parse_args(argv)
+    try:
+        if args.command == "export":
+            count = export_manifest(DataBase(args.db), args.output,
+                                    args.node)
+            sys.stderr.write(f"{count} dosya yazıldı: {args.output}\n")
+        elif args.command == "merge":
+            merge(args)
+        elif args.command == "diff":
+            diff(args)
+        else:
+            apply(args)
+    except (OSError, ValueError) as error:
+        print(f"HATA: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def merge(args):
+    """Write the duplicates of the manifests of args."""
+    readers = [ManifestReader(path) for path in args.manifests]
+    writer = RowWriter(sys.stdout, args.format,
+                       ["hash", "size", "node", "manifest", "path"])
+    missing = []
+    try:
+        for digest, size, index, path in merge_manifests(
+                readers, across=not args.all, missing=missing):
+            writer.write(digest, size, readers[index].header["node"],
+                         readers[index].path, path)
+    finally:
+        for reader in readers:
+            reader.close()
+    for reader, unhashed in zip(readers, missing):
+        if unhashed:
+            sys.stderr.write(f"{reader.path}: özeti olmayan {unhashed} "
+                             f"dosya karşılaştırılamadı (--hash-all ile "
+                             f"tarayın)\n")
+
+
+def diff(args):
+    """Write the changes between the manifests of args."""
+    with ManifestReader(args.old) as old, ManifestReader(args.new) as new:
+        if old.delta or new.delta:
+            raise ValueError("diff iki tam manifest ister")
+        changes = diff_entries(old, new)
+        if args.delta:
+            header = new_header(KIND_DELTA, new.header["node"],
+                                new.header["roots"],
+                                new.header["algorithm"],
+                                base=old.header["id"], target=new.header)
+            with ManifestWriter(args.delta, header) as writer:
+                for change, entry in changes:
+                    writer.write(entry, change)
+            sys.stderr.write(f"{writer.count} değişiklik yazıldı: "
+                             f"{args.delta}\n")
+            return
+
+        writer = RowWriter(sys.stdout, args.format,
+                           ["change", "path", "size", "mtime_ns", "hash"])
+        for change, entry in changes:
+            writer.write(change, *entry)
+
+
+def apply(args):
+    """Write the manifest of args.base with the delta applied."""
+    with ManifestReader(args.base) as base, \
+            ManifestReader(args.delta) as delta:
+        if not delta.delta or base.delta:
+            raise ValueError("apply bir tam manifest ve bir değişiklik "
+                             "manifesti ister")
+        if delta.header.get("base") != base.header["id"]:
+            raise ValueError(f"{args.delta} başka bir manifestten yapılmış")
+        with ManifestWriter(args.output, delta.header["target"]) as writer:
+            for entry in apply_delta(base, delta):
+                writer.write(entry)
+        sys.stderr.write(f"{writer.count} dosya yazıldı: {args.output}\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""Lazy Result Models Module."""
+from PyQt6.QtCore import (QAbstractItemModel, QAbstractTableModel,
+                          QModelIndex, Qt)
+
+# Rows fetched from the database each time the view scrolls to the end
+PAGE_SIZE = 500
+
+# A removal split into more row ranges than this resets the model instead
+RESET_RANGES = 100
+
+
+def human_readable_size(size_in_bytes):
+    """Convert the size in bytes to human readable format."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_in_bytes < 1024.0:
+            roundednum = round(size_in_bytes, 2)
+            return str(roundednum) + " " + unit
+        size_in_bytes /= 1024.0
+
+    roundednum = round(size_in_bytes, 2)
+    return str(roundednum) + " TB"
+
+
+def row_ranges(rows):
+    """Join ascending row numbers into (first, last) ranges of rows."""
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    return ranges
+
+
+class DuplicateTableModel(QAbstractTableModel):
+    """
+    Flat list of duplicate files, read from the database page by page.
+
+    Only the rows scrolled into view are fetched, each page from behind
+    the last loaded row. Sorting and filtering are done by the database.
+    """
+
+    COLUMNS = ["Dosya Adı", "Hash", "Konum", "Boyut"]
+    SORT_COLUMNS = ["name", "hash", "path", "size"]
+
+    def __init__(self, db, parent=None):
+        """Start with an empty model, call reload() to fill it."""
+        super().__init__(parent)
+        self.db = db
+        self.rows = []
+        self.total = 0
+        self.sort_column = "hash"
+        self.descending = False
+        self.text = ""
+
+    def reload(self):
+        """Drop the loaded rows and count the matching rows again."""
+        self.beginResetModel()
+        self.rows = []
+        self.total = self.db.duplicate_count(self.text)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        """Return the number of rows loaded so far."""
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        """Return the number of columns."""
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        """Tell the view whether more rows are waiting in the database."""
+        return not parent.isValid() and len(self.rows) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        """Load the next page of rows."""
+        if parent.isValid():
+            return
+        page = self.db.duplicates_page(PAGE_SIZE,
+                                       self.rows[-1] if self.rows else None,
+                                       self.sort_column, self.descending,
+                                       self.text)
+        if not page:
+            self.total = len(self.rows)
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows),
+                             len(self.rows) + len(page) - 1)
+        self.rows.extend(page)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        """Return the text of a cell, sizes are formatted here."""
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        value = self.rows[index.row()][index.column()]
+        if index.column() == 3:
+            return human_readable_size(value)
+        return str(value)
+
+    def headerData(self, section, orientation,
+                   role=Qt.ItemDataRole.DisplayRole):
+        """Return the column titles."""
+        if (role == Qt.ItemDataRole.DisplayRole
+                and orientation == Qt.Orientation.Horizontal):
+            return self.COLUMNS[section]
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Sort by a column in SQL and start paging again."""
+        self.sort_column = self.SORT_COLUMNS[column]
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.reload()
+
+    def set_filter(self, text):
+        """Show only the files whose name or path contains text."""
+        self.text = text
+        self.reload()
+
+    def path_at(self, row):
+        """Return the path of a loaded row."""
+        return self.rows[row][2]
+
+    def remove_paths(self, paths, hashes):
+        """
+        Remove deleted files without reloading the model.
+
+        hashes are the hashes the files had. Files left alone in their
+        group are no longer duplicates and are removed too.
+        Contiguous rows are removed together, bottom-up; when the rows
+        are spread over too many ranges the model is reset instead.
+        """
+        paths = set(paths)
+        counts = self.db.group_counts(hashes)
+        removed = [row for row, (name, file_hash, path, size)
+                   in enumerate(self.rows)
+                   if path in paths or counts.get(file_hash, 2) < 2]
+
+        ranges = row_ranges(removed)
+        if len(ranges) > RESET_RANGES:
+            removed = set(removed)
+            self.beginResetModel()
+            self.rows = [values for row, values in enumerate(self.rows)
+                         if row not in removed]
+            self.endResetModel()
+        else:
+            for first, last in reversed(ranges):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self.rows[first:last + 1]
+                self.endRemoveRows()
+
+        self.total = self.db.duplicate_count(self.text)
+
+
+class DuplicateTreeModel(QAbstractItemModel):
+    """
+    Duplicate files grouped by hash, read from the database lazily.
+
+    Groups are fetched page by page, the files of a group only when the
+    group is expanded. File groups are paged from behind the last loaded
+    one, see DataBase.duplicate_groups. Group rows have the internal id 0,
+    file rows carry the id of their group. The columns sort the groups by
+    hash, file count and total size.
+
+    Duplicate folders come first as folder groups whose children are the
+    folders. File groups whose files all lie in those folders are left
+    out, so a copied folder is one group instead of one per file.
+    """
+
+    COLUMNS = ["Dosya Adı", "Konum", "Boyut"]
+    SORT_COLUMNS = ["hash", "count", "total_size"]
+
+    def __init__(self, db, parent=None):
+        """Start with an empty model, call reload() to fill it."""
+        super().__init__(parent)
+        self.db = db
+        self.groups = []
+        self.group_rows = {}
+        self.last_group = None
+        self.next_id = 1
+        self.dir_total = 0
+        self.total = 0
+        self.sort_column = "hash"
+        self.descending = False
+        self.text = ""
+
+    def reload(self):
+        """Drop the loaded groups and count the matching groups again."""
+        self.beginResetModel()
+        self.groups = []
+        self.group_rows = {}
+        self.last_group = None
+        self.dir_total = self.db.duplicate_dir_group_count(self.text)
+        self.total = self.dir_total + self.db.duplicate_group_count(
+            self.text, collapse=True)
+        self.endResetModel()
+
+    def new_group(self, file_hash, count, total_size, name=None):
+        """
+        Make a group record with a stable internal id.
+
+        Folder groups have the name of their folders, file groups None.
+        """
+        group = {"id": self.next_id, "hash": file_hash, "count": count,
+                 "total_size": total_size, "name": name, "files": None}
+        self.next_id += 1
+        return group
+
+    def index_groups(self):
+        """Rebuild the id -> row map after groups were added or removed."""
+        self.group_rows = {group["id"]: row
+                           for row, group in enumerate(self.groups)}
+
+    def group_of(self, index):
+        """Return the group of a group or file index."""
+        if index.internalId() == 0:
+            return self.groups[index.row()]
+        return self.groups[self.group_rows[index.internalId()]]
+
+    def index(self, row, column, parent=QModelIndex()):
+        """Create an index for a group row or for a file row of a group."""
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, 0)
+        group_id = self.groups[parent.row()]["id"]
+        return self.createIndex(row, column, group_id)
+
+    def parent(self, index):
+        """Return the group index of a file row."""
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.createIndex(self.group_rows[index.internalId()], 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        """Return the loaded groups, or the loaded files of a group."""
+        if not parent.isValid():
+            return len(self.groups)
+        if parent.internalId() == 0 and parent.column() == 0:
+            return len(self.groups[parent.row()]["files"] or [])
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        """Return the number of columns."""
+        return len(self.COLUMNS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        """Groups always have files, even before they are fetched."""
+        if not parent.isValid():
+            return bool(self.groups)
+        return parent.internalId() == 0 and parent.column() == 0
+
+    def canFetchMore(self, parent=QModelIndex()):
+        """Tell the view whether more groups or files can be loaded."""
+        if not parent.isValid():
+            return len(self.groups) < self.total
+        if parent.internalId() == 0:
+            return self.groups[parent.row()]["files"] is None
+        return False
+
+    def fetchMore(self, parent=QModelIndex()):
+        """Load the next page of groups, or the files of a group."""
+        if not parent.isValid():
+            if len(self.groups) < self.dir_total:
+                page = self.db.duplicate_dir_groups_page(
+                    len(self.groups), PAGE_SIZE, self.sort_column,
+                    self.descending, self.text)
+                if not page:
+                    self.total -= self.dir_total - len(self.groups)
+                    self.dir_total = len(self.groups)
+                    return
+            else:
+                rows = self.db.duplicate_groups(
+                    PAGE_SIZE, self.last_group, self.sort_column,
+                    self.descending, self.text, collapse=True)
+                if rows:
+                    self.last_group = rows[-1]
+                page = [(file_hash, count, total_size)
+                        for file_hash, size, count, wasted, total_size
+                        in rows]
+            if not page:
+                self.total = len(self.groups)
+                return
+            self.beginInsertRows(QModelIndex(), len(self.groups),
+                                 len(self.groups) + len(page) - 1)
+            self.groups.extend(self.new_group(*row) for row in page)
+            self.index_groups()
+            self.endInsertRows()
+            return
+
+        group = self.groups[parent.row()]
+        if group["name"] is not None:
+            files = self.db.dir_group_dirs(group["hash"])
+        else:
+            files = self.db.group_files(group["hash"])
+        if files:
+            self.beginInsertRows(parent, 0, len(files) - 1)
+            group["files"] = files
+            self.endInsertRows()
+        else:
+            group["files"] = []
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        """Return the text of a group or file cell."""
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        if index.internalId() == 0:
+            group = self.groups[index.row()]
+            if index.column() == 0 and group["name"] is not None:
+                return (f"Klasör: {group['name']} "
+                        f"({group['count']} Kopya Klasör)")
+            if index.column() == 0:
+                return f"Hash: {group['hash']} ({group['count']} Dosya)"
+            if index.column() == 2:
+                return human_readable_size(group["total_size"])
+            return ""
+
+        name, path, size = self.group_of(index)["files"][index.row()]
+        if index.column() == 0:
+            return name
+        if index.column() == 1:
+            return path
+        return human_readable_size(size)
+
+    def headerData(self, section, orientation,
+                   role=Qt.ItemDataRole.DisplayRole):
+        """Return the column titles."""
+        if (role == Qt.ItemDataRole.DisplayRole
+                and orientation == Qt.Orientation.Horizontal):
+            return self.COLUMNS[section]
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Sort the groups in SQL and start paging again."""
+        self.sort_column = self.SORT_COLUMNS[column]
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.reload()
+
+    def set_filter(self, text):
+        """Show only the groups that have a file matching text."""
+        self.text = text
+        self.reload()
+
+    def paths_at(self, index):
+        """
+        Return the path of a file row, or all paths of a group row.
+
+        For folder groups these are the files inside the folders.
+        """
+        group = self.group_of(index)
+        if index.internalId() == 0:
+            if group["name"] is None:
+                return [row[1] for row in self.db.group_files(group["hash"])]
+            folders = [row[1] for row in
+                       self.db.dir_group_dirs(group["hash"])]
+        else:
+            path = group["files"][index.row()][1]
+            if group["name"] is None:
+                return [path]
+            folders = [path]
+        return [path for folder in folders
+                for path in self.db.files_under(folder)]
+
+    def remove_paths(self, paths, hashes):
+        """
+        Remove deleted files without reloading the model.
+
+        hashes are the hashes the files had. Groups with fewer than two
+        separate files left are removed, the others lose the removed rows
+        and get their totals updated. While folder groups are shown the
+        model is reloaded instead: removing a file from a duplicate folder
+        splits its folder group back into file groups.
+        Rows are removed in contiguous ranges as in
+        DuplicateTableModel.remove_paths.
+        """
+        if self.dir_total:
+            self.reload()
+            return
+
+        paths = set(paths)
+        counts = self.db.group_counts(hashes)
+        removed = []
+        for row, group in enumerate(self.groups):
+            if group["hash"] not in counts:
+                continue
+            if counts[group["hash"]] < 2:
+                removed.append(row)
+                continue
+
+            remaining = self.db.group_files(group["hash"])
+            parent = self.index(row, 0)
+            if group["files"] is not None:
+                children = [child for child, (name, path, size)
+                            in enumerate(group["files"]) if path in paths]
+                for first, last in reversed(row_ranges(children)):
+                    self.beginRemoveRows(parent, first, last)
+                    del group["files"][first:last + 1]
+                    self.endRemoveRows()
+            group["count"] = len(remaining)
+            group["total_size"] = sum(size for name, path, size in remaining)
+            self.dataChanged.emit(parent, self.index(row, 2))
+
+        ranges = row_ranges(removed)
+        if len(ranges) > RESET_RANGES:
+            removed = set(removed)
+            self.beginResetModel()
+            self.groups = [group for row, group in enumerate(self.groups)
+                           if row not in removed]
+            self.index_groups()
+            self.endResetModel()
+        else:
+            for first, last in reversed(ranges):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self.groups[first:last + 1]
+                self.index_groups()
+                self.endRemoveRows()
+
+        self.total = self.db.duplicate_group_count(self.text, collapse=True)
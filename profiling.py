@@ -0,0 +1,149 @@
+"""Scan Profiling Module."""
+import contextlib
+import cProfile
+import time
+from database import RUN_RUNNING, RUN_COMPLETED, RUN_STOPPED
+
+# Parts of a scan that are timed separately
+PART_WALK = "walk"
+PART_SAMPLE = "sample"
+PART_HASH = "hash"
+PART_DB = "db"
+PART_VERIFY = "verify"
+PART_DIRS = "dirs"
+PART_GUI = "gui"
+PARTS = (PART_WALK, PART_SAMPLE, PART_HASH, PART_DB, PART_VERIFY, PART_DIRS,
+         PART_GUI)
+
+# Names of the parts in the reports
+PART_TEXTS = {
+    PART_WALK: "Listeleme",
+    PART_SAMPLE: "Örnek hash",
+    PART_HASH: "Tam hash",
+    PART_DB: "Veritabanı",
+    PART_VERIFY: "Doğrulama",
+    PART_DIRS: "Klasör hash",
+    PART_GUI: "Arayüz",
+}
+
+# Texts of the run states in the reports
+STATUS_TEXTS = {
+    RUN_RUNNING: "sürüyor",
+    RUN_COMPLETED: "tamamlandı",
+    RUN_STOPPED: "durduruldu",
+}
+
+
+class ScanProfile:
+    """
+    Measures where the time of a scan goes.
+
+    The stages of a scan are chained generators, so they run interleaved
+    on one thread. The profile keeps one current part and charges the
+    time since the last switch to it; a part that calls into another one
+    is therefore only charged for its own time. Every part also counts
+    files, bytes read and errors.
+    """
+
+    def __init__(self):
+        """Start with all counters at zero, the clock starts now."""
+        self.parts = {part: {"seconds": 0.0, "files": 0, "bytes": 0,
+                             "errors": 0} for part in PARTS}
+        self.current = None
+        self.last_switch = time.perf_counter()
+        self.started = time.time()
+
+    def switch(self, part):
+        """Charge the time so far to the current part and make part current."""
+        now = time.perf_counter()
+        if self.current is not None:
+            self.parts[self.current]["seconds"] += now - self.last_switch
+        self.last_switch = now
+        previous, self.current = self.current, part
+        return previous
+
+    @contextlib.contextmanager
+    def measure(self, part):
+        """Charge the time spent in the with block to part."""
+        previous = self.switch(part)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def timed_iter(self, part, items):
+        """Pass on items, charging the time spent producing them to part."""
+        items = iter(items)
+        while True:
+            previous = self.switch(part)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self.switch(previous)
+            yield item
+
+    def count(self, part, files=1, size=0, errors=0):
+        """Count processed files, bytes read and errors of a part."""
+        counters = self.parts[part]
+        counters["files"] += files
+        counters["bytes"] += size
+        counters["errors"] += errors
+
+    def finish(self):
+        """Charge the last running part, call once at the end of a scan."""
+        self.switch(None)
+
+    def stages(self):
+        """Return the counters of the parts that did any work."""
+        return {part: counters for part, counters in self.parts.items()
+                if counters["seconds"] or counters["files"]}
+
+
+def format_run(run):
+    """
+    Turn a run dict of DataBase.runs() into a report text.
+
+    The parts are listed with their share of the measured time, so the
+    slowest part of the scan stands out.
+    """
+    stages = run["stages"]
+    started = time.strftime("%Y-%m-%d %H:%M:%S",
+                            time.localtime(run["started"]))
+    lines = [f"Tarama #{run['id']} - {started} - {run['roots']}",
+             f"Süre: {run['seconds']:.2f} sn, {run['files']} dosya, "
+             f"{run['bytes'] / (1024 * 1024):.1f} MB okundu, "
+             f"{run['duplicates']} kopya, {run['errors']} hata "
+             f"({run['algorithm']}, "
+             f"{STATUS_TEXTS.get(run['status'], run['status'])})"]
+    measured = sum(counters["seconds"] for counters in stages.values())
+    for part in PARTS:
+        if part not in stages:
+            continue
+        counters = stages[part]
+        share = counters["seconds"] * 100 / measured if measured else 0
+        lines.append(f"  {PART_TEXTS[part]:<12} {counters['seconds']:8.2f}"
+                     f" sn %{share:5.1f}  {counters['files']:>8} dosya "
+                     f"{counters['bytes'] / (1024 * 1024):10.1f} MB "
+                     f"{counters['errors']:>5} hata")
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def cprofile_hook(path):
+    """
+    Profile the scan with cProfile and save the stats to path.
+
+    Pass this as the profile_hook of the engine, for example
+    profile_hook=lambda: cprofile_hook("scan.prof"); it runs on the
+    thread that runs the scan. The file can be read with pstats or
+    snakeviz.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,107 @@
+"""Progress Reporting Module."""
+import time
+
+# Scan stages reported in the snapshots
+STAGE_WALK = "walk"
+STAGE_HASH = "hash"
+STAGE_VERIFY = "verify"
+STAGE_DONE = "done"
+
+
+class ProgressReporter:
+    """
+    Collects scan counters and sends them out as periodic snapshots.
+
+    Counters are updated for every file, but the callback is only called
+    once per interval seconds (and on stage changes), so the receiver is
+    not flooded with one message per file.
+    """
+
+    def __init__(self, callback, interval=0.1):
+        """Store the callback that receives the snapshot dicts."""
+        self.callback = callback
+        self.interval = interval
+        self.stage = STAGE_WALK
+        self.listed_files = 0
+        self.total_files = 0
+        self.total_bytes = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.current = ""
+        self.started = time.monotonic()
+        self.last_sent = 0.0
+
+    def set_stage(self, stage):
+        """
+        Switch to a new stage and report it right away.
+
+        The totals, counters and rates start again for every stage.
+        """
+        self.stage = stage
+        self.total_files = 0
+        self.total_bytes = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.current = ""
+        self.started = time.monotonic()
+        self.send()
+
+    def add_listed(self, count=1):
+        """Count files found by the walk."""
+        self.listed_files += count
+        self.maybe_send()
+
+    def add_total(self, size, files=1):
+        """Count files that will be processed in this stage."""
+        self.total_files += files
+        self.total_bytes += size
+
+    def add_done(self, size, current="", files=1):
+        """Count files that were processed."""
+        self.files_done += files
+        self.bytes_done += size
+        self.current = current
+        self.maybe_send()
+
+    def maybe_send(self):
+        """Send a snapshot if the interval has passed since the last one."""
+        if time.monotonic() - self.last_sent >= self.interval:
+            self.send()
+
+    def send(self):
+        """Send a snapshot now."""
+        self.last_sent = time.monotonic()
+        self.callback(self.snapshot())
+
+    def snapshot(self):
+        """
+        Return the current counters with rates and an estimate.
+
+        The estimate is based on bytes, since a few big files take longer
+        than many small ones. While the walk is still going on the totals
+        grow, so percent and eta are estimates.
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        bytes_per_s = self.bytes_done / elapsed
+        remaining = max(self.total_bytes - self.bytes_done, 0)
+        eta = remaining / bytes_per_s if bytes_per_s else None
+        percent = 0
+        if self.total_bytes:
+            percent = int(self.bytes_done * 100 / self.total_bytes)
+        elif self.total_files:
+            percent = int(self.files_done * 100 / self.total_files)
+
+        return {
+            "stage": self.stage,
+            "listed_files": self.listed_files,
+            "files_done": self.files_done,
+            "total_files": self.total_files,
+            "bytes_done": self.bytes_done,
+            "total_bytes": self.total_bytes,
+            "mb_per_s": bytes_per_s / (1024 * 1024),
+            "files_per_s": self.files_done / elapsed,
+            "eta": eta,
+            "percent": min(percent, 100),
+            "elapsed": elapsed,
+            "current": self.current,
+        }
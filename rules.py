@@ -0,0 +1,187 @@
+"""Scan Rules Module.
+
+Rules choose the files a scan looks at. They are kept in a JSON file,
+which the GUI saves and the command line reads with --rules:
+
+    {"version": 1, "include": [], "exclude": ["node_modules", "*.tmp",
+     "re:(^|/)build/cache$"], "min_size": 1, "max_size": null,
+     "skip_hidden": true}
+
+A pattern is a glob, or a regular expression after "re:". A glob
+without a "/" is matched with the name of a file or folder, a glob with
+a "/" with its path below the scan root, like "photos/2019/*.raw"; a
+"*" also matches "/". A regular expression is searched for in the path
+below the scan root, with "/" between the folders.
+"""
+import fnmatch
+import json
+import os
+import re
+from dedupe import TRASH_DIR_NAME
+
+RULES_VERSION = 1
+
+# Where the GUI saves its rules, next to the results database
+DEFAULT_RULES_FILE = "./scan_rules.json"
+
+# Marks a regular expression in a pattern list
+REGEX_PREFIX = "re:"
+
+# Size suffixes accepted by parse_size
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3,
+              "T": 1024 ** 4}
+
+
+def parse_size(text):
+    """
+    Read a size in bytes, like "512", "64K", "10M" or "2G".
+
+    Raises ValueError for anything else.
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)B?\s*", str(text),
+                         re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Geçersiz boyut: {text}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2).upper()]
+
+
+class PatternSet:
+    """
+    A list of patterns compiled into as few regular expressions as possible.
+
+    All name globs are joined into one expression and all path globs into
+    another, so an entry is checked with two matches however many globs
+    there are. Regular expressions are compiled one by one: joined, their
+    inline flags and group numbers would no longer hold.
+    """
+
+    def __init__(self, patterns):
+        """Compile the patterns; raises ValueError for a bad one."""
+        self.patterns = list(patterns)
+        names, paths, regexes = [], [], []
+        for pattern in self.patterns:
+            if pattern.startswith(REGEX_PREFIX):
+                try:
+                    regexes.append(
+                        re.compile(pattern[len(REGEX_PREFIX):]).search)
+                except re.error as error:
+                    raise ValueError(f"Geçersiz kural ({pattern}): "
+                                     f"{error}") from None
+            elif "/" in pattern:
+                paths.append(fnmatch.translate(pattern.strip("/")))
+            elif pattern:
+                names.append(fnmatch.translate(pattern))
+
+        self.names = re.compile("|".join(names)).match if names else None
+        self.paths = re.compile("|".join(paths)).match if paths else None
+        self.regexes = regexes
+        self.uses_path = bool(paths or regexes)
+
+    def __bool__(self):
+        """Tell whether there are any patterns."""
+        return bool(self.names or self.uses_path)
+
+    def matches(self, name, path, root):
+        """Tell whether a file or folder matches one of the patterns."""
+        if self.names and self.names(name):
+            return True
+        if not self.uses_path:
+            return False
+        relative = path[len(os.path.join(root, "")):]
+        if os.sep != "/":
+            relative = relative.replace(os.sep, "/")
+        return bool((self.paths and self.paths(relative))
+                    or any(search(relative) for search in self.regexes))
+
+
+class ScanRules:
+    """
+    The include and exclude patterns and size limits of a scan.
+
+    The walk asks skips for every entry it lists, so an excluded folder
+    is never opened: nothing below node_modules is listed at all. With
+    include patterns, only files that match one are listed; folders are
+    always walked, a file below them may match. Hidden files and folders
+    are skipped unless skip_hidden is False. The trash folder that files
+    are deleted to, see dedupe.TRASH_DIR_NAME, is always skipped, so the
+    deleted files are not found again as copies of the ones kept.
+
+    The size limits are applied by the scan engine, which stores the
+    files outside of them as skipped without reading them; max_size None
+    means no limit.
+    """
+
+    def __init__(self, include=(), exclude=(), min_size=0, max_size=None,
+                 skip_hidden=True):
+        """Compile the patterns; raises ValueError for a bad pattern."""
+        self.include = PatternSet(include)
+        self.exclude = PatternSet(exclude)
+        self.min_size = min_size or 0
+        self.max_size = max_size
+        self.skip_hidden = skip_hidden
+        if max_size is not None and max_size < self.min_size:
+            raise ValueError("En büyük boyut en küçük boyuttan küçük olamaz")
+
+    def skips(self, name, path, root, folder=False):
+        """Tell whether the walk leaves out a file, or a whole folder."""
+        if name == TRASH_DIR_NAME or (self.skip_hidden
+                                      and name.startswith(".")):
+            return True
+        if self.exclude and self.exclude.matches(name, path, root):
+            return True
+        return (not folder and bool(self.include)
+                and not self.include.matches(name, path, root))
+
+    def settings(self):
+        """Return the rules as the dict stored in a rules file."""
+        return {"version": RULES_VERSION,
+                "include": list(self.include.patterns),
+                "exclude": list(self.exclude.patterns),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "skip_hidden": self.skip_hidden}
+
+
+def rules_from_settings(settings):
+    """
+    Build ScanRules from the dict of a rules file.
+
+    Raises ValueError for a newer version or bad values.
+    """
+    if settings.get("version", RULES_VERSION) > RULES_VERSION:
+        raise ValueError(f"Desteklenmeyen kural sürümü: "
+                         f"{settings['version']}")
+    max_size = settings.get("max_size")
+    try:
+        return ScanRules(list(settings.get("include", [])),
+                         list(settings.get("exclude", [])),
+                         int(settings.get("min_size") or 0),
+                         None if max_size is None else int(max_size),
+                         bool(settings.get("skip_hidden", True)))
+    except TypeError as error:
+        raise ValueError(f"Geçersiz kural dosyası: {error}") from None
+
+
+def load_rules(path):
+    """
+    Read the rules saved in a JSON file.
+
+    Raises OSError if the file can not be read and ValueError if it does
+    not hold valid rules.
+    """
+    with open(path, encoding="utf-8") as stream:
+        try:
+            settings = json.load(stream)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Geçersiz kural dosyası ({path}): "
+                             f"{error}") from None
+    if not isinstance(settings, dict):
+        raise ValueError(f"Geçersiz kural dosyası: {path}")
+    return rules_from_settings(settings)
+
+
+def save_rules(rules, path):
+    """Write rules to a JSON file; raises OSError if that fails."""
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump(rules.settings(), stream, indent=2, ensure_ascii=False)
+        stream.write("\n")
@@ -0,0 +1,77 @@
+"""Scan Rules Dialog Module."""
+from PyQt6.QtWidgets import (QCheckBox, QDialog, QDialogButtonBox,
+                             QFormLayout, QLineEdit, QMessageBox,
+                             QPlainTextEdit)
+from rules import ScanRules, parse_size, save_rules
+
+
+class RulesDialog(QDialog):
+    """
+    Edits the include and exclude rules and size limits of the scans.
+
+    Patterns are written one per line, see rules.py for their syntax.
+    The rules are saved to a rules file when the dialog is accepted, so
+    the command line can use them with --rules.
+    """
+
+    def __init__(self, rules, path, parent=None):
+        """Show the rules.ScanRules rules, which are saved to path."""
+        super().__init__(parent)
+        self.setWindowTitle("Tarama Kuralları")
+        self.resize(520, 420)
+        self.path = path
+        self.rules = rules
+
+        self.txt_include = QPlainTextEdit(
+            "\n".join(rules.include.patterns))
+        self.txt_include.setPlaceholderText("Boşsa bütün dosyalar, "
+                                            "örnek: *.jpg")
+        self.txt_exclude = QPlainTextEdit(
+            "\n".join(rules.exclude.patterns))
+        self.txt_exclude.setPlaceholderText("Örnek: node_modules, *.tmp, "
+                                            "re:(^|/)build/cache$")
+        self.txt_min_size = QLineEdit(str(rules.min_size))
+        self.txt_max_size = QLineEdit("" if rules.max_size is None
+                                      else str(rules.max_size))
+        self.txt_max_size.setPlaceholderText("Sınırsız, örnek: 2G")
+        self.chk_hidden = QCheckBox("Gizli dosya ve klasörleri atla")
+        self.chk_hidden.setChecked(rules.skip_hidden)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Save
+                                   | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QFormLayout(self)
+        layout.addRow("Dahil et (satır başına bir kural):", self.txt_include)
+        layout.addRow("Hariç tut (satır başına bir kural):",
+                      self.txt_exclude)
+        layout.addRow("En küçük boyut (bayt, K, M, G):", self.txt_min_size)
+        layout.addRow("En büyük boyut (bayt, K, M, G):", self.txt_max_size)
+        layout.addRow(self.chk_hidden)
+        layout.addRow(buttons)
+
+    def edited_rules(self):
+        """Build ScanRules from the fields; raises ValueError if invalid."""
+        def patterns(editor):
+            return [line.strip() for line in
+                    editor.toPlainText().splitlines() if line.strip()]
+
+        max_size = self.txt_max_size.text().strip()
+        return ScanRules(patterns(self.txt_include),
+                         patterns(self.txt_exclude),
+                         parse_size(self.txt_min_size.text() or 0),
+                         parse_size(max_size) if max_size else None,
+                         self.chk_hidden.isChecked())
+
+    def accept(self):
+        """Save the rules and close, or tell what is wrong with them."""
+        try:
+            rules = self.edited_rules()
+            save_rules(rules, self.path)
+        except (OSError, ValueError) as error:
+            QMessageBox.warning(self, "Uyarı",
+                                f"Kurallar kaydedilemedi: {error}")
+            return
+        self.rules = rules
+        super().accept()
@@ -1,8 +1,7 @@
 """File Scanning and Hashing Module."""
-import os
-import hashlib
 from PyQt6.QtCore import QThread, pyqtSignal
-from database import DataBase
+from engine import ScanEngine, progress_text, DEFAULT_SAMPLE_SIZE
+from hasher import POOL_THREAD, DEFAULT_ALGORITHM
 
 
 class Scanner(QThread):
@@ -10,18 +9,40 @@ class Scanner(QThread):
     The Qthread class ensures that the interface works without freezing.
 
     Signals were defined for communication with the GUI.
+    The scan itself is done by engine.ScanEngine on this thread.
     """
 
     progress_signal = pyqtSignal(int)
     status_signal = pyqtSignal(str)
+    stats_signal = pyqtSignal(dict)
     finished_signal = pyqtSignal()
+    updated_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
 
-    def __init__(self, folder_path):
-        """File path is made available to the entire class."""
+    def __init__(self, folder_paths, sample_size=DEFAULT_SAMPLE_SIZE,
+                 workers=None, pool_kind=POOL_THREAD,
+                 algorithm=DEFAULT_ALGORITHM, verify=None,
+                 profile_hook=None, watch=False, resume=False,
+                 rules=None):
+        """
+        File paths are made available to the entire class.
+
+        folder_paths is one folder or a list of folders scanned together.
+        With watch, the thread keeps watching the folders after the scan
+        and sends updated_signal whenever the results changed, until it
+        is stopped. With resume, an unfinished scan of the same folders
+        is continued from its checkpoint. rules, a rules.ScanRules,
+        choose the files that are scanned.
+        """
         super().__init__()
-        self.folder_path = folder_path
-        self.is_running = True
+        self.watch = watch
+        self.engine = ScanEngine(folder_paths, sample_size, workers,
+                                 pool_kind, algorithm, verify,
+                                 on_progress=self.report_progress,
+                                 on_status=self.status_signal.emit,
+                                 profile_hook=profile_hook,
+                                 on_update=self.updated_signal.emit,
+                                 resume=resume, rules=rules)
 
     def run(self):
         """
@@ -29,72 +50,31 @@ class Scanner(QThread):
 
         Will start with start()
         """
-        self.status_signal.emit("Dosyalar listeleniyor...")
-        file_list = []
-
-        for root, dirs, files in os.walk(self.folder_path):
-            for i in range(len(dirs) - 1, -1, -1):
-                if dirs[i].startswith('.'):
-                    del dirs[i]
-
-            for file in files:
-                if file.startswith('.'):
-                    continue
-
-                file_list.append(os.path.join(root, file))
-
-        total_files = len(file_list)
-        if total_files == 0:
-            self.status_signal.emit("Klasör boş!")
-            self.finished_signal.emit()
-            return
-
-        db = DataBase()
-        db.clear()
-
-        processed_count = 0
-        for file_path in file_list:
-            if not self.is_running:
-                break
-
-            file_name = os.path.basename(file_path)
-            self.status_signal.emit(f"Taranıyor: {file_name}")
-
-            try:
-                file_size = os.path.getsize(file_path)
-                file_hash = self.calculate_hash(file_path)
-                db.insertFile(file_path, file_name, file_size, file_hash)
-
-            except Exception as error:
-                print(f"HATA: ({file_name}): {error}")
-
-            processed_count += 1
-            percent = int((processed_count / total_files) * 100)
-            self.progress_signal.emit(percent)
-
-        self.status_signal.emit("Tarama Tamamlandı!")
+        if self.watch:
+            self.engine.watch(self.scan_done)
+        else:
+            self.engine.run()
+            self.scan_done()
+
+    def scan_done(self):
+        """Tell the GUI that the scan is finished."""
+        self.progress_signal.emit(100)
         self.finished_signal.emit()
 
-    def calculate_hash(self, file_path, block_size=65536):
+    def report_progress(self, snapshot):
         """
-        Block-by-block reading to read large files without bloating RAM.
+        Turn a progress snapshot into the GUI signals.
 
-        block_size = 64KB
+        Called by the engine's ProgressReporter at most every 100 ms.
         """
-        sha256 = hashlib.sha256()
-        try:
-            with open(file_path, 'rb') as f:
-                while True:
-                    data = f.read(block_size)
-                    if not data:
-                        break
-                    sha256.update(data)
-            return sha256.hexdigest()
-        except PermissionError:
-            return "ACCESS_DENIED"
-        except Exception:
-            return "ERROR"
+        self.status_signal.emit(progress_text(snapshot))
+        self.progress_signal.emit(snapshot["percent"])
+        self.stats_signal.emit(snapshot)
+
+    def calculate_hash(self, file_path, block_size=None):
+        """Hash the whole file, see hasher.file_hash."""
+        return self.engine.calculate_hash(file_path, block_size)
 
     def stop(self):
         """To stop the thread."""
-        self.is_running = False
+        self.engine.stop()
@@ -0,0 +1,71 @@
+"""Scan Engine Tests."""
+import os
+import shutil
+import tempfile
+import unittest
+from database import DataBase, SKIP_BAD_NAME, stored_path
+from engine import ScanEngine
+
+
+class BadNameTest(unittest.TestCase):
+    """Files whose names are not valid UTF-8 must not stop a scan."""
+
+    def setUp(self):
+        """Make a tree with two copies and two files with bad names."""
+        self.folder = tempfile.mkdtemp()
+        self.root = os.path.join(self.folder, "tree")
+        os.mkdir(self.root)
+        self.db_path = os.path.join(self.folder, "results.db")
+        for name in ("a.bin", "b.bin"):
+            with open(os.path.join(self.root, name), "wb") as stream:
+                stream.write(b"same" * 1000)
+        bad_folder = os.path.join(os.fsencode(self.root), b"\xfe")
+        os.mkdir(bad_folder)
+        for path in (os.path.join(os.fsencode(self.root), b"\xff.bin"),
+                     os.path.join(bad_folder, b"c.bin")):
+            with open(path, "wb") as stream:
+                stream.write(b"same" * 1000)
+
+    def tearDown(self):
+        """Remove the tree."""
+        shutil.rmtree(self.folder)
+
+    def scan(self, **options):
+        """Scan the tree and return the rows by path."""
+        ScanEngine(self.root, db_path=self.db_path, **options).run()
+        db = DataBase(self.db_path)
+        command = db.database().cursor()
+        command.execute("SELECT path, hash, reason FROM TBL_RESULTS")
+        rows = {path: (file_hash, reason)
+                for path, file_hash, reason in command.fetchall()}
+        db.close()
+        return rows
+
+    def check(self, rows):
+        """The copies are found and the bad names are skipped."""
+        first = rows[os.path.join(self.root, "a.bin")]
+        self.assertIsNotNone(first[0])
+        self.assertEqual(rows[os.path.join(self.root, "b.bin")], first)
+        self.assertEqual(rows[os.path.join(self.root, "\\xff.bin")],
+                         (None, SKIP_BAD_NAME))
+        self.assertEqual(rows[os.path.join(self.root, "\\xfe", "c.bin")],
+                         (None, SKIP_BAD_NAME))
+        self.assertEqual(len(rows), 4)
+
+    def test_streamed(self):
+        """A streamed scan stores the bad names as skipped."""
+        self.check(self.scan())
+
+    def test_spilled(self):
+        """A scan with a memory budget does the same."""
+        self.check(self.scan(memory_budget=8 * 1024 * 1024))
+
+    def test_stored_path(self):
+        """Only paths that can not be encoded are escaped."""
+        self.assertEqual(stored_path("/tmp/ä.bin"), "/tmp/ä.bin")
+        self.assertEqual(stored_path(os.fsdecode(b"/tmp/\xff.bin")),
+                         "/tmp/\\xff.bin")
+
+
+if __name__ == "__main__":
+    unittest.main()
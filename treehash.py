@@ -0,0 +1,73 @@
+"""Directory Digest Module."""
+import hashlib
+import os
+
+
+def directory_digests(files):
+    """
+    Compute a digest for every folder from the digests of its files.
+
+    files yields (path, root, hash, size) for every scanned file, sorted
+    by path. A folder digest covers the names and digests of everything
+    below it, so two folders have the same digest exactly when their
+    subtrees hold the same names with the same contents. A folder with a
+    file that has no hash (unique size, unreadable, too small) gets no
+    digest: it can not be shown to equal another folder. Folders are not
+    followed above their scan root.
+
+    Sorted by path, the files below a folder come one after another, so a
+    folder is done once a file outside of it comes. Only the folders from
+    the root down to the current file are kept open, which keeps memory
+    small for any number of files.
+
+    Yields (path, parent, root, name, digest, files, size) for every
+    folder, after the folders below it.
+    """
+    # Open folders, outermost first: [path, root, entries, count, size]
+    open_folders = []
+
+    def close():
+        folder, root, entries, count, size = open_folders.pop()
+        digest = None
+        if all(child_digest for _, _, child_digest in entries):
+            digest = hashlib.sha256()
+            for name, kind, child_digest in sorted(entries):
+                digest.update(f"{name}\0{kind}\0{child_digest}\n"
+                              .encode("utf-8", "surrogateescape"))
+            digest = digest.hexdigest()
+
+        parent = None
+        if folder != root:
+            parent = os.path.dirname(folder)
+            entry = open_folders[-1]
+            entry[2].append((os.path.basename(folder), "d", digest))
+            entry[3] += count
+            entry[4] += size
+        return (folder, parent, root, os.path.basename(folder), digest,
+                count, size)
+
+    for path, root, file_hash, size in files:
+        folder = os.path.dirname(path)
+        while open_folders and not (
+                folder == open_folders[-1][0]
+                or folder.startswith(os.path.join(open_folders[-1][0], ""))):
+            yield close()
+
+        # Open the folders between the innermost open folder and this one
+        top = open_folders[-1][0] if open_folders else None
+        missing = []
+        while folder != top:
+            missing.append(folder)
+            if folder == root or os.path.dirname(folder) == folder:
+                break
+            folder = os.path.dirname(folder)
+        for folder in reversed(missing):
+            open_folders.append([folder, root, [], 0, 0])
+
+        entry = open_folders[-1]
+        entry[2].append((os.path.basename(path), "f", file_hash))
+        entry[3] += 1
+        entry[4] += size or 0
+
+    while open_folders:
+        yield close()
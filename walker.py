@@ -0,0 +1,175 @@
+"""Folder Walking Module."""
+import os
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from dedupe import TRASH_DIR_NAME
+from rules import ScanRules
+
+# Files waiting between the device walkers and the scan
+WALK_QUEUE_SIZE = 10000
+
+# A listed file with the stat fields used as the hash cache key and the
+# scan root it was found under
+FileInfo = namedtuple("FileInfo", "path size dev ino mtime_ns nlink root")
+
+# The folders of a root that are still to be listed, yielded between the
+# files of a checkpointed walk; the files yielded before it are all the
+# files of the folders that are not in the list
+Frontier = namedtuple("Frontier", "root folders")
+
+
+def unique_roots(paths):
+    """
+    Return the absolute roots without the ones inside another root.
+
+    A folder that is also below another root would otherwise be listed
+    twice.
+    """
+    roots = []
+    for path in sorted({os.path.abspath(path) for path in paths}):
+        if not any(path == root or path.startswith(root.rstrip(os.sep)
+                                                   + os.sep)
+                   for root in roots):
+            roots.append(path)
+    return roots
+
+
+def roots_by_device(roots):
+    """
+    Group the roots by the device they are on.
+
+    Returns a list of root lists, in the order of the roots. Roots that
+    can not be stat'ed are put in a group of their own, the walk reports
+    their error.
+    """
+    groups = {}
+    for root in roots:
+        try:
+            device = os.stat(root).st_dev
+        except OSError:
+            device = root
+        groups.setdefault(device, []).append(root)
+    return list(groups.values())
+
+
+def walk_tree(root, is_running=lambda: True, errors=None, folders=None,
+              checkpoint=None, rules=None):
+    """
+    Yield a FileInfo for every file under root.
+
+    Files and folders that rules, a rules.ScanRules, skips are left out;
+    an excluded folder is not listed at all. By default only hidden
+    files and folders are skipped. The stat data is taken from the
+    os.scandir entries, so every file is stat'ed only once. Folders that
+    can not be read are appended to errors and reported on stderr, as
+    stdout may carry the results of the command line.
+
+    folders are the folders still to list when a walk is resumed, by
+    default root itself. With checkpoint, a Frontier is yielded after a
+    folder was listed, at most every checkpoint seconds, and once the
+    walk is complete.
+    """
+    if folders is None:
+        folders = [root]
+    folders = list(folders)
+    if rules is None:
+        rules = ScanRules()
+    # Without patterns only the names are checked, without a call per entry
+    patterns = bool(rules.include or rules.exclude)
+    hidden = "." if rules.skip_hidden else None
+    saved = time.monotonic()
+    while folders and is_running():
+        if checkpoint and time.monotonic() - saved >= checkpoint:
+            yield Frontier(root, list(folders))
+            saved = time.monotonic()
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if not patterns:
+                        if (entry.name == TRASH_DIR_NAME
+                                or hidden and entry.name.startswith(hidden)):
+                            continue
+                    elif rules.skips(entry.name, entry.path, root,
+                                     entry.is_dir(follow_symlinks=False)):
+                        continue
+
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        yield FileInfo(entry.path, st.st_size, st.st_dev,
+                                       st.st_ino, st.st_mtime_ns,
+                                       st.st_nlink, root)
+        except OSError as error:
+            print(f"HATA: ({folder}): {error}", file=sys.stderr)
+            if errors is not None:
+                errors.append((folder, str(error)))
+
+    if checkpoint and not folders:
+        yield Frontier(root, [])
+
+
+def walk_roots(roots, is_running=lambda: True, errors=None, frontiers=None,
+               checkpoint=None, rules=None):
+    """
+    Yield a FileInfo for every file under the roots.
+
+    Roots on the same device are walked one after the other. Roots on
+    different devices are walked at the same time on threads of their
+    own, so a slow disk does not hold up the others; their files are
+    yielded in the order they arrive.
+
+    frontiers maps a root to the folders still to list when a walk is
+    resumed. With checkpoint, the Frontier items of walk_tree are passed
+    on between the files. rules are passed on to walk_tree.
+    """
+    frontiers = frontiers or {}
+
+    def walk(root):
+        return walk_tree(root, is_running, errors, frontiers.get(root),
+                         checkpoint, rules)
+
+    groups = roots_by_device(roots)
+    if len(groups) < 2:
+        for root in roots:
+            yield from walk(root)
+        return
+
+    results = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+
+    def put(item):
+        while is_running():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def walk_device(device_roots):
+        try:
+            for root in device_roots:
+                for info in walk(root):
+                    if not put(info):
+                        return
+        finally:
+            put(None)
+
+    for device_roots in groups:
+        threading.Thread(target=walk_device, args=(device_roots,),
+                         daemon=True).start()
+
+    remaining = len(groups)
+    while remaining and is_running():
+        try:
+            info = results.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if info is None:
+            remaining -= 1
+        else:
+            yield info
@@ -0,0 +1,311 @@
+"""Folder Watching Module."""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections import namedtuple
+from rules import ScanRules
+from walker import walk_roots
+
+# Seconds without new events before the collected changes are passed on
+SETTLE_TIME = 1.0
+
+# Longest time changes are held back while events keep coming
+MAX_DELAY = 10.0
+
+# Seconds between two walks of the polling watcher
+POLL_INTERVAL = 5.0
+
+# inotify event bits, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event without the name that follows it
+EVENT = struct.Struct("iIII")
+
+# Files that changed or were created, files and folders that are gone,
+# and whether events were lost so only a full scan is safe
+Changes = namedtuple("Changes", "changed deleted rescan")
+
+
+def inotify_libc():
+    """
+    Load the C library with the inotify functions.
+
+    Raises OSError where inotify is not available.
+    """
+    name = ctypes.util.find_library("c")
+    if name is None:
+        raise OSError("C kütüphanesi bulunamadı")
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify desteklenmiyor")
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class InotifyWatcher:
+    """
+    Watches folders with Linux inotify.
+
+    Every folder below the roots gets a watch, folders that are created
+    or moved in later get one as they appear. Files and folders the
+    rules skip are left out like in the walk, excluded folders get no
+    watch. When the kernel drops events, a rescan is asked for.
+    """
+
+    def __init__(self, roots, rules=None):
+        """Start watching the roots; raises OSError if that fails."""
+        self.roots = list(roots)
+        self.rules = rules or ScanRules()
+        self.libc = inotify_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.folders = {}
+        try:
+            for root in self.roots:
+                self.add_tree(root, strict=True)
+        except OSError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        """Use the watcher as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop watching."""
+        self.close()
+
+    def close(self):
+        """Close the inotify descriptor, which drops all watches."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, folder):
+        """Watch one folder; raises OSError if the watch can not be added."""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder),
+                                         WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), folder)
+        self.folders[wd] = folder
+
+    def root_of(self, path):
+        """Return the root a watched path is below."""
+        return next((root for root in self.roots
+                     if path == root
+                     or path.startswith(os.path.join(root, ""))), path)
+
+    def add_tree(self, top, strict=False):
+        """
+        Watch top and all folders below it.
+
+        Returns the files found below top, so the files of a folder that
+        was moved in are seen even though no event came for them. With
+        strict, a folder that can not be watched raises OSError (running
+        out of watches, for example); otherwise it is only reported on stderr.
+        """
+        files = []
+        folders = [top]
+        root = self.root_of(top)
+        while folders:
+            folder = folders.pop()
+            try:
+                self.add_watch(folder)
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if self.rules.skips(entry.name, entry.path, root,
+                                            is_dir):
+                            continue
+                        if is_dir:
+                            folders.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.path)
+            except OSError as error:
+                if strict:
+                    raise
+                print(f"HATA: ({folder}): {error}", file=sys.stderr)
+        return files
+
+    def remove_tree(self, top):
+        """Stop watching top and the folders below it."""
+        prefix = os.path.join(top, "")
+        for wd, folder in list(self.folders.items()):
+            if folder == top or folder.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.folders[wd]
+
+    def read_events(self, changed, deleted):
+        """
+        Read the waiting events into the changed and deleted sets.
+
+        Returns True if events were lost.
+        """
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+
+        lost = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                lost = True
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.folders[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if folder in self.roots:
+                    deleted.add(folder)
+                continue
+            path = os.path.join(folder, name)
+            if self.rules.skips(name, path, self.root_of(folder),
+                                bool(mask & IN_ISDIR)):
+                continue
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for file_path in self.add_tree(path):
+                        deleted.discard(file_path)
+                        changed.add(file_path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.remove_tree(path)
+                    prefix = os.path.join(path, "")
+                    changed.difference_update(
+                        [file_path for file_path in changed
+                         if file_path.startswith(prefix)])
+                    deleted.add(path)
+            elif mask & (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO):
+                deleted.discard(path)
+                changed.add(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changed.discard(path)
+                deleted.add(path)
+        return lost
+
+    def changes(self, is_running=lambda: True):
+        """
+        Yield Changes until is_running() returns False.
+
+        Events are collected until none came for SETTLE_TIME seconds, or
+        for at most MAX_DELAY seconds, so a file that is being copied is
+        handled once.
+        """
+        changed, deleted = set(), set()
+        rescan = False
+        first = last = None
+        while is_running():
+            ready, _, _ = select.select([self.fd], [], [], 0.1)
+            now = time.monotonic()
+            if ready:
+                rescan = self.read_events(changed, deleted) or rescan
+                first = first or now
+                last = now
+                if now - first < MAX_DELAY:
+                    continue
+            if not (changed or deleted or rescan):
+                first = None
+                continue
+            if now - last >= SETTLE_TIME or now - first >= MAX_DELAY:
+                yield Changes(changed, deleted, rescan)
+                changed, deleted = set(), set()
+                rescan = False
+                first = None
+
+
+class PollingWatcher:
+    """
+    Watches folders by walking them again every few seconds.
+
+    Used where inotify is not available. Files whose size, modification
+    time or inode changed are reported as changed. The walks follow the
+    rules like the scan.
+    """
+
+    def __init__(self, roots, interval=POLL_INTERVAL, rules=None):
+        """Take the first listing of the roots."""
+        self.roots = list(roots)
+        self.interval = interval
+        self.rules = rules
+        self.files = self.listing()
+
+    def __enter__(self):
+        """Use the watcher as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Nothing to release."""
+
+    def listing(self, is_running=lambda: True):
+        """Return a dict of path -> (size, mtime_ns, dev, ino)."""
+        return {info.path: (info.size, info.mtime_ns, info.dev, info.ino)
+                for info in walk_roots(self.roots, is_running,
+                                       rules=self.rules)}
+
+    def changes(self, is_running=lambda: True):
+        """Yield Changes until is_running() returns False."""
+        while is_running():
+            deadline = time.monotonic() + self.interval
+            while is_running() and time.monotonic() < deadline:
+                time.sleep(0.1)
+
+            files = self.listing(is_running)
+            if not is_running():
+                return
+            changed = {path for path, stat in files.items()
+                       if self.files.get(path) != stat}
+            deleted = self.files.keys() - files.keys()
+            self.files = files
+            if changed or deleted:
+                yield Changes(changed, deleted, False)
+
+
+def open_watcher(roots, interval=POLL_INTERVAL, rules=None):
+    """
+    Return a watcher for the roots.
+
+    inotify is used where it works, otherwise the folders are polled
+    every interval seconds. rules are the rules.ScanRules of the scan.
+    Errors are written to stderr, stdout may carry the results of the
+    command line.
+    """
+    try:
+        return InotifyWatcher(roots, rules)
+    except OSError as error:
+        print(f"HATA: inotify kullanılamıyor ({error}), klasörler "
+              f"{interval:.0f} sn arayla taranacak", file=sys.stderr)
+        return PollingWatcher(roots, interval, rules)